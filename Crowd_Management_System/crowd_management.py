@@ -1,24 +1,65 @@
 import cv2
+import math
 import time
 import os
-from ultralytics import YOLO
-import pygame
+import numpy as np
 
+from common.alert_dispatcher import AlertDispatcher, load_sound
+from common.tiling import TiledDetector
+from common.zones import Zone, ZoneMap
 
-class CrowdManager:
-    def __init__(self):
-        # 1. Improved Audio Init - Specific frequency prevents silent failures
-        pygame.mixer.pre_init(44100, -16, 2, 512)
-        pygame.mixer.init()
 
-        # Ensure the path to the mp3 is correct
-        try:
-            self.alert_sound = pygame.mixer.Sound("alert.mp3")
-        except Exception as e:
-            print(f"[WARN] Could not load alert.mp3: {e}")
-            self.alert_sound = None
+class CrowdManager:
+    def __init__(self, model=None, camera_id=None, gate=None, tracker=None,
+                 detect_every=1, max_detect_every=None, frame_budget_ms=None, alerts=None,
+                 zones=None, draw_overlays=True, audio=True, tiling=None):
+        self.camera_id = camera_id
+
+        # With draw_overlays off the frame is returned untouched and the browser
+        # draws last_overlay instead (sent over the WebRTC data channel)
+        self.draw_overlays = draw_overlays
+        self.last_overlay = None
+
+        # Snapshots and sounds run on the dispatcher's worker threads, not in predict()
+        self.alerts = alerts or AlertDispatcher()
+
+        # Optional MotionGate: on static scenes the last detections are reused
+        self.gate = gate
+        self._last_results = None
+
+        # Optional tracker: YOLO runs every `detect_every` frames and the tracker
+        # carries boxes and IDs in between. With max_detect_every and a frame
+        # budget, N adapts to how long the detector actually takes.
+        self.tracker = tracker
+        self.detect_every = max(1, int(detect_every))
+        self.min_detect_every = self.detect_every
+        self.max_detect_every = max_detect_every
+        self.frame_budget_ms = frame_budget_ms
+        self.frame_index = 0
+        self.detector_ms = 0.0
+
+        # Quality knobs (set by the LoadController): detector input size and a
+        # floor on detect_every; without a tracker in-between frames reuse the last results
+        self.infer_kwargs = {}
+        self._base_detect_every = self.detect_every
 
-        self.model = YOLO("yolov8n.pt")
+        # 1. Improved Audio Init - Specific frequency prevents silent failures
+        # (audio=False skips the mixer entirely, e.g. for offline batch runs)
+        self.alert_sound = (load_sound("alert.mp3", frequency=44100, size=-16, channels=2, buffer=512)
+                            if audio else None)
+
+        # Pass a shared instance to reuse weights across cameras
+        if model is None:
+            from ultralytics import YOLO
+
+            model = YOLO("yolov8n.pt")
+        self.model = model
+
+        # Optional sliced inference for distant people: "tiling" is true or
+        # {"tile_size", "overlap", "full_frame", "max_age"}; tiles cover the zones/ROI
+        self.tiler = None
+        if tiling:
+            self.tiler = TiledDetector(self.model, **(tiling if isinstance(tiling, dict) else {}))
         self.CONFIRMATION_THRESHOLD = 0.4
         self.CROWD_THRESHOLD = 1
         self.COOLDOWN_SECONDS = 5  # Reduced for easier testing
@@ -31,67 +72,182 @@ class CrowdManager:
         self.alert_dir = os.path.join(self.base_dir, "crowd_alerts")
         os.makedirs(self.alert_dir, exist_ok=True)
 
-        self.roi = None
-
-    def update_roi(self, data):
-        self.roi = (int(data['x1']), int(data['y1']), int(data['x2']), int(data['y2']))
+        # Named polygon zones, each with its own threshold (defaults to CROWD_THRESHOLD).
+        # Without zones the whole frame is counted.
+        self.zones = ZoneMap(zones)
+        self.zone_counts = {}
 
-    def predict(self, frame):
-        results = self.model(frame, stream=True)
-        annotated_frame = frame.copy()
-        person_count = 0
-
-        if self.roi:
-            x1, y1, x2, y2 = self.roi
-            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), (255, 255, 0), 2)
+        # Vertical position of the status header (lets a combined view stack banners)
+        self.header_top = 0
 
+    def update_roi(self, data):
+        # Single rectangle from the ROI selector, kept as a zone named "roi"
+        self.zones.set([Zone.rectangle("roi", int(data['x1']), int(data['y1']), int(data['x2']), int(data['y2']))])
+
+    def set_zones(self, zones):
+        """zones: [{"name": "entrance", "points": [[x, y], ...], "threshold": 5}, ...]"""
+        self.zones.set(zones)
+
+    def set_quality(self, imgsz=None, detect_every=1):
+        self.infer_kwargs = {"imgsz": imgsz} if imgsz else {}
+        self.min_detect_every = max(self._base_detect_every, int(detect_every))
+        self.detect_every = max(self.detect_every, self.min_detect_every)
+        if self.max_detect_every:
+            self.max_detect_every = max(self.max_detect_every, self.min_detect_every)
+        if not (self.tracker is not None and self.max_detect_every and self.frame_budget_ms):
+            self.detect_every = self.min_detect_every
+
+    def _detect(self, frame):
+        started = time.time()
+        if self._last_results is not None and self.tracker is None and self.frame_index % self.detect_every != 0:
+            return self._last_results
+        if self.gate is None or self._last_results is None or self.gate.should_infer(frame):
+            self._last_results = self.detect_persons(frame)
+        self._adapt_interval((time.time() - started) * 1000)
+        return self._last_results
+
+    def detect_persons(self, frame, **kwargs):
+        # One detector pass; with tiling only the zones' bounding box is sliced
+        kwargs = dict(self.infer_kwargs, **kwargs)
+        if self.tiler is not None:
+            return self.tiler(frame, region=self.zones.bounds(), **kwargs)
+        return list(self.model(frame, stream=True, **kwargs))
+
+    def _adapt_interval(self, elapsed_ms):
+        # Smoothed detector cost decides how many frames the tracker bridges
+        self.detector_ms = 0.8 * self.detector_ms + 0.2 * elapsed_ms if self.detector_ms else elapsed_ms
+        if self.tracker is not None and self.max_detect_every and self.frame_budget_ms:
+            wanted = math.ceil(self.detector_ms / self.frame_budget_ms)
+            self.detect_every = min(self.max_detect_every, max(self.min_detect_every, wanted))
+
+    def _person_boxes(self, results):
+        # Filter the whole boxes tensor at once instead of walking it box by box
+        kept = []
         for r in results:
-            for box in r.boxes:
-                conf = float(box.conf[0])
-                if conf > self.CONFIRMATION_THRESHOLD:
-                    label = self.model.names[int(box.cls[0])]
-                    if label == "person":
-                        coords = box.xyxy[0].tolist()
-                        bx1, by1, bx2, by2 = map(int, coords)
-                        cx, cy = (bx1 + bx2) // 2, (by1 + by2) // 2
-
-                        if self.roi:
-                            rx1, ry1, rx2, ry2 = self.roi
-                            if rx1 <= cx <= rx2 and ry1 <= cy <= ry2:
-                                person_count += 1
-                                cv2.rectangle(annotated_frame, (bx1, by1), (bx2, by2), (0, 255, 0), 2)
-                        else:
-                            person_count += 1
-
-        # Logic: Violation if count is GREATER than threshold
-        violation_detected = person_count > self.CROWD_THRESHOLD
-
-        # Visuals
-        status_color = (0, 0, 255) if violation_detected else (0, 255, 0)
-        overlay = annotated_frame.copy()
-        cv2.rectangle(overlay, (0, 0), (frame.shape[1], 60), status_color, -1)
-        cv2.addWeighted(overlay, 0.6, annotated_frame, 0.4, 0, annotated_frame)
-        cv2.putText(annotated_frame, f"ZONE COUNT: {person_count}", (20, 40),
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+            if r.boxes is None or len(r.boxes) == 0:
+                continue
+            person_ids = [i for i, name in r.names.items() if name == "person"]
+            conf = r.boxes.conf.cpu().numpy()
+            cls = r.boxes.cls.cpu().numpy()
+            keep = (conf > self.CONFIRMATION_THRESHOLD) & np.isin(cls, person_ids)
+            kept.append(r.boxes.xyxy.cpu().numpy()[keep])
+        if not kept:
+            return np.zeros((0, 4), dtype=np.int32)
+        return np.concatenate(kept).astype(np.int32)
+
+    def predict(self, frame, results=None, annotated_frame=None):
+        # results: person detections already computed by a shared detector pass
+        # annotated_frame: draw on top of another pipeline's overlays
+        self.frame_index += 1
+        tracks = None
+        if self.tracker is not None and results is None and self._last_results is not None \
+                and self.frame_index % self.detect_every != 0:
+            # In-between frame: propagate the tracked boxes, no detector call
+            tracks = self.tracker.predict()
+        else:
+            if results is None:
+                results = self._detect(frame)
+            boxes = self._person_boxes(results)
+            if self.tracker is not None:
+                tracks = self.tracker.update(boxes)
+
+        # Boxes as one (N, 4) array; IDs only exist when tracking is enabled
+        if tracks is not None:
+            boxes = np.array([t.box for t in tracks], dtype=np.int32).reshape(-1, 4)
+            track_ids = [t.id for t in tracks]
+        else:
+            track_ids = [None] * len(boxes)
+
+        # One lookup of every centroid in the zone mask gives all per-zone counts.
+        # The whole frame uses one zones snapshot, even if /set_zones swaps it meanwhile
+        zones = self.zones.snapshot()
+        centroids = (boxes[:, :2] + boxes[:, 2:]) // 2
+        inside = self.zones.membership(centroids, frame.shape, zones)
+        counts = inside.sum(axis=1)
+        self.zone_counts = {z.name: int(c) for z, c in zip(zones.zones, counts)}
+
+        if zones.zones:
+            # Only people inside a zone are counted and drawn
+            in_any = inside.any(axis=0)
+            shown = np.flatnonzero(in_any)
+            person_count = int(in_any.sum())
+            over = [
+                bool(c > (z.threshold if z.threshold is not None else self.CROWD_THRESHOLD))
+                for z, c in zip(zones.zones, counts)
+            ]
+            violation_detected = any(over)
+        else:
+            # No zones: the whole frame counts and every person (and track) is drawn
+            shown = range(len(boxes))
+            person_count = len(boxes)
+            over = []
+            # Logic: Violation if count is GREATER than threshold
+            violation_detected = person_count > self.CROWD_THRESHOLD
+
+        self.last_overlay = {
+            "stage": "crowd",
+            "count": person_count,
+            "violation": violation_detected,
+            "top": self.header_top,
+            "boxes": [[*map(int, boxes[i]), track_ids[i]] for i in shown],
+            "zones": [
+                {"name": z.name, "points": z.points.tolist(), "count": int(c), "over": o}
+                for z, c, o in zip(zones.zones, counts, over)
+            ],
+        }
+
+        if self.draw_overlays:
+            if annotated_frame is None:
+                annotated_frame = frame.copy()
+            self._draw(annotated_frame, self.last_overlay)
+        elif annotated_frame is None:
+            annotated_frame = frame
 
         # 4. FIXED ACTION LOGIC
         if violation_detected:
             now = time.time()
             if now - self.last_alert_time > self.COOLDOWN_SECONDS:
                 # Trigger Sound
-                if self.alert_sound:
-                    self.alert_sound.play()
+                self.alerts.play(self.alert_sound)
 
-                # Trigger Save with Absolute Path
+                # Trigger Save with Absolute Path (written on the dispatcher thread;
+                # copy because later pipeline stages may keep drawing on this frame).
+                # Snapshots always carry the overlays, even when viewers draw their own.
                 ts = time.strftime("%Y%m%d-%H%M%S")
-                save_path = os.path.join(self.alert_dir, f"crowd_violation_{ts}.jpg")
-
-                success = cv2.imwrite(save_path, annotated_frame)
-                if success:
-                    print(f"[ALERT] Screenshot saved to: {save_path}")
+                prefix = f"crowd_violation_{self.camera_id}" if self.camera_id else "crowd_violation"
+                save_path = os.path.join(self.alert_dir, f"{prefix}_{ts}.jpg")
+                if self.draw_overlays:
+                    snapshot = annotated_frame.copy()
                 else:
-                    print(f"[ERROR] Could not save screenshot to {save_path}")
+                    snapshot = self._draw(frame.copy(), self.last_overlay)
+                event = {"camera_id": self.camera_id, "type": "crowd", "count": person_count,
+                         "boxes": self.last_overlay["boxes"], "details": {"zones": self.zone_counts}}
+                self.alerts.snapshot(save_path, snapshot, event=event)
 
                 self.last_alert_time = now
 
-        return annotated_frame, violation_detected
\ No newline at end of file
+        return annotated_frame, violation_detected
+
+    def _draw(self, img, overlay):
+        for zone in overlay["zones"]:
+            color = (0, 0, 255) if zone["over"] else (255, 255, 0)
+            points = np.array(zone["points"], dtype=np.int32)
+            cv2.polylines(img, [points], True, color, 2)
+            x, y = zone["points"][0]
+            cv2.putText(img, f"{zone['name']}: {zone['count']}", (x + 5, y + 20),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+        for bx1, by1, bx2, by2, track_id in overlay["boxes"]:
+            cv2.rectangle(img, (bx1, by1), (bx2, by2), (0, 255, 0), 2)
+            if track_id is not None:
+                cv2.putText(img, f"#{track_id}", (bx1, max(by1 - 5, 0)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+
+        # Status header: only the 60 px band is blended, not the whole frame
+        status_color = (0, 0, 255) if overlay["violation"] else (0, 255, 0)
+        top = overlay["top"]
+        band = img[top:top + 60]
+        cv2.addWeighted(np.full_like(band, status_color), 0.6, band, 0.4, 0, band)
+        cv2.putText(img, f"ZONE COUNT: {overlay['count']}", (20, top + 40),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        return img
@@ -1,11 +1,32 @@
 import os
+import sys
 import asyncio
-from fastapi import FastAPI, Request, Body
-from fastapi.responses import HTMLResponse, FileResponse
+import functools
+from fastapi import FastAPI, Request, Body, HTTPException
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, Response, StreamingResponse
 from aiortc import RTCPeerConnection, RTCSessionDescription
 
+# The shared modules (common/) live at the repo root, next to the apps
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
 # Importing the Crowd Management modules we just created
-from common.crowd_camera_source import CameraSource
+from common.camera_source import CameraSource
+from common.broadcaster import FrameBroadcaster
+from common.shared_encoder import EncodedVideoTrack, make_encoders, prefer_h264
+from common.http_stream import BOUNDARY, get_mjpeg, get_hls
+from common.alert_dispatcher import AlertDispatcher, with_alerts
+from common.event_store import EventStore, parse_time
+from common import metrics
+from common.camera_registry import CameraRegistry, CameraStream, DuplicateCameraError
+from common.load_controller import LoadController
+from common.startup import Startup
+from common.model_cache import get_model, loaded_models, with_models
+from common.motion_gate import MotionGate
+from common.motion_engine import build_engine
+from common.tracker import IoUTracker
+from common.inference_scheduler import get_batched_model, scheduler_stats
 from crowd_management import CrowdManager
 from webrtc.crowd_track import CrowdVideoTrack
 
@@ -15,45 +36,308 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 # Global store for PeerConnections
 pcs = set()
 
-# Initialize Camera and Crowd Manager globally
-# Replace with your actual RTSP URL or set to None for webcam
-camera = CameraSource(rtsp_url=None)
-crowd_manager = CrowdManager()
+# Every snapshot and clip is indexed in SQLite for the /events queries.
+# EVENTS_MAX_AGE_DAYS / EVENTS_MAX_GB bound how much history (and disk) is kept.
+EVENTS_DB = os.environ.get("EVENTS_DB", os.path.join(BASE_DIR, "events.db"))
+events = EventStore(
+    EVENTS_DB,
+    max_age_days=float(os.environ["EVENTS_MAX_AGE_DAYS"]) if os.environ.get("EVENTS_MAX_AGE_DAYS") else None,
+    max_bytes=int(float(os.environ["EVENTS_MAX_GB"]) * 2**30) if os.environ.get("EVENTS_MAX_GB") else None,
+)
+
+# Snapshot writes and alert sounds for every camera run on the dispatcher's worker
+alerts = AlertDispatcher(events=events)
+
+# Cameras come from CAMERAS_CONFIG (JSON/YAML) or the /cameras REST API.
+# Without a config file a single webcam camera ("default") is registered.
+CAMERAS_CONFIG = os.environ.get("CAMERAS_CONFIG", os.path.join(BASE_DIR, "cameras.json"))
+
+# Cross-camera batching: BATCH_MAX_SIZE > 1 routes every camera on a model
+# through one scheduler that runs a single forward pass per batch
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "1"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "10"))
+
+def load_model(path):
+    if BATCH_MAX_SIZE > 1:
+        return get_batched_model(path, max_batch=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+    return get_model(path)
+
+def make_gate(config):
+    # Skip the detector on static scenes unless "motion_gate": false.
+    # "motion": {"method": "mog2", "min_area": 0.005, ...} swaps in a background-model engine.
+    if not config.get("motion_gate", True):
+        return None
+    return MotionGate(force_interval=config.get("gate_force_interval", 2.0), engine=build_engine(config.get("motion")))
+
+def tracking_options(config):
+    """
+    Optional "tracking": {"detect_every": 2, "max_detect_every": 6, "frame_budget_ms": 33}
+    runs YOLO every N frames and lets the tracker fill the gaps with stable IDs.
+    """
+    tracking = config.get("tracking")
+    if not tracking:
+        return {}
+    return {
+        "tracker": IoUTracker(
+            iou_threshold=tracking.get("iou_threshold", 0.3),
+            max_age=tracking.get("max_age", 1.5),
+        ),
+        "detect_every": tracking.get("detect_every", 1),
+        "max_detect_every": tracking.get("max_detect_every"),
+        "frame_budget_ms": tracking.get("frame_budget_ms"),
+    }
+
+def build_stream(camera_id, config):
+    # Every camera using the same weights shares one loaded model
+    model = load_model(config.get("model", "yolov8n.pt"))
+    gate = make_gate(config)
+    # "overlays": "client" streams the raw frame and lets the browser draw the
+    # detections sent over the data channel
+    draw_overlays = config.get("overlays", "server") != "client"
+    crowd_manager = CrowdManager(
+        model=model, camera_id=camera_id, gate=gate, alerts=alerts,
+        zones=config.get("zones"), draw_overlays=draw_overlays, tiling=config.get("tiling"),
+        **tracking_options(config)
+    )
+
+    # Opened once the models are loaded, so a bad weights path fails before a reader thread starts
+    camera = CameraSource(
+        rtsp_url=config.get("rtsp_url"),
+        webcam_index=config.get("webcam_index", 0),
+        camera_id=camera_id,
+    )
+
+    # One capture + inference loop shared by every connected viewer.
+    # Inference runs in a thread (default) or process pool, never on the event loop.
+    # Process workers index their snapshots in EVENTS_DB through their own event store.
+    broadcaster = FrameBroadcaster(
+        camera, crowd_manager, camera_id=camera_id,
+        executor=os.environ.get("INFERENCE_EXECUTOR", "thread"),
+        workers=int(os.environ.get("INFERENCE_WORKERS", "1")),
+        predictor_factory=functools.partial(
+            with_alerts,
+            functools.partial(with_models, CrowdManager, {"model": (config.get("model", "yolov8n.pt"), None)}),
+            EVENTS_DB,
+            camera_id=camera_id, gate=make_gate(config),
+            zones=config.get("zones"), draw_overlays=draw_overlays, tiling=config.get("tiling"),
+            **tracking_options(config)
+        ),
+    )
+
+    # Optional "shared_encoding": encode once per quality level and send the same packets to every viewer
+    encoders = make_encoders(broadcaster, config.get("shared_encoding"))
+    return CameraStream(camera_id, config, camera, crowd_manager, broadcaster, encoders)
+
+registry = CameraRegistry(build_stream)
+
+# Cameras and their models are built in parallel (STARTUP_WORKERS threads)
+STARTUP_WORKERS = int(os.environ.get("STARTUP_WORKERS", "4"))
+
+def load_cameras():
+    if os.path.exists(CAMERAS_CONFIG):
+        return registry.load_file(CAMERAS_CONFIG, workers=STARTUP_WORKERS)
+    registry.add("default", {"rtsp_url": None})
+
+# Nothing heavy runs at import: cameras and models load once the server is up,
+# followed by a warm-up inference (WARMUP=0 skips it). /readyz reports progress.
+startup = Startup(load_cameras, warmup=os.environ.get("WARMUP", "1") != "0")
+
+# Cameras with "adaptive" set trade imgsz/detection rate/fps for latency under load
+controller = LoadController(registry.list)
+
+def get_stream(camera_id):
+    try:
+        return registry.get(camera_id)
+    except KeyError as e:
+        if not startup.ready:
+            raise HTTPException(status_code=503, detail="Cameras are still loading, retry shortly")
+        raise HTTPException(status_code=404, detail=str(e))
 
 @app.post("/set_roi")
 async def set_roi(data: dict = Body(...)):
     """
-    Expects JSON: {"x1": 100, "y1": 100, "x2": 400, "y2": 400}
+    Expects JSON: {"x1": 100, "y1": 100, "x2": 400, "y2": 400, "camera_id": "gate-1"}
     Values should be scaled to the video frame size.
     """
-    crowd_manager.update_roi(data)
+    stream = get_stream(data.get("camera_id"))
+    stream.predictor.update_roi(data)
     return {"status": "ROI Updated", "roi": data}
 
+@app.post("/set_zones")
+async def set_zones(data: dict = Body(...)):
+    """
+    Expects JSON: {"camera_id": "gate-1", "zones": [{"name": "entrance",
+    "points": [[0, 0], [400, 0], [400, 300], [0, 300]], "threshold": 5}]}
+    Points are in video frame pixels; threshold defaults to the crowd threshold.
+    """
+    stream = get_stream(data.get("camera_id"))
+    try:
+        stream.predictor.set_zones(data.get("zones", []))
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid zones: {e}")
+    return {"status": "Zones Updated", "zones": stream.predictor.zones.to_list()}
+
 @app.get("/", response_class=HTMLResponse)
 async def index():
     # Serve the crowd monitoring dashboard
     index_path = os.path.join(BASE_DIR, "client", "index.html")
     return FileResponse(index_path)
 
+@app.get("/camera_stats")
+async def camera_stats():
+    # Reader health per camera: fps, dropped frames, reconnects, frame age
+    return {s.camera_id: s.camera.stats() for s in registry.list()}
+
+@app.get("/scheduler_stats")
+async def get_scheduler_stats():
+    # Aggregate frames/sec, batch size and added latency per batched model
+    return scheduler_stats()
+
+@app.get("/alert_stats")
+async def get_alert_stats():
+    # Queued/dropped side-effect jobs and coalesced socket alerts
+    return alerts.stats()
+
+@app.get("/events")
+def list_events(camera_id: str = None, type: str = None, since: str = None, until: str = None,
+                limit: int = 50, cursor: str = None):
+    # e.g. /events?camera_id=gate&type=crowd&since=2024-05-14T08:00 ; pass "next" back as cursor
+    try:
+        return events.query(camera_id, type, parse_time(since), parse_time(until), limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/events/summary")
+def events_summary(since: str = None, until: str = None):
+    try:
+        return events.summary(parse_time(since), parse_time(until))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/events/{event_id}/thumbnail")
+def event_thumbnail(event_id: int):
+    path = events.thumbnail(event_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No thumbnail for this event")
+    return FileResponse(path, media_type="image/jpeg")
+
+@app.get("/metrics")
+async def get_metrics():
+    # Prometheus scrape target: stage latency histograms plus queue/peer/alert gauges
+    body = metrics.render_metrics(registry.list(), pcs=pcs, alerts=alerts)
+    return Response(body, media_type=metrics.CONTENT_TYPE)
+
+@app.get("/healthz")
+async def healthz():
+    # Liveness: the process and its event loop answer (models may still be loading)
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    # Readiness: cameras built and models warmed up; 503 until then, with the startup timings
+    return JSONResponse(startup.stats(), status_code=200 if startup.ready else 503)
+
+@app.get("/cameras")
+async def list_cameras():
+    return {"cameras": [s.info() for s in registry.list()], "models": loaded_models()}
+
+@app.post("/cameras")
+async def add_camera(data: dict = Body(...)):
+    """
+    Expects JSON: {"id": "gate-1", "rtsp_url": "rtsp://...", "webcam_index": 0, "model": "yolov8n.pt"}
+    """
+    config = dict(data)
+    camera_id = config.pop("id", None)
+    if not camera_id:
+        raise HTTPException(status_code=400, detail="Missing camera id")
+    try:
+        # Building the stream loads model weights: keep it off the event loop
+        stream = await asyncio.get_event_loop().run_in_executor(None, registry.add, camera_id, config)
+    except DuplicateCameraError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not build camera '{camera_id}': {e}")
+    return {"status": "Camera added", "camera": stream.info()}
+
+@app.delete("/cameras/{camera_id}")
+async def remove_camera(camera_id: str):
+    try:
+        stream = registry.remove(camera_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    # Hang up the viewers of this camera, then stop its threads off the loop
+    await asyncio.gather(*[pc.close() for pc in stream.peers])
+    await asyncio.get_event_loop().run_in_executor(None, stream.close)
+    metrics.forget_camera(camera_id)
+    return {"status": "Camera removed", "id": camera_id}
+
+@app.get("/cameras/{camera_id}/mjpeg")
+async def mjpeg(camera_id: str, fps: float = 5.0):
+    """
+    Multipart MJPEG for passive dashboards (<img src="/cameras/gate-1/mjpeg?fps=5">).
+    Each frame is JPEG-encoded once and shared; fps caps this client only.
+    """
+    if not 0 < fps <= 30:
+        raise HTTPException(status_code=400, detail="fps must be between 0 and 30")
+    stream = get_stream(camera_id)
+    return StreamingResponse(
+        get_mjpeg(stream).stream(fps),
+        media_type=f"multipart/x-mixed-replace; boundary={BOUNDARY}",
+    )
+
+@app.get("/cameras/{camera_id}/hls/index.m3u8")
+async def hls_playlist(camera_id: str):
+    # Rolling HLS built from the shared H.264 encoder; starts on first request
+    playlist = await get_hls(get_stream(camera_id)).playlist()
+    if playlist is None:
+        raise HTTPException(status_code=503, detail="HLS stream is starting, retry shortly")
+    return Response(playlist, media_type="application/vnd.apple.mpegurl")
+
+@app.get("/cameras/{camera_id}/hls/segment_{sequence}.ts")
+async def hls_segment(camera_id: str, sequence: int):
+    data = get_hls(get_stream(camera_id)).segment(sequence)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Segment expired")
+    return Response(data, media_type="video/mp2t")
+
 @app.post("/offer")
 async def offer(params: dict = Body(...)):
     offer = RTCSessionDescription(sdp=params["sdp"], type=params["type"])
+    stream = get_stream(params.get("camera_id"))
 
     pc = RTCPeerConnection()
     pcs.add(pc)
+    stream.peers.add(pc)
+
+    # Every viewer of a camera subscribes to its broadcaster, so YOLO runs once per frame
+    if stream.encoders:
+        # Shared encoding: pick a quality level ("quality" in the offer), default to the first
+        encoder = stream.encoders.get(params.get("quality")) or next(iter(stream.encoders.values()))
+        track = EncodedVideoTrack(encoder)
+    else:
+        track = CrowdVideoTrack(stream.broadcaster)
+
+    @pc.on("datachannel")
+    def on_datachannel(channel):
+        # Viewers that draw their own overlays open an "overlays" channel for the detections
+        if channel.label == "overlays":
+            track.channel = channel
 
     @pc.on("connectionstatechange")
     async def on_connectionstatechange():
         print(f"WebRTC State: {pc.connectionState}")
         if pc.connectionState in ["failed", "closed"]:
+            track.stop()
             await pc.close()
             pcs.discard(pc)
+            stream.peers.discard(pc)
 
     # Add the Crowd Management processed track to the WebRTC connection
     # This now streams frames with person counts and density alerts
-    pc.addTrack(
-        CrowdVideoTrack(camera, crowd_manager)
-    )
+    pc.addTrack(track)
+    if stream.encoders:
+        prefer_h264(pc, track)
 
     # Standard WebRTC Handshake
     await pc.setRemoteDescription(offer)
@@ -65,13 +349,21 @@ async def offer(params: dict = Body(...)):
         "type": pc.localDescription.type
     }
 
+@app.on_event("startup")
+async def on_startup():
+    startup.start()
+    # Started with the server, not at import, like the cameras
+    controller.start()
+
 @app.on_event("shutdown")
 async def on_shutdown():
     # Gracefully close all active crowd monitoring streams
     coros = [pc.close() for pc in pcs]
     await asyncio.gather(*coros)
     pcs.clear()
-    camera.release()
+    controller.stop()
+    registry.shutdown()
+    events.close()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import numpy as np
+
+# The app directory and the repo root (shared common/ package)
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [APP_DIR, os.path.dirname(APP_DIR)]
+
+from crowd_management import CrowdManager  # noqa: E402
+from common.onnx_engine import Results  # noqa: E402
+from common.tracker import IoUTracker  # noqa: E402
+
+
+class _Alerts:
+    def play(self, sound):
+        pass
+
+    def snapshot(self, path, frame, on_saved=None, event=None):
+        pass
+
+
+def _people(*boxes):
+    data = np.array([[*box, 0.9, 0] for box in boxes], dtype=np.float32).reshape(-1, 6)
+    return [Results((240, 320), {0: "person"}, data)]
+
+
+def _manager(zones=None):
+    manager = CrowdManager(model=object(), tracker=IoUTracker(min_hits=1), alerts=_Alerts(), zones=zones,
+                           draw_overlays=False, audio=False)
+    manager.CROWD_THRESHOLD = 10
+    return manager
+
+
+def test_without_zones_every_track_is_shown():
+    manager = _manager()
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    for _ in range(3):
+        manager.predict(frame, results=_people((10, 10, 50, 90), (200, 100, 240, 200)))
+
+    overlay = manager.last_overlay
+    assert overlay["count"] == 2
+    assert [box[:4] for box in overlay["boxes"]] == [[10, 10, 50, 90], [200, 100, 240, 200]]
+    assert all(box[4] is not None for box in overlay["boxes"])
+
+
+def test_with_zones_only_people_inside_are_shown():
+    zones = [{"name": "door", "points": [[0, 0], [100, 0], [100, 120], [0, 120]]}]
+    manager = _manager(zones)
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    manager.predict(frame, results=_people((10, 10, 50, 90), (200, 100, 240, 200)))
+
+    overlay = manager.last_overlay
+    assert overlay["count"] == 1
+    assert [box[:4] for box in overlay["boxes"]] == [[10, 10, 50, 90]]
+    assert overlay["zones"][0]["count"] == 1
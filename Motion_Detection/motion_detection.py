@@ -1,102 +1,139 @@
 import cv2
 import time
 import os
-import pygame
 import numpy as np
-from ultralytics import YOLO
+
+from common.motion_gate import MotionGate
+from common.clip_recorder import ClipRecorder
+from common.alert_dispatcher import AlertDispatcher, load_sound
 
 
 class MotionPredictor:
-    def __init__(self):
-        pygame.mixer.init()
-        try:
-            self.alert_sound = pygame.mixer.Sound("alert.mp3")
-        except:
-            self.alert_sound = None
-
-        # Initialize YOLOv8
-        self.model = YOLO("yolov8n.pt")
-
-        # Motion Settings (Working absdiff logic)
-        self.prev_gray = None
-        self.THRESHOLD = 40
-        self.MIN_MOTION_COUNT = 5500
-
-        # Recording Settings (Working MJPG logic)
+    def __init__(self, model=None, camera_id=None, gate=None, recorder=None, alerts=None,
+                 draw_overlays=True, audio=True):
+        self.camera_id = camera_id
+
+        # With draw_overlays off the frame is returned untouched and the browser
+        # draws last_overlay instead (sent over the WebRTC data channel).
+        # Clips are then recorded without annotations.
+        self.draw_overlays = draw_overlays
+        self.last_overlay = None
+
+        # The alert sound plays on the dispatcher's worker thread, not in predict()
+        self.alerts = alerts or AlertDispatcher()
+
+        # audio=False skips the mixer entirely, e.g. for offline batch runs
+        self.alert_sound = load_sound("alert.mp3") if audio else None
+
+        # Initialize YOLOv8 (pass a shared instance to reuse weights across cameras)
+        if model is None:
+            from ultralytics import YOLO
+
+            model = YOLO("yolov8n.pt")
+        self.model = model
+
+        # Motion Settings (Working absdiff logic, shared with the other pipelines)
+        self.gate = gate or MotionGate(threshold=40, min_motion_count=5500, force_interval=None)
+
+        # Recording Settings
         self.COOLDOWN_SECONDS = 3
         self.fps = 20.0
-        self.fourcc = cv2.VideoWriter_fourcc(*'MJPG')
 
         # Target folder as requested
         self.output_dir = "motion_alert"
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
-        self.video_writer = None
+        # Clips are encoded on a background thread with a few seconds of pre-roll
+        self.recorder = recorder or ClipRecorder(self.output_dir, fps=self.fps)
         self.last_detection_time = 0
         self.is_recording = False
 
-    def predict(self, frame):
-        current_time = time.time()
-        annotated_frame = frame.copy()
+        # Quality knobs (set by the LoadController): detector input size and
+        # how often the detector may run
+        self.infer_kwargs = {}
+        self.detect_every = 1
+        self.frame_index = 0
 
-        # A. Detect Motion
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        if self.prev_gray is None:
-            self.prev_gray = gray
-            return annotated_frame, False
+    def set_quality(self, imgsz=None, detect_every=1):
+        self.infer_kwargs = {"imgsz": imgsz} if imgsz else {}
+        self.detect_every = max(1, int(detect_every))
 
-        diff = cv2.absdiff(self.prev_gray, gray)
-        _, thresh = cv2.threshold(diff, self.THRESHOLD, 255, cv2.THRESH_BINARY)
-        motion_count = cv2.countNonZero(thresh)
-        self.prev_gray = gray
+    def predict(self, frame, detect=None, annotated_frame=None):
+        # detect: optional callable returning shared person detections for this frame
+        # annotated_frame: draw on top of another pipeline's overlays
+        current_time = time.time()
+        if annotated_frame is None:
+            annotated_frame = frame.copy() if self.draw_overlays else frame
+        boxes = []
 
-        motion_detected = motion_count > self.MIN_MOTION_COUNT
+        # A. Detect Motion (YOLO only runs on motion or while recording)
+        run_detector = self.gate.should_infer(frame, keep_alive=self.is_recording)
+        motion_detected = self.gate.motion_detected
+        self.frame_index += 1
+        if self.frame_index % self.detect_every != 0:
+            run_detector = False
 
         # B. Conditional YOLO Detection (Detect Person + Motion)
-        if motion_detected or self.is_recording:
-            results = self.model(frame, conf=0.5, verbose=False)
-
-            # Person class index is 0 in YOLOv8
-            person_found = any(int(box.cls[0]) == 0 for r in results for box in r.boxes)
+        if run_detector:
+            if detect is None:
+                results = self.model(frame, conf=0.5, verbose=False, **self.infer_kwargs)
+            else:
+                results = detect(frame)
+
+            # Person class index is 0 in YOLOv8 (shared detections may use a lower conf)
+            person_found = any(
+                int(box.cls[0]) == 0 and float(box.conf[0]) >= 0.5
+                for r in results for box in r.boxes
+            )
 
             # Start Recording if both Person is detected AND Motion is present
             if person_found and motion_detected:
                 self.last_detection_time = current_time
-                annotated_frame = results[0].plot()
+                r = results[0]
+                if self.draw_overlays:
+                    annotated_frame = r.plot(img=annotated_frame)
+                elif len(r.boxes):
+                    xyxy = r.boxes.xyxy.cpu().numpy().astype(int)
+                    conf = r.boxes.conf.cpu().numpy()
+                    boxes = [[*map(int, xyxy[i]), r.names[int(c)], round(float(conf[i]), 2)]
+                             for i, c in enumerate(r.boxes.cls.cpu().numpy())]
 
                 if not self.is_recording:
-                    self._start_recording(frame)
+                    self._start_recording(r.boxes.xyxy.cpu().numpy().astype(int).tolist())
 
             # C. Active Recording Handler
             if self.is_recording:
                 if current_time - self.last_detection_time < self.COOLDOWN_SECONDS:
-                    cv2.putText(annotated_frame, "REC: MOVING PERSON", (20, 50), 1, 2, (0, 0, 255), 2)
-                    self.video_writer.write(annotated_frame)
+                    if self.draw_overlays:
+                        cv2.putText(annotated_frame, "REC: MOVING PERSON", (20, 50), 1, 2, (0, 0, 255), 2)
                 else:
                     self._stop_recording()
 
+        self.last_overlay = {
+            "stage": "motion",
+            "motion": bool(motion_detected),
+            "recording": self.is_recording,
+            "boxes": boxes,
+        }
+
+        # D. Hand the frame to the clip writer: pre-roll ring while idle, clip while recording
+        self.recorder.add_frame(annotated_frame)
+
         return annotated_frame, self.is_recording
 
-    def _start_recording(self, frame):
+    def _start_recording(self, boxes=None):
         timestamp = time.strftime("%Y%m%d-%H%M%S")
-        filename = f"person_motion_{timestamp}.avi"
-        full_path = os.path.join(self.output_dir, filename)
-
-        height, width = frame.shape[:2]
-        self.video_writer = cv2.VideoWriter(full_path, self.fourcc, self.fps, (width, height))
+        prefix = f"person_motion_{self.camera_id}" if self.camera_id else "person_motion"
 
-        if self.video_writer.isOpened():
-            self.is_recording = True
-            print(f"[ALERT] Starting Record: {full_path}")
-            if self.alert_sound:
-                self.alert_sound.play()
-        else:
-            self.is_recording = False
+        # Non-blocking: the writer thread opens the file and flushes the pre-roll
+        path = self.recorder.start(f"{prefix}_{timestamp}")
+        self.is_recording = True
+        self.alerts.play(self.alert_sound)
+        # No path: no clip is being written (e.g. the remux input isn't connected), so nothing to index
+        if path is not None:
+            self.alerts.record(self.camera_id, "motion", path=path, count=len(boxes or []), boxes=boxes)
 
     def _stop_recording(self):
-        if self.video_writer:
-            self.video_writer.release()
-            self.video_writer = None
-            print(f"File saved in {self.output_dir}")
+        self.recorder.stop()
         self.is_recording = False
\ No newline at end of file
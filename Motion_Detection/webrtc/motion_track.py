@@ -1,42 +1,47 @@
-import cv2
-import asyncio
+import time
+
 from av import VideoFrame
 from aiortc import VideoStreamTrack
 
+from common import metrics
+
 class MotionVideoTrack(VideoStreamTrack):
     kind = "video"
 
-    def __init__(self, camera, motion_model, sio=None):
+    def __init__(self, broadcaster):
         super().__init__()
-        self.camera = camera
-        self.motion_model = motion_model
-        self.sio = sio
+        # Shared producer: capture + motion detection run once for all viewers
+        self.broadcaster = broadcaster
+        self.last_seq = 0
+        self.broadcaster.subscribe()
+
+        # Optional RTCDataChannel carrying the detections for client-side overlays
+        self.channel = None
 
     async def recv(self):
         pts, time_base = await self.next_timestamp()
-        frame = self.camera.read()
 
-        if frame is None:
-            # Maintain ~30 FPS loop if frame is missing
-            await asyncio.sleep(0.03)
-            return await self.recv()
+        started = time.perf_counter()
+        # 1. Wait for the newest processed frame (BGR, annotated unless overlays are drawn client-side)
+        frame, self.last_seq = await self.broadcaster.wait_frame(self.last_seq)
+        camera_id = self.broadcaster.camera_id
+        metrics.observe(camera_id, "recv_wait", time.perf_counter() - started)
+        started = time.perf_counter()
 
-        # 1. Run your Motion Detection model
-        # The model returns the annotated image and a boolean (True/False)
-        processed, motion_detected = self.motion_model.predict(frame)
-
-        # 2. Emit Motion Alert
-        if motion_detected and self.sio:
-            # Using ensure_future to prevent network latency from lagging the video feed
-            asyncio.ensure_future(self.sio.emit('motion_alert', {
-                'message': 'Motion Detected!',
-                'timestamp': pts
-            }))
+        # 2. Send the matching detections on the data channel, if the viewer opened one
+        overlay = self.broadcaster.latest_overlay
+        if self.channel is not None and self.channel.readyState == "open" and overlay is not None:
+            self.channel.send(overlay)
 
         # 3. Prepare frame for WebRTC
-        rgb = cv2.cvtColor(processed, cv2.COLOR_BGR2RGB)
-        video_frame = VideoFrame.from_ndarray(rgb, format="rgb24")
+        video_frame = VideoFrame.from_ndarray(frame, format="bgr24")
         video_frame.pts = pts
         video_frame.time_base = time_base
+        metrics.observe(camera_id, "recv", time.perf_counter() - started)
+
+        return video_frame
 
-        return video_frame
\ No newline at end of file
+    def stop(self):
+        if self.readyState != "ended":
+            self.broadcaster.unsubscribe()
+        super().stop()
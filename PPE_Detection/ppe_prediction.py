@@ -1,59 +1,313 @@
 import cv2
 import time
 import os
-from ultralytics import YOLO
-import pygame
+import numpy as np
 
-class PPEPredictor:
+from common.alert_dispatcher import AlertDispatcher, load_sound
+
+# We detect violations directly based on your "no_" labels
+VIOLATION_LABELS = (
+    ("no_helmet", "HELMET"),
+    ("no_vest", "VEST"),
+    ("no_gloves", "GLOVES"),
+    ("no_boots", "BOOTS"),
+    ("no_goggle", "GOGGLES"),
+    ("none", "ALL PPE"),
+)
+
+
+def _violations(labels):
+    labels = set(labels)
+    return [name for label, name in VIOLATION_LABELS if label in labels]
+
+
+class _Person:
+    # PPE state of one tracked person, refreshed from a crop every few seconds
     def __init__(self):
-        # Audio
-        pygame.mixer.init()
-        self.alert_sound = pygame.mixer.Sound("alert.mp3")
+        self.violations = []
+        self.boxes = []  # PPE boxes in frame coordinates at the last check
+        self.anchor = None  # person box (x1, y1) at the last check
+        self.checked = 0
+        self.alerted = set()  # violations already reported for this person
+
+
+class PPEPredictor:
+    def __init__(self, model=None, camera_id=None, gate=None, alerts=None, draw_overlays=True,
+                 audio=True, person_model=None, tracker=None, refresh_seconds=5.0, crop_padding=0.15):
+        self.camera_id = camera_id
+
+        # With draw_overlays off the frame is returned untouched and the browser
+        # draws last_overlay instead (sent over the WebRTC data channel)
+        self.draw_overlays = draw_overlays
+        self.last_overlay = None
+
+        # Snapshots and sounds run on the dispatcher's worker threads, not in predict()
+        self.alerts = alerts or AlertDispatcher()
+
+        # Optional MotionGate: on static scenes the last detections are reused
+        self.gate = gate
+        self._last_results = None
+
+        # Quality knobs (set by the LoadController): detector input size and
+        # how often the detector runs; in-between frames reuse the last results
+        self.infer_kwargs = {}
+        self.detect_every = 1
+        self.frame_index = 0
+
+        # Audio (audio=False skips the mixer entirely, e.g. for offline batch runs;
+        # a missing alert.mp3 or audio device just means no sound)
+        self.alert_sound = load_sound("alert.mp3") if audio else None
+
+        # Model (pass a shared instance to reuse weights across cameras)
+        if model is None:
+            from ultralytics import YOLO
 
-        # Model
-        self.model = YOLO("best.onnx", task="detect")
+            model = YOLO("best.onnx", task="detect")
+        self.model = model
+
+        # Per-person mode (a tracker is given): people are detected and tracked
+        # first, the PPE model runs on batched crops of new tracks and then only
+        # every refresh_seconds, and each person is alerted once per violation.
+        # person_model may be omitted when predict() is handed person detections.
+        self.person_model = person_model
+        self.tracker = tracker
+        self.refresh_seconds = refresh_seconds
+        self.crop_padding = crop_padding
+        self._people = {}
+        self._last_person_results = None
+        self.crops_checked = 0
 
         # Settings
         self.CONFIRMATION_THRESHOLD = 0.5
+        self.PERSON_THRESHOLD = 0.4
+        self.MIN_CROP_SIZE = 8  # px; smaller crops (a track leaving the frame) aren't checked
         self.COOLDOWN_SECONDS = 5
         self.last_alert_time = 0
 
+        # Vertical position of the alert header (lets a combined view stack banners)
+        self.header_top = 0
+
         # Screenshot dir
         self.alert_dir = "alerts_screenshots"
         os.makedirs(self.alert_dir, exist_ok=True)
 
-    def predict(self, frame):
-        results = self.model(frame, stream=True)
-        annotated_frame = frame.copy()
+    def set_quality(self, imgsz=None, detect_every=1):
+        self.infer_kwargs = {"imgsz": imgsz} if imgsz else {}
+        self.detect_every = max(1, int(detect_every))
 
-        found_labels = []
+    def _should_detect(self, frame):
+        return self.frame_index % self.detect_every == 0 and (self.gate is None or self.gate.should_infer(frame))
+
+    def _labelled_boxes(self, results, offset=(0, 0)):
+        # [x1, y1, x2, y2, label, conf] above the confirmation threshold, shifted by offset
+        boxes = []
         for r in results:
-            annotated_frame = r.plot()
-            for box in r.boxes:
-                conf = float(box.conf[0])
-                if conf > self.CONFIRMATION_THRESHOLD:
-                    label = self.model.names[int(box.cls[0])]
-                    found_labels.append(label)
+            if r.boxes is None or len(r.boxes) == 0:
+                continue
+            conf = r.boxes.conf.cpu().numpy()
+            cls = r.boxes.cls.cpu().numpy().astype(int)
+            xyxy = r.boxes.xyxy.cpu().numpy().astype(int) + np.array([*offset, *offset])
+            for i in (conf > self.CONFIRMATION_THRESHOLD).nonzero()[0]:
+                boxes.append([*map(int, xyxy[i]), r.names[cls[i]], round(float(conf[i]), 2)])
+        return boxes
+
+    def predict(self, frame, annotated_frame=None, persons=None):
+        # annotated_frame: draw on top of another pipeline's overlays instead of a fresh copy
+        # persons: person detections from a shared detector pass (per-person mode)
+        self.frame_index += 1
+        if self.tracker is not None:
+            return self._predict_per_person(frame, annotated_frame, persons)
+
+        if self._last_results is None or self._should_detect(frame):
+            self._last_results = list(self.model(frame, stream=True, **self.infer_kwargs))
+        results = self._last_results
+
+        boxes = self._labelled_boxes(results)
 
         # --- SMART LOGIC ---
-        # We detect violations directly based on your "no_" labels
-        violations = []
-        if "no_helmet" in found_labels: violations.append("HELMET")
-        if "no_vest" in found_labels: violations.append("VEST")
-        if "no_gloves" in found_labels: violations.append("GLOVES")
-        if "no_boots" in found_labels: violations.append("BOOTS")
-        if "no_goggle" in found_labels: violations.append("GOGGLES")
-        if "none" in found_labels: violations.append("ALL PPE")
+        violations = _violations(b[4] for b in boxes)
 
         # Trigger if any violation labels were found
         violation_detected = len(violations) > 0
 
+        self.last_overlay = {
+            "stage": "ppe",
+            "violation": violation_detected,
+            "violations": violations,
+            "top": self.header_top,
+            "boxes": boxes,
+        }
+
         # --- VISUAL ALERT ---
+        if annotated_frame is None:
+            annotated_frame = frame.copy() if self.draw_overlays else frame
+        if self.draw_overlays:
+            annotated_frame = self._draw(results, violations, annotated_frame)
+
+        # --- AUDIO & SAVE LOGIC ---
         if violation_detected:
-            # Draw Red Header Bar
-            overlay = annotated_frame.copy()
-            cv2.rectangle(overlay, (0, 0), (frame.shape[1], 60), (0, 0, 255), -1)
-            cv2.addWeighted(overlay, 0.6, annotated_frame, 0.4, 0, annotated_frame)
+            now = time.time()
+            if now - self.last_alert_time > self.COOLDOWN_SECONDS:
+                self.alerts.play(self.alert_sound)
+                ts = time.strftime("%Y%m%d-%H%M%S")
+                prefix = f"violation_{self.camera_id}" if self.camera_id else "violation"
+                path = os.path.join(self.alert_dir, f"{prefix}_{ts}.jpg")
+                # Copy: later pipeline stages may keep drawing on this frame.
+                # Snapshots always carry the overlays, even when viewers draw their own.
+                if self.draw_overlays:
+                    snapshot = annotated_frame.copy()
+                else:
+                    snapshot = self._draw(results, violations, frame.copy())
+                event = {"camera_id": self.camera_id, "type": "ppe", "count": len(violations), "boxes": boxes,
+                         "details": {"violations": violations}}
+                self.alerts.snapshot(path, snapshot, event=event)
+                print(f"[ALERT] PPE violation → {path}")
+                self.last_alert_time = now
+
+        return annotated_frame, violation_detected
+
+    def _person_boxes(self, results):
+        kept = []
+        for r in results:
+            if r.boxes is None or len(r.boxes) == 0:
+                continue
+            person_ids = [i for i, name in r.names.items() if name == "person"]
+            conf = r.boxes.conf.cpu().numpy()
+            cls = r.boxes.cls.cpu().numpy()
+            keep = (conf > self.PERSON_THRESHOLD) & np.isin(cls, person_ids)
+            kept.append(r.boxes.xyxy.cpu().numpy()[keep])
+        if not kept:
+            return np.zeros((0, 4), dtype=np.float32)
+        return np.concatenate(kept)
+
+    def _crop_box(self, box, shape):
+        # Person box grown by crop_padding so helmets and boots aren't cut off,
+        # clipped to the frame; None when too little of it is left in the frame
+        x1, y1, x2, y2 = box
+        pad_x, pad_y = (x2 - x1) * self.crop_padding, (y2 - y1) * self.crop_padding
+        h, w = shape[:2]
+        x1, x2 = (int(min(max(x, 0), w)) for x in (x1 - pad_x, x2 + pad_x))
+        y1, y2 = (int(min(max(y, 0), h)) for y in (y1 - pad_y, y2 + pad_y))
+        if x2 - x1 < self.MIN_CROP_SIZE or y2 - y1 < self.MIN_CROP_SIZE:
+            return None
+        return x1, y1, x2, y2
+
+    def _predict_per_person(self, frame, annotated_frame, persons):
+        now = time.time()
+        if persons is None:
+            if self.person_model is None:
+                from ultralytics import YOLO
+
+                self.person_model = YOLO("yolov8n.pt")
+            if self._last_person_results is None or self._should_detect(frame):
+                self._last_person_results = list(self.person_model(frame, stream=True, **self.infer_kwargs))
+            persons = self._last_person_results
+        tracks = self.tracker.update(self._person_boxes(persons))
+
+        # 1. Forget people whose track ended; a person re-entering gets a new track and a new check
+        live = {t.id for t in self.tracker.tracks}
+        for track_id in set(self._people) - live:
+            del self._people[track_id]
+
+        # 2. PPE model on crops of new people and of people due for a refresh, as one batch
+        tracks_due = [t for t in tracks
+                      if t.id not in self._people or now - self._people[t.id].checked >= self.refresh_seconds]
+        # A track mostly outside the frame gives no usable crop: it stays unchecked
+        # (and is retried next frame) instead of sending an empty image to the model
+        due, rects = [], []
+        for t in tracks_due:
+            rect = self._crop_box(t.box, frame.shape)
+            if rect is not None:
+                due.append(t)
+                rects.append(rect)
+            elif t.id not in self._people:
+                self._people[t.id] = _Person()
+                self._people[t.id].anchor = t.box[:2].copy()
+        if due:
+            crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in rects]
+            results = list(self.model(crops, stream=True, **self.infer_kwargs))
+            for t, rect, r in zip(due, rects, results):
+                person = self._people.setdefault(t.id, _Person())
+                person.boxes = self._labelled_boxes([r], offset=rect[:2])
+                person.violations = _violations(b[4] for b in person.boxes)
+                person.anchor = t.box[:2].copy()
+                person.checked = now
+            self.crops_checked += len(due)
+
+        # 3. Per-person violations; only violations a person wasn't alerted for yet raise alerts
+        people, boxes, new_alerts = [], [], []
+        for t in tracks:
+            person = self._people[t.id]
+            people.append([*map(int, t.box), t.id, person.violations])
+            # PPE boxes follow the person between checks
+            dx, dy = (int(d) for d in t.box[:2] - person.anchor)
+            boxes += [[x1 + dx, y1 + dy, x2 + dx, y2 + dy, label, conf]
+                      for x1, y1, x2, y2, label, conf in person.boxes]
+            fresh = [v for v in person.violations if v not in person.alerted]
+            if fresh:
+                person.alerted.update(fresh)
+                new_alerts.append((t.id, fresh))
+
+        current = {v for t in tracks for v in self._people[t.id].violations}
+        violations = [name for _, name in VIOLATION_LABELS if name in current]
+        violation_detected = len(violations) > 0
+
+        self.last_overlay = {
+            "stage": "ppe",
+            "violation": violation_detected,
+            "violations": violations,
+            "top": self.header_top,
+            "boxes": boxes,
+            "people": people,
+        }
+
+        if annotated_frame is None:
+            annotated_frame = frame.copy() if self.draw_overlays else frame
+        if self.draw_overlays:
+            annotated_frame = self._draw_people(annotated_frame, people, boxes, violations)
+
+        # One snapshot (and sound) per frame that brings new violators, none for known ones
+        if new_alerts:
+            self.alerts.play(self.alert_sound)
+            ts = time.strftime("%Y%m%d-%H%M%S")
+            prefix = f"violation_{self.camera_id}" if self.camera_id else "violation"
+            ids = "-".join(str(track_id) for track_id, _ in new_alerts)
+            path = os.path.join(self.alert_dir, f"{prefix}_{ts}_p{ids}.jpg")
+            if self.draw_overlays:
+                snapshot = annotated_frame.copy()
+            else:
+                snapshot = self._draw_people(frame.copy(), people, boxes, violations)
+            event = {
+                "camera_id": self.camera_id, "type": "ppe", "count": len(new_alerts), "boxes": people,
+                "details": {"violations": violations, "new": [{"person": i, "missing": v} for i, v in new_alerts]},
+            }
+            self.alerts.snapshot(path, snapshot, event=event)
+            who = "; ".join(f"person #{track_id}: {', '.join(v)}" for track_id, v in new_alerts)
+            print(f"[ALERT] PPE violation ({who}) → {path}")
+            self.last_alert_time = now
+
+        return annotated_frame, violation_detected
+
+    def _draw_people(self, img, people, boxes, violations):
+        for x1, y1, x2, y2, label, conf in boxes:
+            color = (0, 0, 255) if label.startswith("no_") or label == "none" else (0, 200, 0)
+            cv2.rectangle(img, (x1, y1), (x2, y2), color, 1)
+            cv2.putText(img, f"{label} {conf:.2f}", (x1, max(y1 - 4, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
+        for x1, y1, x2, y2, track_id, missing in people:
+            color = (0, 0, 255) if missing else (0, 255, 0)
+            cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(img, f"#{track_id}", (x1, max(y1 - 5, 0)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+        return self._draw([], violations, img)
+
+    def _draw(self, results, violations, img):
+        for r in results:
+            img = r.plot(img=img)
+
+        if violations:
+            # Draw Red Header Bar (only the 60 px band is blended, not the whole frame)
+            top = self.header_top
+            band = img[top:top + 60]
+            cv2.addWeighted(np.full_like(band, (0, 0, 255)), 0.6, band, 0.4, 0, band)
 
             # Create dynamic alert text based on detected "no_" labels
             alert_text = f"VIOLATION: MISSING {', '.join(violations)}"
@@ -62,25 +316,13 @@ class PPEPredictor:
             font_scale = 0.8 if len(alert_text) > 30 else 1.0
 
             cv2.putText(
-                annotated_frame,
+                img,
                 alert_text,
-                (20, 40),
+                (20, top + 40),
                 cv2.FONT_HERSHEY_SIMPLEX,
                 font_scale,
                 (255, 255, 255),
                 2,
                 cv2.LINE_AA
             )
-
-        # --- AUDIO & SAVE LOGIC ---
-        if violation_detected:
-            now = time.time()
-            if now - self.last_alert_time > self.COOLDOWN_SECONDS:
-                self.alert_sound.play()
-                ts = time.strftime("%Y%m%d-%H%M%S")
-                path = os.path.join(self.alert_dir, f"violation_{ts}.jpg")
-                cv2.imwrite(path, annotated_frame)
-                print(f"[ALERT] PPE violation → {path}")
-                self.last_alert_time = now
-
-        return annotated_frame, violation_detected
\ No newline at end of file
+        return img
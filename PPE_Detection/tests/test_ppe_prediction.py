@@ -0,0 +1,87 @@
+import os
+import sys
+
+import numpy as np
+
+# The app directory and the repo root (shared common/ package)
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [APP_DIR, os.path.dirname(APP_DIR)]
+
+from ppe_prediction import PPEPredictor  # noqa: E402
+
+
+class _Result:
+    boxes = None
+    names = {}
+
+
+class _Model:
+    # Records the crops of each batch and finds no PPE in them
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, crops, **kwargs):
+        self.batches.append([crop.shape for crop in crops])
+        return iter([_Result() for _ in crops])
+
+
+class _Track:
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+
+
+class _Tracker:
+    # Replays fixed tracks, like a tracker still predicting a person who walked out
+    def __init__(self, boxes):
+        self.tracks = [_Track(i, box) for i, box in enumerate(boxes, 1)]
+
+    def update(self, boxes):
+        return self.tracks
+
+
+class _Alerts:
+    def play(self, sound):
+        pass
+
+    def snapshot(self, path, frame, event=None):
+        pass
+
+
+def _predictor(tmp_path, monkeypatch, boxes):
+    monkeypatch.chdir(tmp_path)
+    model = _Model()
+    predictor = PPEPredictor(model=model, alerts=_Alerts(), audio=False, draw_overlays=False,
+                             person_model=object(), tracker=_Tracker(boxes))
+    return predictor, model
+
+
+def test_track_leaving_the_frame_is_not_cropped(tmp_path, monkeypatch):
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    boxes = [
+        (100, 100, 200, 300),  # in the frame
+        (700, 100, 780, 300),  # drifted past the right edge
+        (-200, -300, -120, -100),  # drifted past the top-left corner
+        (630, 100, 700, 300),  # a sliver left at the right edge
+    ]
+    predictor, model = _predictor(tmp_path, monkeypatch, boxes)
+
+    predictor.predict(frame, persons=[])
+
+    assert len(model.batches) == 1
+    assert all(h > 0 and w > 0 for h, w, _ in model.batches[0])
+    assert len(model.batches[0]) == 2
+    assert [p[4] for p in predictor.last_overlay["people"]] == [1, 2, 3, 4]
+
+
+def test_track_only_off_frame_skips_the_model(tmp_path, monkeypatch):
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    predictor, model = _predictor(tmp_path, monkeypatch, [(700, 500, 800, 700)])
+
+    predictor.predict(frame, persons=[])
+    predictor.tracker.tracks[0].box = np.array([500, 100, 600, 300], dtype=np.float32)
+    predictor.predict(frame, persons=[])
+
+    # Checked as soon as the person is back in view
+    assert model.batches == [[(260, 130, 3)]]
+    assert predictor.crops_checked == 1
@@ -1,41 +1,46 @@
-import cv2
-import asyncio
+import time
+
 from av import VideoFrame
 from aiortc import VideoStreamTrack
 
+from common import metrics
+
 class PPEVideoTrack(VideoStreamTrack):
     kind = "video"
 
-    def __init__(self, camera, ppe_model, sio=None): # Added sio parameter
+    def __init__(self, broadcaster):
         super().__init__()
-        self.camera = camera
-        self.ppe_model = ppe_model
-        self.sio = sio
+        # Shared producer: capture + PPE inference run once for all viewers
+        self.broadcaster = broadcaster
+        self.last_seq = 0
+        self.broadcaster.subscribe()
+
+        # Optional RTCDataChannel carrying the detections for client-side overlays
+        self.channel = None
 
     async def recv(self):
         pts, time_base = await self.next_timestamp()
-        frame = self.camera.read()
-
-        if frame is None:
-            await asyncio.sleep(0.03)
-            return await self.recv()
-
-        # 3. Run your PPE model
-        processed, violation = self.ppe_model.predict(frame)
-
-        # --- NEW: Emit Warning ---
-        if violation and self.sio:
-            # We use ensure_future so the alert doesn't lag the video stream
-            asyncio.ensure_future(self.sio.emit('ppe_violation_alert', {
-                'message': 'PPE Violation Detected!',
-                'type': violation.get('type', 'Unknown'),
-                'timestamp': pts
-            }))
-        # -------------------------
-
-        rgb = cv2.cvtColor(processed, cv2.COLOR_BGR2RGB)
-        video_frame = VideoFrame.from_ndarray(rgb, format="rgb24")
+
+        started = time.perf_counter()
+        # Wait for the newest frame (BGR, annotated unless overlays are drawn client-side)
+        frame, self.last_seq = await self.broadcaster.wait_frame(self.last_seq)
+        camera_id = self.broadcaster.camera_id
+        metrics.observe(camera_id, "recv_wait", time.perf_counter() - started)
+        started = time.perf_counter()
+
+        # The matching detections go out on the data channel, if the viewer opened one
+        overlay = self.broadcaster.latest_overlay
+        if self.channel is not None and self.channel.readyState == "open" and overlay is not None:
+            self.channel.send(overlay)
+
+        video_frame = VideoFrame.from_ndarray(frame, format="bgr24")
         video_frame.pts = pts
         video_frame.time_base = time_base
+        metrics.observe(camera_id, "recv", time.perf_counter() - started)
+
+        return video_frame
 
-        return video_frame
\ No newline at end of file
+    def stop(self):
+        if self.readyState != "ended":
+            self.broadcaster.unsubscribe()
+        super().stop()
@@ -0,0 +1,202 @@
+import time
+
+from Crowd_Management_System.crowd_management import CrowdManager
+from Motion_Detection.motion_detection import MotionPredictor
+from PPE_Detection.ppe_prediction import PPEPredictor
+from common.motion_gate import MotionGate
+from common.motion_engine import build_engine
+from common.tracker import IoUTracker
+
+
+class FrameContext:
+    """
+    State shared by every stage for one decoded frame. The person detector
+    runs at most once per frame, the first time a stage asks for it.
+    """
+
+    def __init__(self, frame, pipeline):
+        self.frame = frame
+        # Stages draw into one shared copy; with client-side overlays nothing is drawn
+        self.annotated = frame.copy() if pipeline.draw_overlays else frame
+        self.pipeline = pipeline
+        self._person_results = None
+
+    def person_results(self, frame=None):
+        if self._person_results is None:
+            self._person_results = self.pipeline.detect_persons(self.frame)
+        return self._person_results
+
+
+class CrowdStage:
+    name = "crowd"
+
+    def __init__(self, crowd_manager):
+        self.predictor = crowd_manager
+
+    def process(self, ctx):
+        ctx.annotated, flag = self.predictor.predict(
+            ctx.frame, results=ctx.person_results(), annotated_frame=ctx.annotated
+        )
+        return flag
+
+
+class MotionStage:
+    name = "motion"
+
+    def __init__(self, motion_predictor):
+        self.predictor = motion_predictor
+
+    def process(self, ctx):
+        # YOLO is only requested when motion is seen, and reuses the crowd stage's pass
+        ctx.annotated, flag = self.predictor.predict(
+            ctx.frame, detect=ctx.person_results, annotated_frame=ctx.annotated
+        )
+        return flag
+
+
+class PPEStage:
+    name = "ppe"
+
+    def __init__(self, ppe_predictor):
+        self.predictor = ppe_predictor
+
+    def process(self, ctx):
+        # Per-person mode tracks the people found by the shared person pass
+        persons = ctx.person_results() if self.predictor.tracker is not None else None
+        ctx.annotated, flag = self.predictor.predict(ctx.frame, annotated_frame=ctx.annotated, persons=persons)
+        return flag
+
+
+class AnalyticsPipeline:
+    """
+    Runs several analytics stages over a single decoded frame. It exposes the
+    same predict(frame) -> (annotated_frame, flags) contract as the individual
+    predictors, with flags being a {stage_name: bool} dict.
+    """
+
+    def __init__(self, stages, person_model, gate=None, draw_overlays=True):
+        self.stages = stages
+        self.person_model = person_model
+        self.draw_overlays = draw_overlays
+        self.last_flags = {}
+        # Seconds per stage for the last frame, exported as predict_<stage> latencies
+        self.last_timings = {}
+
+        # One motion gate per camera, shared by every stage
+        self.gate = gate
+        self._last_person_results = None
+
+        # Quality knobs (set by the LoadController), forwarded to every stage
+        self.infer_kwargs = {}
+        self.detect_every = 1
+        self.frame_index = 0
+
+    def stage(self, name):
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        return None
+
+    @property
+    def last_overlay(self):
+        # One layer per stage, so a viewer can toggle them independently
+        return [stage.predictor.last_overlay for stage in self.stages
+                if stage.predictor.last_overlay is not None]
+
+    def set_quality(self, imgsz=None, detect_every=1):
+        self.infer_kwargs = {"imgsz": imgsz} if imgsz else {}
+        self.detect_every = max(1, int(detect_every))
+        for stage in self.stages:
+            stage.predictor.set_quality(imgsz=imgsz, detect_every=detect_every)
+
+    def detect_persons(self, frame):
+        # Static scene (or a skipped frame): reuse the last person detections instead of running yolov8n
+        if self._last_person_results is None or (self.frame_index % self.detect_every == 0
+                                                 and (self.gate is None or self.gate.should_infer(frame))):
+            crowd = self.stage("crowd")
+            if crowd is not None and crowd.predictor.tiler is not None:
+                # Tiled crowd stage: its sliced pass (plus full frame) serves every stage
+                self._last_person_results = crowd.predictor.detect_persons(frame)
+            else:
+                self._last_person_results = list(self.person_model(frame, verbose=False, **self.infer_kwargs))
+        return self._last_person_results
+
+    def predict(self, frame):
+        self.frame_index += 1
+        if self.gate is not None:
+            # The frame's one gate decision (and count); stages asking the shared gate get the same answer
+            self.gate.should_infer(frame)
+        ctx = FrameContext(frame, self)
+        flags = {}
+        timings = {}
+        for stage in self.stages:
+            started = time.perf_counter()
+            flags[stage.name] = bool(stage.process(ctx))
+            timings[f"predict_{stage.name}"] = time.perf_counter() - started
+        self.last_flags = flags
+        self.last_timings = timings
+        return ctx.annotated, flags
+
+
+STAGE_ORDER = ("crowd", "motion", "ppe")
+
+
+def build_pipeline(camera_id, stage_names=STAGE_ORDER, person_model=None, ppe_model=None,
+                   motion_gate=True, gate_force_interval=2.0, tracking=False, alerts=None, zones=None,
+                   draw_overlays=True, audio=True, recorder=None, tiling=None, motion=None, ppe_per_person=None):
+    """
+    Builds the pipeline for one camera. Crowd runs before motion so the
+    motion stage finds the person detections already computed.
+    audio=False and a recorder (e.g. NullRecorder) let it run headless.
+    """
+    unknown = set(stage_names) - set(STAGE_ORDER)
+    if unknown:
+        raise ValueError(f"Unknown pipeline stages: {', '.join(sorted(unknown))}")
+
+    if person_model is None:
+        from ultralytics import YOLO
+        person_model = YOLO("yolov8n.pt")
+
+    # motion: optional MotionEngine settings (background model, masks, area thresholds)
+    engine = build_engine(motion)
+    gate = MotionGate(force_interval=gate_force_interval, engine=engine) if motion_gate else None
+
+    stages = []
+    for name in STAGE_ORDER:
+        if name not in stage_names:
+            continue
+        if name == "crowd":
+            # Tracking gives the crowd stage stable person IDs for dwell time / unique visitors
+            tracker = IoUTracker() if tracking else None
+            stages.append(CrowdStage(CrowdManager(
+                model=person_model, camera_id=camera_id, tracker=tracker, alerts=alerts, zones=zones,
+                draw_overlays=draw_overlays, audio=audio, tiling=tiling,
+            )))
+        elif name == "motion":
+            # Sharing the gate means the frame difference is computed once per frame
+            stages.append(MotionStage(MotionPredictor(
+                model=person_model, camera_id=camera_id, alerts=alerts, draw_overlays=draw_overlays,
+                gate=gate or (MotionGate(force_interval=None, engine=engine) if engine else None),
+                audio=audio, recorder=recorder,
+            )))
+        elif name == "ppe":
+            # ppe_per_person: PPE on tracked person crops, alerting once per person and violation
+            per_person = {}
+            if ppe_per_person:
+                options = ppe_per_person if isinstance(ppe_per_person, dict) else {}
+                per_person = {
+                    "tracker": IoUTracker(),
+                    "refresh_seconds": options.get("refresh_seconds", 5.0),
+                    "crop_padding": options.get("padding", 0.15),
+                }
+            ppe = PPEPredictor(
+                model=ppe_model, camera_id=camera_id, gate=gate, alerts=alerts, draw_overlays=draw_overlays,
+                audio=audio, **per_person
+            )
+            stages.append(PPEStage(ppe))
+
+    # Stack the banners so each stage's header stays readable
+    for i, stage in enumerate(s for s in stages if s.name in ("crowd", "ppe")):
+        stage.predictor.header_top = 60 * i
+
+    return AnalyticsPipeline(stages, person_model, gate, draw_overlays)
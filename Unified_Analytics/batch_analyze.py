@@ -0,0 +1,352 @@
+"""
+Offline analysis of recorded footage with the same predictors as the live apps.
+
+    python batch_analyze.py /archive/incident-0412 --out results --stages crowd ppe --workers 4
+
+Video files (or folders of them) are split into tasks by file and, for long
+files, by time segment, and spread over a process pool. Each worker loads
+the models once and runs the analytics pipeline headless: no audio, no
+WebRTC, no clip recording. The result is an event log (events.jsonl or
+events.parquet), one thumbnail per event and a summary.json.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The shared modules (common/) and the predictors of the sibling projects live at the repo root
+ROOT_DIR = os.path.dirname(BASE_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from common.model_cache import get_model
+from common.clip_recorder import NullRecorder
+from common.motion_engine import METHODS
+from analytics_pipeline import build_pipeline, STAGE_ORDER
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".m4v", ".ts")
+
+
+class _QuietAlerts:
+    # The event log and thumbnails replace the predictors' own snapshots and sounds
+    def snapshot(self, path, frame, on_saved=None, event=None):
+        pass
+
+    def record(self, camera_id, type, **fields):
+        pass
+
+    def play(self, sound):
+        pass
+
+
+def find_videos(paths):
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                videos += [os.path.join(root, f) for f in sorted(files) if f.lower().endswith(VIDEO_EXTENSIONS)]
+        elif os.path.isfile(path):
+            videos.append(path)
+        else:
+            print(f"[WARN] Skipping {path}: not found")
+    return videos
+
+
+def plan_tasks(videos, segment_seconds):
+    """One task per file, or per segment_seconds of video when the file is longer."""
+    tasks = []
+    for path in videos:
+        cap = cv2.VideoCapture(path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        if total <= 0:
+            print(f"[WARN] Skipping {path}: can't read frame count")
+            continue
+
+        step = int(segment_seconds * fps) if segment_seconds else total
+        for start in range(0, total, step):
+            tasks.append((path, start, min(start + step, total), fps))
+    return tasks
+
+
+# --- Worker side (one pipeline configuration per process) ---
+
+_options = None
+
+
+def _init_worker(options):
+    global _options
+    _options = options
+    # Parallelism comes from the process pool; keep OpenCV from oversubscribing cores
+    cv2.setNumThreads(1)
+
+
+def analyze_segment(path, start, end, fps):
+    opts = _options
+    stages = opts["stages"]
+    person_model = get_model(opts["person_model"], backend=opts["backend"])
+    ppe_model = get_model(opts["ppe_model"], "detect", backend=opts["backend"]) if "ppe" in stages else None
+    pipeline = build_pipeline(
+        os.path.splitext(os.path.basename(path))[0], stages,
+        person_model=person_model, ppe_model=ppe_model,
+        motion_gate=opts["motion_gate"], motion=opts["motion"], tracking=opts["tracking"], zones=opts["zones"],
+        alerts=_QuietAlerts(), audio=False, recorder=NullRecorder(),
+    )
+    log = _EventLog(path, fps, opts["out"])
+
+    started = time.time()
+    cap = cv2.VideoCapture(path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    processed = 0
+    index = start
+    while index < end:
+        # Frame skipping: grab() advances without decoding into a numpy frame
+        if (index - start) % opts["stride"]:
+            if not cap.grab():
+                break
+            index += 1
+            continue
+        ok, frame = cap.read()
+        if not ok:
+            break
+
+        annotated, flags = pipeline.predict(frame)
+        log.update(index, flags, pipeline.last_overlay, annotated)
+        processed += 1
+        index += 1
+    cap.release()
+    log.close(index)
+
+    gate = pipeline.gate.stats() if pipeline.gate is not None else None
+    return {
+        "file": path,
+        "start_frame": start,
+        "end_frame": index,
+        "processed": processed,
+        "seconds": round(time.time() - started, 2),
+        "gate": gate,
+        "events": log.events,
+    }
+
+
+class _EventLog:
+    """
+    Turns per-frame stage flags into events: an event opens when a stage's
+    flag goes up and closes when it drops. The thumbnail is the frame where
+    the event peaked (most people / most missing PPE).
+    """
+
+    def __init__(self, path, fps, out_dir):
+        self.path = path
+        self.fps = fps
+        self.thumb_dir = os.path.join(out_dir, "thumbnails")
+        self.events = []
+        self._open = {}
+
+    def update(self, index, flags, layers, annotated):
+        layers = {layer["stage"]: layer for layer in layers}
+        for stage, hit in flags.items():
+            event = self._open.get(stage)
+            if hit:
+                layer = layers.get(stage, {})
+                score = _score(layer)
+                if event is None:
+                    event = self._open[stage] = {
+                        "file": self.path,
+                        "stage": stage,
+                        "start_frame": index,
+                        "start_s": round(index / self.fps, 2),
+                        "details": {},
+                        "_score": -1,
+                    }
+                _merge_details(event["details"], layer)
+                if score > event["_score"]:
+                    event["_score"] = score
+                    event["_thumb"] = (index, annotated.copy())
+                event["end_frame"] = index
+            elif event is not None:
+                self._finish(stage)
+
+    def close(self, index):
+        for stage in list(self._open):
+            self._finish(stage)
+
+    def _finish(self, stage):
+        event = self._open.pop(stage)
+        event["end_s"] = round((event["end_frame"] + 1) / self.fps, 2)
+        event.pop("_score")
+        thumb_index, frame = event.pop("_thumb")
+        name = os.path.splitext(os.path.basename(self.path))[0]
+        thumb_path = os.path.join(self.thumb_dir, f"{name}_{stage}_{thumb_index}.jpg")
+        # Small thumbnails: 320 px wide is enough to triage an event
+        scale = 320 / frame.shape[1]
+        if scale < 1:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        cv2.imwrite(thumb_path, frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        event["thumbnail"] = thumb_path
+        self.events.append(event)
+
+
+def _score(layer):
+    if layer.get("stage") == "crowd":
+        return layer.get("count", 0)
+    if layer.get("stage") == "ppe":
+        return len(layer.get("violations", []))
+    return 0
+
+
+def _merge_details(details, layer):
+    stage = layer.get("stage")
+    if stage == "crowd":
+        details["peak_count"] = max(details.get("peak_count", 0), layer.get("count", 0))
+        for zone in layer.get("zones", []):
+            peaks = details.setdefault("zone_peaks", {})
+            peaks[zone["name"]] = max(peaks.get(zone["name"], 0), zone["count"])
+    elif stage == "ppe":
+        seen = details.setdefault("violations", [])
+        seen += [v for v in layer.get("violations", []) if v not in seen]
+
+
+# --- Driver ---
+
+def merge_split_events(events, gap_seconds):
+    """Joins events that were cut in two at a segment boundary."""
+    events = sorted(events, key=lambda e: (e["file"], e["stage"], e["start_s"]))
+    merged = []
+    for event in events:
+        prev = merged[-1] if merged else None
+        if (prev is not None and prev["file"] == event["file"] and prev["stage"] == event["stage"]
+                and event["start_s"] - prev["end_s"] <= gap_seconds):
+            prev["end_s"] = event["end_s"]
+            prev["end_frame"] = event["end_frame"]
+            for key, value in event["details"].items():
+                if key == "peak_count":
+                    prev["details"][key] = max(prev["details"].get(key, 0), value)
+                elif key not in prev["details"]:
+                    prev["details"][key] = value
+            if os.path.exists(event["thumbnail"]):
+                os.remove(event["thumbnail"])
+            continue
+        merged.append(event)
+    return sorted(merged, key=lambda e: (e["file"], e["start_s"]))
+
+
+def write_events(events, out_dir, fmt):
+    if fmt == "parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            print("[ERROR] Parquet output needs pyarrow (pip install pyarrow); writing JSONL instead")
+            fmt = "jsonl"
+        else:
+            # details differ per stage, so they're stored as a JSON string column
+            rows = [dict(e, details=json.dumps(e["details"])) for e in events]
+            path = os.path.join(out_dir, "events.parquet")
+            pq.write_table(pa.Table.from_pylist(rows), path)
+            return path
+
+    path = os.path.join(out_dir, "events.jsonl")
+    with open(path, "w") as f:
+        for event in events:
+            f.write(json.dumps(event) + "\n")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan recorded footage for crowd, motion and PPE events.")
+    parser.add_argument("inputs", nargs="+", help="video files or folders")
+    parser.add_argument("--out", default="batch_results", help="output folder")
+    parser.add_argument("--stages", nargs="+", default=list(STAGE_ORDER), choices=STAGE_ORDER)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--segment-seconds", type=float, default=300,
+                        help="split files longer than this across workers (0: one task per file)")
+    parser.add_argument("--stride", type=int, default=1, help="analyze every Nth frame")
+    parser.add_argument("--no-motion-gate", action="store_true", help="run the detectors on every analyzed frame")
+    parser.add_argument("--motion-engine", choices=METHODS,
+                        help="background-model motion detection instead of the frame difference")
+    parser.add_argument("--tracking", action="store_true", help="track people in the crowd stage")
+    parser.add_argument("--zones", help="JSON file with crowd zones ([{name, points, threshold}])")
+    parser.add_argument("--person-model", default=os.environ.get("PERSON_MODEL", "yolov8n.pt"))
+    parser.add_argument("--ppe-model", default=os.environ.get("PPE_MODEL", "best.onnx"))
+    parser.add_argument("--backend", choices=("ultralytics", "onnxruntime"),
+                        default=os.environ.get("INFERENCE_BACKEND", "ultralytics"))
+    parser.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    args = parser.parse_args(argv)
+
+    videos = find_videos(args.inputs)
+    tasks = plan_tasks(videos, args.segment_seconds)
+    if not tasks:
+        print("[ERROR] No readable videos found")
+        return 1
+
+    os.makedirs(os.path.join(args.out, "thumbnails"), exist_ok=True)
+    zones = None
+    if args.zones:
+        with open(args.zones) as f:
+            zones = json.load(f)
+    options = {
+        "stages": args.stages,
+        "stride": max(1, args.stride),
+        "motion_gate": not args.no_motion_gate,
+        "motion": {"method": args.motion_engine} if args.motion_engine else None,
+        "tracking": args.tracking,
+        "zones": zones,
+        "person_model": args.person_model,
+        "ppe_model": args.ppe_model,
+        "backend": args.backend,
+        "out": args.out,
+    }
+
+    print(f"[INFO] {len(videos)} file(s), {len(tasks)} task(s) on {args.workers} worker(s)")
+    started = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(options,)) as pool:
+        futures = {pool.submit(analyze_segment, *task): task for task in tasks}
+        for done, future in enumerate(as_completed(futures), 1):
+            path, start, _, fps = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[ERROR] {path} @ {start / fps:.0f}s failed: {e}")
+                continue
+            results.append(result)
+            rate = result["processed"] / result["seconds"] if result["seconds"] else 0.0
+            print(f"[INFO] {done}/{len(tasks)} {os.path.basename(path)} @ {start / fps:.0f}s: "
+                  f"{len(result['events'])} events, {rate:.1f} fps")
+
+    # Events cut at a segment boundary are joined again (gap of at most a few analyzed frames)
+    max_fps = max(t[3] for t in tasks)
+    events = merge_split_events(
+        [e for r in results for e in r["events"]], gap_seconds=2 * options["stride"] / max_fps
+    )
+    events_path = write_events(events, args.out, args.format)
+
+    elapsed = time.time() - started
+    processed = sum(r["processed"] for r in results)
+    summary = {
+        "files": len(videos),
+        "tasks": len(tasks),
+        "failed_tasks": len(tasks) - len(results),
+        "frames_analyzed": processed,
+        "seconds": round(elapsed, 1),
+        "fps": round(processed / elapsed, 1) if elapsed else 0.0,
+        "events": len(events),
+        "events_by_stage": {s: sum(e["stage"] == s for e in events) for s in args.stages},
+        "events_file": events_path,
+    }
+    with open(os.path.join(args.out, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"[INFO] {len(events)} events -> {events_path} ({summary['fps']} fps overall)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
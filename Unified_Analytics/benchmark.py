@@ -0,0 +1,468 @@
+"""
+CPU benchmark for the PPE, crowd, motion and unified pipelines.
+
+    python benchmark.py --pipelines ppe crowd --resolutions 640x360 1280x720 --out bench.json
+    python benchmark.py --out new.json --compare bench.json
+
+Replays a video clip (or a synthetic one, generated with a fixed seed) through
+the same path a live camera takes: decode, resize, predictor.predict (with
+overlay encoding, as in the broadcaster), the app's *VideoTrack.recv, then
+YUV conversion and H.264 encoding. Every pipeline/resolution case runs in a
+fresh process so model loading and peak RSS don't leak between cases.
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import functools
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# CPU only, set before torch gets imported through ultralytics
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+import cv2
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The shared modules (common/) and the predictors of the sibling projects live at the repo root
+ROOT_DIR = os.path.dirname(BASE_DIR)
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+PIPELINES = ("ppe", "crowd", "motion", "unified")
+STAGES = ("decode", "resize", "gate", "inference", "postprocess", "annotate",
+          "recv", "color_convert", "encode", "predict", "total")
+
+
+class StageTimer:
+    """
+    Per-frame stage timings in milliseconds. Nested calls of the same stage
+    (e.g. r.plot inside _draw) are only counted once.
+    """
+
+    def __init__(self):
+        self.samples = collections.defaultdict(list)
+        self._frame = collections.defaultdict(float)
+        self._depth = collections.Counter()
+
+    @contextlib.contextmanager
+    def time(self, stage):
+        self._depth[stage] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth[stage] -= 1
+            if not self._depth[stage]:
+                self._frame[stage] += (time.perf_counter() - started) * 1000
+
+    def wrap(self, fn, stage):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            with self.time(stage):
+                return fn(*args, **kwargs)
+        return timed
+
+    def end_frame(self):
+        frame = self._frame
+        # Whatever predict() spends outside the gate, the model and drawing
+        if "predict" in frame:
+            frame["postprocess"] = max(
+                0.0, frame["predict"] - frame["gate"] - frame["inference"] - frame["annotate"]
+            )
+        for stage, ms in frame.items():
+            # Skipped stages (gate said no, nothing drawn) don't count as 0 ms samples
+            if ms or stage in ("predict", "total"):
+                self.samples[stage].append(ms)
+        self._frame = collections.defaultdict(float)
+
+    def reset(self):
+        self.samples.clear()
+        self._frame = collections.defaultdict(float)
+
+    def summary(self):
+        report = {}
+        for stage in STAGES:
+            values = self.samples.get(stage)
+            if not values:
+                continue
+            values = np.asarray(values)
+            report[stage] = {
+                "count": len(values),
+                "mean_ms": round(float(values.mean()), 3),
+                "p50_ms": round(float(np.percentile(values, 50)), 3),
+                "p90_ms": round(float(np.percentile(values, 90)), 3),
+                "p99_ms": round(float(np.percentile(values, 99)), 3),
+                "max_ms": round(float(values.max()), 3),
+            }
+        return report
+
+
+class _TimedModel:
+    # Model wrapper: inference time, plus annotate time for the results' plot()
+    def __init__(self, model, timer):
+        self.model = model
+        self.names = model.names
+        self.timer = timer
+
+    def __call__(self, *args, **kwargs):
+        with self.timer.time("inference"):
+            results = self.model(*args, **kwargs)
+            # stream=True returns a generator; the work happens while it's consumed
+            if kwargs.get("stream"):
+                results = list(results)
+        for r in results:
+            r.plot = self.timer.wrap(r.plot, "annotate")
+        return results
+
+
+class _QuietAlerts:
+    # No snapshots or sounds while benchmarking
+    def snapshot(self, path, frame, on_saved=None, event=None):
+        pass
+
+    def record(self, camera_id, type, **fields):
+        pass
+
+    def play(self, sound):
+        pass
+
+
+class _ReplayBroadcaster:
+    # Stands in for the FrameBroadcaster so the real track's recv() can be driven frame by frame
+    camera_id = "benchmark"
+
+    def __init__(self):
+        self.latest = None
+        self.latest_overlay = None
+        self.seq = 0
+
+    def subscribe(self):
+        pass
+
+    def unsubscribe(self):
+        pass
+
+    def publish(self, frame, overlay):
+        self.seq += 1
+        self.latest = frame
+        if overlay is not None:
+            self.latest_overlay = f'{{"seq": {self.seq}, "overlay": {overlay}}}'
+
+    async def wait_frame(self, last_seq):
+        return self.latest, self.seq
+
+
+# --- Case setup (runs in the benchmark worker process) ---
+
+def _build(name, options):
+    """Returns (predictor, track_class) the same way the app's main.py builds them."""
+    from common.model_cache import get_model
+    from common.motion_gate import MotionGate
+
+    person_model = options["person_model"]
+    ppe_model = options["ppe_model"]
+    backend = options["backend"]
+    draw = options["overlays"] != "client"
+    gate = MotionGate() if options["motion_gate"] else None
+    alerts = _QuietAlerts()
+
+    if name == "ppe":
+        from PPE_Detection.ppe_prediction import PPEPredictor
+        from PPE_Detection.webrtc.video_track import PPEVideoTrack
+        predictor = PPEPredictor(model=get_model(ppe_model, "detect", backend=backend), gate=gate,
+                                 alerts=alerts, draw_overlays=draw, audio=False)
+        return predictor, PPEVideoTrack
+    if name == "crowd":
+        from Crowd_Management_System.crowd_management import CrowdManager
+        from Crowd_Management_System.webrtc.crowd_track import CrowdVideoTrack
+        predictor = CrowdManager(model=get_model(person_model, backend=backend), gate=gate,
+                                 alerts=alerts, draw_overlays=draw, audio=False)
+        return predictor, CrowdVideoTrack
+    if name == "motion":
+        from common.clip_recorder import NullRecorder
+        from Motion_Detection.motion_detection import MotionPredictor
+        from Motion_Detection.webrtc.motion_track import MotionVideoTrack
+        # The motion predictor always gates; recording is left out of the measurement
+        predictor = MotionPredictor(model=get_model(person_model, backend=backend), alerts=alerts,
+                                    recorder=NullRecorder(), draw_overlays=draw, audio=False)
+        return predictor, MotionVideoTrack
+
+    from common.clip_recorder import NullRecorder
+    from analytics_pipeline import build_pipeline
+    from webrtc.analytics_track import AnalyticsVideoTrack
+    predictor = build_pipeline(
+        "bench", person_model=get_model(person_model, backend=backend),
+        ppe_model=get_model(ppe_model, "detect", backend=backend),
+        motion_gate=options["motion_gate"], alerts=alerts, draw_overlays=draw,
+        audio=False, recorder=NullRecorder(),
+    )
+    return predictor, AnalyticsVideoTrack
+
+
+def _instrument(predictor, timer):
+    """Wraps the models, motion gates and drawing code of a predictor (or pipeline) in timers."""
+    parts = [predictor] + [stage.predictor for stage in getattr(predictor, "stages", [])]
+    models = {}
+    gates = set()
+    for part in parts:
+        for attr in ("model", "person_model"):
+            model = getattr(part, attr, None)
+            if model is not None:
+                if id(model) not in models:
+                    models[id(model)] = _TimedModel(model, timer)
+                setattr(part, attr, models[id(model)])
+
+        gate = getattr(part, "gate", None)
+        if gate is not None and id(gate) not in gates:
+            gates.add(id(gate))
+            gate.should_infer = timer.wrap(gate.should_infer, "gate")
+
+        if hasattr(part, "_draw"):
+            part._draw = timer.wrap(part._draw, "annotate")
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Windows: psutil reports the peak working set
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / 2 ** 20, 1)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+
+
+def run_case(name, resolution, clip, options):
+    import av
+    from common.broadcaster import _process_frame
+    from common.shared_encoder import SharedEncoder, VIDEO_TIME_BASE
+
+    if options["threads"]:
+        cv2.setNumThreads(options["threads"])
+        import torch
+        torch.set_num_threads(options["threads"])
+
+    timer = StageTimer()
+    predictor, track_class = _build(name, options)
+    _instrument(predictor, timer)
+
+    replay = _ReplayBroadcaster()
+    track = track_class(replay)
+    frame_index = 0
+
+    async def next_timestamp():
+        # Same clock as the track, without the real-time pacing sleep
+        return frame_index * 90000 // 20, VIDEO_TIME_BASE
+
+    track.next_timestamp = next_timestamp
+    encoder = SharedEncoder(replay, name="bench")
+    loop = asyncio.new_event_loop()
+    width, height = resolution
+
+    cap = cv2.VideoCapture(clip)
+    warmup, frames = options["warmup"], options["frames"]
+    started = None
+    for frame_index in range(warmup + frames):
+        if frame_index == warmup:
+            timer.reset()
+            started = time.perf_counter()
+
+        with timer.time("total"):
+            with timer.time("decode"):
+                ok, frame = cap.read()
+                if not ok:
+                    # Loop the clip
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    ok, frame = cap.read()
+            with timer.time("resize"):
+                if frame.shape[1] != width or frame.shape[0] != height:
+                    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+            with timer.time("predict"):
+                processed, _, overlay, _ = _process_frame(frame, predictor)
+            replay.publish(processed, overlay)
+            with timer.time("recv"):
+                video_frame = loop.run_until_complete(track.recv())
+            with timer.time("color_convert"):
+                yuv = video_frame.reformat(format="yuv420p")
+                yuv.pts = video_frame.pts
+                yuv.time_base = video_frame.time_base
+            with timer.time("encode"):
+                encoder._encode(av, yuv)
+        timer.end_frame()
+
+    elapsed = time.perf_counter() - started
+    cap.release()
+    loop.close()
+
+    gate = getattr(predictor, "gate", None)
+    return {
+        "pipeline": name,
+        "resolution": f"{width}x{height}",
+        "frames": frames,
+        "fps": round(frames / elapsed, 2),
+        "peak_rss_mb": _peak_rss_mb(),
+        "gate": gate.stats() if gate is not None else None,
+        "stages": timer.summary(),
+    }
+
+
+# --- Driver ---
+
+def synthetic_clip(path, frames=150, size=(1280, 720), fps=20, seed=0):
+    """Moving rectangles over fixed noise, deterministic for a given seed."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    background = rng.integers(0, 80, (height, width, 3), dtype=np.uint8)
+    # Large, fast shapes so the motion gate passes at every benchmarked resolution
+    shapes = [(rng.integers(0, width), rng.integers(0, height),
+               rng.choice([-1, 1]) * rng.integers(20, 40), rng.choice([-1, 1]) * rng.integers(10, 25),
+               tuple(int(c) for c in rng.integers(80, 255, 3))) for _ in range(6)]
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, size)
+    for i in range(frames):
+        frame = background.copy()
+        for x, y, dx, dy, color in shapes:
+            cx, cy = int((x + dx * i) % width), int((y + dy * i) % height)
+            cv2.rectangle(frame, (cx, cy), (cx + width // 5, cy + height // 3), color, -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def _parse_resolution(text):
+    try:
+        width, height = (int(v) for v in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    if width % 2 or height % 2:
+        raise argparse.ArgumentTypeError("width and height must be even (yuv420p)")
+    return width, height
+
+
+def _environment():
+    versions = {"python": platform.python_version(), "numpy": np.__version__, "opencv": cv2.__version__}
+    for module in ("torch", "ultralytics", "av", "aiortc"):
+        try:
+            versions[module] = __import__(module).__version__
+        except Exception:
+            versions[module] = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions,
+    }
+
+
+def compare(baseline, report, tolerance):
+    """Prints fps and p50 changes against an earlier report; returns the number of regressions."""
+    old = {(r["pipeline"], r["resolution"]): r for r in baseline["results"]}
+    regressions = 0
+    for result in report["results"]:
+        before = old.get((result["pipeline"], result["resolution"]))
+        if before is None:
+            continue
+        label = f"{result['pipeline']} {result['resolution']}"
+        change = (result["fps"] - before["fps"]) / before["fps"] if before["fps"] else 0.0
+        if change < -tolerance:
+            regressions += 1
+            print(f"[WARN] {label}: fps {before['fps']} -> {result['fps']} ({change:+.0%})")
+        else:
+            print(f"[INFO] {label}: fps {before['fps']} -> {result['fps']} ({change:+.0%})")
+        for stage, stats in result["stages"].items():
+            old_stats = before["stages"].get(stage)
+            if not old_stats or not old_stats["p50_ms"]:
+                continue
+            change = (stats["p50_ms"] - old_stats["p50_ms"]) / old_stats["p50_ms"]
+            if change > tolerance:
+                regressions += 1
+                print(f"[WARN]   {stage}: p50 {old_stats['p50_ms']} -> {stats['p50_ms']} ms ({change:+.0%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analytics pipelines on CPU.")
+    parser.add_argument("--pipelines", nargs="+", default=list(PIPELINES), choices=PIPELINES)
+    parser.add_argument("--resolutions", nargs="+", type=_parse_resolution,
+                        default=[(640, 360), (1280, 720)], help="WIDTHxHEIGHT, e.g. 640x360")
+    parser.add_argument("--clip", help="video to replay (default: synthetic clip)")
+    parser.add_argument("--frames", type=int, default=200, help="measured frames per case")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured frames per case")
+    parser.add_argument("--threads", type=int, default=0, help="OpenCV/torch threads (0: library default)")
+    parser.add_argument("--no-motion-gate", action="store_true", help="run the detectors on every frame")
+    parser.add_argument("--overlays", choices=("server", "client"), default="server")
+    parser.add_argument("--person-model", default=os.environ.get("PERSON_MODEL", "yolov8n.pt"))
+    parser.add_argument("--ppe-model", default=os.environ.get("PPE_MODEL", "best.onnx"))
+    parser.add_argument("--backend", choices=("ultralytics", "onnxruntime"),
+                        default=os.environ.get("INFERENCE_BACKEND", "ultralytics"))
+    parser.add_argument("--out", default="benchmark.json", help="JSON report path")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown before a regression")
+    args = parser.parse_args(argv)
+
+    options = {
+        "frames": args.frames,
+        "warmup": args.warmup,
+        "threads": args.threads,
+        "motion_gate": not args.no_motion_gate,
+        "overlays": args.overlays,
+        "person_model": args.person_model,
+        "ppe_model": args.ppe_model,
+        "backend": args.backend,
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        clip = args.clip or synthetic_clip(os.path.join(tmp, "synthetic.avi"))
+        results = []
+        for name in args.pipelines:
+            for resolution in args.resolutions:
+                print(f"[INFO] Benchmarking {name} at {resolution[0]}x{resolution[1]}")
+                # Fresh (spawned) process per case: clean model cache and peak RSS
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    try:
+                        result = pool.submit(run_case, name, resolution, clip, options).result()
+                    except Exception as e:
+                        print(f"[ERROR] {name} {resolution[0]}x{resolution[1]} failed: {e}")
+                        continue
+                results.append(result)
+                total = result["stages"]["total"]
+                print(f"[INFO]   {result['fps']} fps, p50 {total['p50_ms']} ms, "
+                      f"p99 {total['p99_ms']} ms, peak RSS {result['peak_rss_mb']} MB")
+
+    report = {
+        "environment": _environment(),
+        "options": dict(options, clip=args.clip or "synthetic"),
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[INFO] Report written to {args.out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, report, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
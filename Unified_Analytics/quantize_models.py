@@ -0,0 +1,266 @@
+"""
+Exports the detection models to ONNX and quantizes them to INT8 for the
+onnxruntime backend (INFERENCE_BACKEND=onnxruntime).
+
+    python quantize_models.py yolov8n.pt ../PPE_Detection/best.onnx --calib /footage/site-a
+
+--dynamic exports with a dynamic batch axis and input size, so batched
+cross-camera inference (BATCH_MAX_SIZE > 1) runs in one ORT call and the
+load controller can lower imgsz; the default static batch-1 export runs
+batches frame by frame.
+
+For each model:
+1. .pt weights are exported to ONNX (needs ultralytics + torch, once).
+2. Static INT8 quantization (QDQ, per-channel weights), calibrated on
+   frames from --calib: images and/or videos from the target cameras.
+3. FP32 and INT8 are compared on held-out frames: latency, and how well
+   the INT8 detections agree with FP32 (precision/recall at IoU 0.5).
+
+The quantized model is written next to the original as <name>.int8.onnx;
+point PERSON_MODEL / PPE_MODEL (or a camera's "model") at it to use it.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# The shared modules (common/) live at the repo root
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.append(ROOT_DIR)
+
+from common.onnx_engine import OnnxYolo
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv", ".mov", ".m4v", ".ts")
+
+
+def export_onnx(path, imgsz, dynamic=False):
+    if path.endswith(".onnx"):
+        return path
+    from ultralytics import YOLO
+
+    print(f"[INFO] Exporting {path} to ONNX")
+    # Static shape and batch 1 lets the engine bind a preallocated output buffer;
+    # dynamic batch and size let it run cross-camera batches in one call and change imgsz
+    return YOLO(path).export(format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=True)
+
+
+def load_frames(paths, limit, per_video=50):
+    """Images as-is, videos sampled evenly (per_video frames each)."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files += [os.path.join(root, n) for n in sorted(names)]
+        else:
+            files.append(path)
+
+    frames = []
+    for path in files:
+        ext = os.path.splitext(path)[1].lower()
+        if ext in IMAGE_EXTENSIONS:
+            frame = cv2.imread(path)
+            if frame is not None:
+                frames.append(frame)
+        elif ext in VIDEO_EXTENSIONS:
+            cap = cv2.VideoCapture(path)
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            for index in np.linspace(0, max(total - 1, 0), min(per_video, max(total, 1))).astype(int):
+                cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+                ok, frame = cap.read()
+                if ok:
+                    frames.append(frame)
+            cap.release()
+        if len(frames) >= limit:
+            break
+    return frames[:limit]
+
+
+def _head_nodes(model_path):
+    """
+    Non-Conv nodes of the detection head (box decoding: DFL softmax, strides,
+    concat). These are the ones INT8 hurts most, so they stay in float.
+    """
+    import onnx
+
+    graph = onnx.load(model_path).graph
+    outputs = {o.name for o in graph.output}
+    last = next((n for n in graph.node if outputs.intersection(n.output)), None)
+    if last is None or not last.name.startswith("/"):
+        return []
+    # "/model.22/Concat_5" -> "/model.22/"
+    prefix = "/" + last.name.split("/")[1] + "/"
+    return [n.name for n in graph.node if n.name.startswith(prefix) and n.op_type != "Conv"]
+
+
+def quantize(fp32_path, int8_path, frames, keep_head=True):
+    import onnx
+    from onnxruntime.quantization import (
+        CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    # Calibration inputs get exactly the engine's preprocessing (letterbox, RGB, /255)
+    engine = OnnxYolo(fp32_path)
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._frames = iter(frames)
+
+        def get_next(self):
+            frame = next(self._frames, None)
+            if frame is None:
+                return None
+            engine._letterbox(frame)
+            return {engine.input_name: engine._input.copy()}
+
+    # Shape inference + graph cleanup first, as ORT recommends before static quantization
+    prepared = int8_path + ".prep.onnx"
+    try:
+        quant_pre_process(fp32_path, prepared)
+    except Exception as e:
+        print(f"[WARN] Pre-processing skipped: {e}")
+        prepared = fp32_path
+
+    excluded = _head_nodes(prepared) if keep_head else []
+    print(f"[INFO] Quantizing {fp32_path} on {len(frames)} frames ({len(excluded)} head nodes kept in float)")
+    try:
+        quantize_static(
+            prepared, int8_path, _Reader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            weight_type=QuantType.QInt8,
+            activation_type=QuantType.QUInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+            nodes_to_exclude=excluded,
+        )
+    finally:
+        if prepared != fp32_path and os.path.exists(prepared):
+            os.remove(prepared)
+
+    # Keep the class names (and other export metadata) the engine reads
+    source, quantized = onnx.load(fp32_path), onnx.load(int8_path)
+    present = {p.key for p in quantized.metadata_props}
+    for prop in source.metadata_props:
+        if prop.key not in present:
+            quantized.metadata_props.append(prop)
+    onnx.save(quantized, int8_path)
+    return int8_path
+
+
+def _iou(a, b):
+    # (N, 4) x (M, 4) -> (N, M)
+    tl = np.maximum(a[:, None, :2], b[None, :, :2])
+    br = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(br - tl, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def _agreement(reference, candidate, threshold=0.5):
+    """Greedy same-class matching; returns matched pairs."""
+    if not len(reference) or not len(candidate):
+        return 0
+    iou = _iou(candidate[:, :4], reference[:, :4])
+    iou[candidate[:, 5][:, None] != reference[:, 5][None, :]] = 0
+    matched = 0
+    for i in np.argsort(-candidate[:, 4]):
+        j = int(iou[i].argmax())
+        if iou[i, j] >= threshold:
+            matched += 1
+            iou[:, j] = 0
+    return matched
+
+
+def _timed_run(engine, frames, warmup=5):
+    for frame in frames[:warmup]:
+        engine(frame)
+    times, detections = [], []
+    for frame in frames:
+        started = time.perf_counter()
+        result = engine(frame)[0]
+        times.append((time.perf_counter() - started) * 1000)
+        detections.append(result.boxes.data.copy())
+    times = np.asarray(times)
+    return detections, {
+        "mean_ms": round(float(times.mean()), 2),
+        "p50_ms": round(float(np.percentile(times, 50)), 2),
+        "p90_ms": round(float(np.percentile(times, 90)), 2),
+        "fps": round(1000 / float(times.mean()), 1),
+    }
+
+
+def evaluate(fp32_path, int8_path, frames, threads=None, conf=0.25):
+    fp32 = OnnxYolo(fp32_path, conf=conf, intra_threads=threads)
+    int8 = OnnxYolo(int8_path, conf=conf, intra_threads=threads)
+    reference, fp32_speed = _timed_run(fp32, frames)
+    candidate, int8_speed = _timed_run(int8, frames)
+
+    matched = sum(_agreement(r, c) for r, c in zip(reference, candidate))
+    n_ref = sum(len(r) for r in reference)
+    n_cand = sum(len(c) for c in candidate)
+    precision = matched / n_cand if n_cand else 1.0
+    recall = matched / n_ref if n_ref else 1.0
+    return {
+        "frames": len(frames),
+        "fp32": dict(fp32_speed, size_mb=round(os.path.getsize(fp32_path) / 2 ** 20, 2), detections=n_ref),
+        "int8": dict(int8_speed, size_mb=round(os.path.getsize(int8_path) / 2 ** 20, 2), detections=n_cand),
+        "speedup": round(fp32_speed["mean_ms"] / int8_speed["mean_ms"], 2),
+        # FP32 detections stand in for ground truth: this measures what quantization changed
+        "agreement": {
+            "precision": round(precision, 3),
+            "recall": round(recall, 3),
+            "f1": round(2 * precision * recall / (precision + recall), 3) if precision + recall else 0.0,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export YOLO models to ONNX and quantize them to INT8.")
+    parser.add_argument("models", nargs="+", help=".pt or .onnx detection models")
+    parser.add_argument("--calib", nargs="+", required=True, help="calibration images/videos or folders")
+    parser.add_argument("--calib-frames", type=int, default=200)
+    parser.add_argument("--eval-frames", type=int, default=50, help="held-out frames for the report")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--dynamic", action="store_true",
+                        help="export with dynamic batch and input size (for BATCH_MAX_SIZE > 1 and adaptive imgsz)")
+    parser.add_argument("--threads", type=int, default=0, help="ORT intra-op threads for the report (0: auto)")
+    parser.add_argument("--quantize-head", action="store_true", help="also quantize the box decoding nodes")
+    parser.add_argument("--report", default="quantization_report.json")
+    args = parser.parse_args(argv)
+
+    frames = load_frames(args.calib, args.calib_frames + args.eval_frames)
+    if len(frames) < 10:
+        print("[ERROR] Need at least 10 calibration frames")
+        return 1
+    random.Random(0).shuffle(frames)
+    eval_count = min(args.eval_frames, len(frames) // 5)
+    eval_frames, calib_frames = frames[:eval_count], frames[eval_count:]
+
+    report = {}
+    for model in args.models:
+        fp32_path = export_onnx(model, args.imgsz, args.dynamic)
+        int8_path = os.path.splitext(fp32_path)[0] + ".int8.onnx"
+        quantize(fp32_path, int8_path, calib_frames, keep_head=not args.quantize_head)
+
+        result = evaluate(fp32_path, int8_path, eval_frames, threads=args.threads)
+        report[model] = dict(result, fp32_path=fp32_path, int8_path=int8_path)
+        print(f"[INFO] {model}: {result['fp32']['mean_ms']} -> {result['int8']['mean_ms']} ms "
+              f"(x{result['speedup']}), agreement P={result['agreement']['precision']} "
+              f"R={result['agreement']['recall']} -> {int8_path}")
+
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"[INFO] Report written to {args.report}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
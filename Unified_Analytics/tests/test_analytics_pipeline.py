@@ -0,0 +1,78 @@
+import os
+import sys
+
+import numpy as np
+
+# The app directory and the repo root (shared common/ package, sibling predictors)
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [APP_DIR, os.path.dirname(APP_DIR)]
+
+from analytics_pipeline import build_pipeline  # noqa: E402
+from common import motion_gate  # noqa: E402
+from common.onnx_engine import Results  # noqa: E402
+
+
+class _Model:
+    # Counts forward passes and finds nothing
+    def __init__(self, names):
+        self.names = names
+        self.calls = 0
+
+    def __call__(self, frame, **kwargs):
+        self.calls += 1
+        return [Results(frame.shape[:2], self.names, np.zeros((0, 6), dtype=np.float32))]
+
+
+class _Alerts:
+    def play(self, sound):
+        pass
+
+    def snapshot(self, path, frame, on_saved=None, event=None):
+        pass
+
+    def record(self, camera_id, type, **fields):
+        pass
+
+
+class _Clock:
+    # Stands in for the time module inside the gate: 8 frames per second
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def test_static_clip_refreshes_every_stage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    clock = _Clock()
+    monkeypatch.setattr(motion_gate, "time", clock)
+    person_model = _Model({0: "person"})
+    ppe_model = _Model({0: "helmet", 1: "no_helmet"})
+    pipeline = build_pipeline("cam", ("crowd", "ppe"), person_model=person_model, ppe_model=ppe_model,
+                              gate_force_interval=1.0, alerts=_Alerts(), draw_overlays=False, audio=False)
+
+    scene = np.full((120, 160, 3), 80, dtype=np.uint8)
+    for _ in range(41):
+        # A new frame object each time, with the same content: a static scene
+        pipeline.predict(scene.copy())
+        clock.now += 0.125
+
+    gate = pipeline.gate
+    assert gate.frames == 41
+    # A forced refresh every second (8 frames) from the first frame on; both stages get each one
+    assert gate.forced == 6
+    assert person_model.calls == 6
+    assert ppe_model.calls == person_model.calls
+
+
+def test_gate_decides_once_per_frame():
+    gate = motion_gate.MotionGate(force_interval=None)
+    first, second = np.zeros((40, 40, 3), dtype=np.uint8), np.zeros((40, 40, 3), dtype=np.uint8)
+
+    assert gate.should_infer(first) is False
+    # Same frame: same answer, not counted again; keep_alive still asks for a pass
+    assert gate.should_infer(first) is False
+    assert gate.should_infer(first, keep_alive=True) is True
+    assert gate.should_infer(second) is False
+    assert (gate.frames, gate.skipped, gate.inferences) == (2, 2, 0)
@@ -0,0 +1,46 @@
+import time
+
+from av import VideoFrame
+from aiortc import VideoStreamTrack
+
+from common import metrics
+
+class AnalyticsVideoTrack(VideoStreamTrack):
+    kind = "video"
+
+    def __init__(self, broadcaster):
+        super().__init__()
+        # Shared producer: capture + every analytics stage run once for all viewers
+        self.broadcaster = broadcaster
+        self.last_seq = 0
+        self.broadcaster.subscribe()
+
+        # Optional RTCDataChannel carrying the detections for client-side overlays
+        self.channel = None
+
+    async def recv(self):
+        pts, time_base = await self.next_timestamp()
+
+        started = time.perf_counter()
+        # Wait for the newest frame (BGR, annotated unless overlays are drawn client-side)
+        frame, self.last_seq = await self.broadcaster.wait_frame(self.last_seq)
+        camera_id = self.broadcaster.camera_id
+        metrics.observe(camera_id, "recv_wait", time.perf_counter() - started)
+        started = time.perf_counter()
+
+        # The matching detections go out on the data channel, if the viewer opened one
+        overlay = self.broadcaster.latest_overlay
+        if self.channel is not None and self.channel.readyState == "open" and overlay is not None:
+            self.channel.send(overlay)
+
+        video_frame = VideoFrame.from_ndarray(frame, format="bgr24")
+        video_frame.pts = pts
+        video_frame.time_base = time_base
+        metrics.observe(camera_id, "recv", time.perf_counter() - started)
+
+        return video_frame
+
+    def stop(self):
+        if self.readyState != "ended":
+            self.broadcaster.unsubscribe()
+        super().stop()
@@ -0,0 +1 @@
+"""Modules shared by the PPE, motion, crowd and unified analytics apps."""
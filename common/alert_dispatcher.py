@@ -0,0 +1,207 @@
+import asyncio
+import multiprocessing.util
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from common import metrics
+from common.event_store import EventStore
+
+# HEADLESS=1: servers without a sound card; pygame/SDL audio is never touched
+HEADLESS = os.environ.get("HEADLESS", "0") == "1"
+
+
+def load_sound(path="alert.mp3", **mixer_options):
+    """
+    Alert sound for AlertDispatcher.play(), or None when headless, without
+    an audio device or without the file. Never raises: alerts still go out
+    as snapshots and socket events. The mixer is set up once per process
+    (mixer_options go to pygame.mixer.pre_init, e.g. frequency=44100).
+    """
+    if HEADLESS:
+        return None
+    try:
+        import pygame
+
+        if not pygame.mixer.get_init():
+            if mixer_options:
+                pygame.mixer.pre_init(**mixer_options)
+            pygame.mixer.init()
+        return pygame.mixer.Sound(path)
+    except Exception as e:
+        print(f"[WARN] Alert sound disabled ({path}): {e}")
+        return None
+
+
+class AlertDispatcher:
+    """
+    Takes alert side effects off the video path. Snapshot writes and alert
+    sounds go through a bounded queue to a small pool of worker threads
+    (when full, jobs are dropped and counted). Socket.io events are
+    coalesced per (camera, event): at most one emit per window, with the
+    number of suppressed alerts attached to the next one.
+
+    With an EventStore, every saved snapshot (and every record() call, e.g.
+    for clips) is also indexed there for the /events queries.
+    """
+
+    def __init__(self, sio=None, queue_size=64, workers=1, coalesce_seconds=2.0, jpeg_quality=90, events=None):
+        self.sio = sio
+        self.events = events
+        self.coalesce_seconds = coalesce_seconds
+        self.jpeg_quality = jpeg_quality
+
+        self._jobs = queue.Queue(maxsize=queue_size)
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f"alert-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for t in self._workers:
+            t.start()
+
+        # Coalescing state (event loop side): key -> last emit time / pending payload
+        self._last_emit = {}
+        self._pending = {}
+
+        # Counters
+        self.snapshots = 0
+        self.sounds = 0
+        self.dropped = 0
+        self.failed = 0
+        self.emitted = 0
+        self.coalesced = 0
+
+    # --- Side effects (any thread) ---
+
+    def snapshot(self, path, frame, on_saved=None, event=None):
+        """
+        Queues a JPEG write. The caller must not modify `frame` afterwards.
+        event: {"camera_id", "type", "count", "boxes", "details"} to index the snapshot under.
+        """
+        if event is not None and self.events is not None:
+            on_saved = self._indexer(event, frame, on_saved)
+        self._submit(("snapshot", path, frame, on_saved))
+
+    def _indexer(self, event, frame, on_saved):
+        def saved(path):
+            self.events.record(path=path, image=frame, **event)
+            if on_saved is not None:
+                on_saved(path)
+        return saved
+
+    def record(self, camera_id, type, **fields):
+        """Indexes an event that has no snapshot (e.g. a motion clip)."""
+        if self.events is not None:
+            self.events.record(camera_id, type, **fields)
+
+    def play(self, sound):
+        if sound is not None:
+            self._submit(("sound", sound, None, None))
+
+    def _submit(self, job):
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            self.dropped += 1
+
+    def _worker_loop(self):
+        while True:
+            kind, target, frame, on_saved = self._jobs.get()
+            try:
+                if kind == "snapshot":
+                    started = time.perf_counter()
+                    ok = cv2.imwrite(target, frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+                    metrics.observe(None, "snapshot_write", time.perf_counter() - started)
+                    if ok:
+                        self.snapshots += 1
+                        print(f"[ALERT] Screenshot saved to: {target}")
+                        if on_saved is not None:
+                            on_saved(target)
+                    else:
+                        self.failed += 1
+                        print(f"[ERROR] Could not save screenshot to {target}")
+                elif kind == "sound":
+                    target.play()
+                    self.sounds += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[ERROR] Alert job failed: {e}")
+
+    # --- Socket events (event loop thread) ---
+
+    def emit(self, event, payload, camera_id=None):
+        if self.sio is None:
+            return
+
+        key = (camera_id, event)
+        now = time.time()
+        if now - self._last_emit.get(key, 0) >= self.coalesce_seconds:
+            self._send(key, event, payload, 0)
+            return
+
+        # Inside the window: keep only the newest payload and flush it later
+        self.coalesced += 1
+        pending = self._pending.get(key)
+        if pending is None:
+            delay = self._last_emit[key] + self.coalesce_seconds - now
+            asyncio.get_event_loop().call_later(delay, self._flush, key)
+            self._pending[key] = [event, payload, 1]
+        else:
+            pending[1] = payload
+            pending[2] += 1
+
+    def _flush(self, key):
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            event, payload, suppressed = pending
+            self._send(key, event, payload, suppressed)
+
+    def _send(self, key, event, payload, suppressed):
+        self._last_emit[key] = time.time()
+        self.emitted += 1
+        asyncio.ensure_future(self.sio.emit(event, dict(payload, coalesced=suppressed)))
+
+    def stats(self):
+        stats = {
+            "queue": self._jobs.qsize(),
+            "snapshots": self.snapshots,
+            "sounds": self.sounds,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "emitted": self.emitted,
+            "coalesced": self.coalesced,
+        }
+        if self.events is not None:
+            stats["events"] = self.events.stats()
+        return stats
+
+
+# --- Inference worker processes ---
+
+_process_alerts = None
+
+
+def process_alerts(events_path):
+    """
+    The AlertDispatcher of an inference worker process. Its snapshots are
+    indexed in the app's event database through the worker's own EventStore
+    (SQLite in WAL mode takes writes from several processes). Created once
+    per process and flushed when the worker exits.
+    """
+    global _process_alerts
+    if _process_alerts is None:
+        events = EventStore(events_path)
+        _process_alerts = AlertDispatcher(events=events)
+        multiprocessing.util.Finalize(None, events.close, exitpriority=10)
+    return _process_alerts
+
+
+def with_alerts(factory, events_path, *args, **kwargs):
+    """
+    Predictor factory for process workers: factory(*args, **kwargs) with
+    alerts=process_alerts(events_path). Wrap it in functools.partial.
+    """
+    return factory(*args, alerts=process_alerts(events_path), **kwargs)
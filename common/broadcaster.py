@@ -0,0 +1,322 @@
+import asyncio
+import collections
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from common import frame_bus, metrics
+
+
+class LatestFrameQueue:
+    """
+    Bounded, thread-safe queue that drops the oldest item when full, so a
+    busy consumer always gets the freshest frames.
+    """
+
+    def __init__(self, maxsize=2):
+        self._items = collections.deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items, timeout):
+                return None
+            return self._items.popleft()
+
+    def clear(self):
+        with self._cond:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+# --- Worker side (runs in a pool thread or in a child process) ---
+
+_worker_predictor = None
+
+
+def _init_process_worker(predictor_factory):
+    # Each process builds its own predictor: YOLO models and pygame can't be pickled
+    global _worker_predictor
+    _worker_predictor = predictor_factory()
+
+
+def _process_frame(frame, predictor=None):
+    predictor = predictor or _worker_predictor
+    started = time.perf_counter()
+    processed, flag = predictor.predict(frame)
+    # Timings travel back with the result so process workers are measured too
+    timings = dict(getattr(predictor, "last_timings", None) or {})
+    timings["predict"] = time.perf_counter() - started
+    # Multi-stage pipelines report a dict of per-stage flags
+    if not isinstance(flag, dict):
+        flag = bool(flag)
+
+    # Detections for client-side drawing, JSON-encoded here rather than on the event loop
+    overlay = getattr(predictor, "last_overlay", None)
+    if overlay is not None:
+        layers = overlay if isinstance(overlay, list) else [overlay]
+        overlay = json.dumps({
+            "size": [frame.shape[1], frame.shape[0]],
+            "drawn": getattr(predictor, "draw_overlays", True),
+            "layers": layers,
+        })
+
+    # Frames stay BGR: the video encoder converts straight to YUV, no RGB pass needed
+    return processed, flag, overlay, timings
+
+
+def _process_shared(ticket):
+    # Frame bus ticket: the predictor reads the shared slot in place and the
+    # annotated frame goes back into it, so no frame is pickled either way
+    spec, slot, seq = ticket
+    ring = frame_bus.attach(spec)
+    frame = ring.view(slot, seq)
+    processed, flag, overlay, timings = _process_frame(frame)
+    if processed is not frame:
+        if not ring.fits(processed):
+            return processed, flag, overlay, timings
+        ring.write(slot, processed, seq)
+    return None, flag, overlay, timings
+
+
+class FrameBroadcaster:
+    """
+    One producer per camera. A capture thread reads frames into a bounded
+    drop-oldest queue, an inference executor (thread or process pool) runs
+    the predictor once per frame, and the latest annotated frame is handed
+    back to the event loop for every subscribed track. Nothing blocking runs
+    on the asyncio loop, so /offer and signalling stay responsive.
+
+    With the process executor, frames travel through a shared-memory
+    FrameBus (unless shared_frames=False): workers get a slot ticket instead
+    of a pickled array, and each published frame is copied out of its slot.
+    """
+
+    def __init__(self, camera, predictor, alerts=None, alert_event=None, alert_payload=None,
+                 camera_id=None, executor="thread", workers=1, queue_size=2, predictor_factory=None,
+                 shared_frames=True):
+        self.camera = camera
+        self.predictor = predictor
+        self.camera_id = camera_id
+
+        # Alerts go through the AlertDispatcher once per processed frame (not per
+        # viewer), which coalesces them per camera and event type.
+        # For multi-stage pipelines alert_event/alert_payload map stage name -> value.
+        self.alerts = alerts
+        self.alert_event = alert_event
+        self.alert_payload = alert_payload or {}
+
+        # Inference executor settings. Predictors keep state (cooldowns,
+        # previous frame, recordings) so a single worker is the safe default.
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor type: {executor}")
+        if executor == "process" and predictor_factory is None:
+            raise ValueError("Process executor needs a predictor_factory")
+        self.executor_type = executor
+        self.workers = max(1, int(workers))
+        self.predictor_factory = predictor_factory
+        self.frames = LatestFrameQueue(queue_size)
+        self.bus = frame_bus.FrameBus(self.workers) if executor == "process" and shared_frames else None
+
+        # Latest published frame (BGR) and its sequence number. latest_overlay is
+        # the matching data channel message, encoded once for every viewer.
+        self.latest = None
+        self.latest_flag = False
+        self.latest_overlay = None
+        self.seq = 0
+        self.processed = 0
+        self.fps = 0.0
+        self.predict_ms = 0.0
+        self.alert_counts = collections.Counter()
+        self._last_processed = 0.0
+
+        # Optional cap on frames sent to inference (set by the LoadController)
+        self.max_fps = None
+        self.throttled = 0
+        self._last_capture = 0.0
+
+        self.subscribers = 0
+        self._loop = None
+        self._next = None
+        self._pool = None
+        self._stop_event = None
+        self._threads = []
+
+    # --- Subscription (event loop side) ---
+
+    def subscribe(self):
+        self.subscribers += 1
+        if self._stop_event is None:
+            self.start()
+
+    def unsubscribe(self):
+        self.subscribers = max(0, self.subscribers - 1)
+        if self.subscribers == 0:
+            self.stop()
+
+    async def wait_frame(self, last_seq):
+        """
+        Returns (bgr_frame, seq) for the newest frame newer than last_seq.
+        A slow viewer simply skips frames; it never blocks the producer.
+        """
+        while self.seq <= last_seq:
+            await asyncio.shield(self._next)
+        return self.latest, self.seq
+
+    # --- Lifecycle ---
+
+    def start(self):
+        self._loop = asyncio.get_event_loop()
+        self._next = self._loop.create_future()
+
+        if self._pool is None:
+            if self.executor_type == "process":
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_process_worker,
+                    initargs=(self.predictor_factory,),
+                )
+            else:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+
+        # A fresh stop token per start, so threads from a previous run can't resume
+        self._stop_event = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, args=(self._stop_event,), name="capture", daemon=True),
+            threading.Thread(target=self._inference_loop, args=(self._stop_event,), name="inference-dispatch", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        # Non-blocking: the threads notice the token and exit on their own
+        if self._stop_event is not None:
+            self._stop_event.set()
+            self._stop_event = None
+        self.frames.clear()
+
+    def shutdown(self):
+        threads = self._threads
+        self.stop()
+        for t in threads:
+            t.join(timeout=2)
+        self._threads = []
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self.bus is not None:
+            self.bus.close()
+
+    # --- Producer threads ---
+
+    def _capture_loop(self, stop_event):
+        while not stop_event.is_set():
+            # Blocks until the camera reader has a new frame (or times out)
+            started = time.perf_counter()
+            frame = self.camera.read(timeout=0.5)
+            if frame is None:
+                continue
+            metrics.observe(self.camera_id, "read_wait", time.perf_counter() - started)
+
+            if self.max_fps:
+                now = time.time()
+                if now - self._last_capture < 1.0 / self.max_fps:
+                    self.throttled += 1
+                    continue
+                self._last_capture = now
+            self.frames.put(frame)
+
+    def _inference_loop(self, stop_event):
+        # Keep up to `workers` frames in flight and publish results in order
+        inflight = collections.deque()
+        while not stop_event.is_set():
+            while len(inflight) < self.workers:
+                frame = self.frames.get(timeout=0.1 if not inflight else 0)
+                if frame is None:
+                    break
+                ticket = self.bus.put(frame) if self.bus is not None else None
+                if ticket is not None:
+                    inflight.append((ticket, self._pool.submit(_process_shared, ticket)))
+                elif self.executor_type == "process":
+                    inflight.append((None, self._pool.submit(_process_frame, frame)))
+                else:
+                    inflight.append((None, self._pool.submit(_process_frame, frame, self.predictor)))
+
+            if not inflight:
+                continue
+
+            ticket, future = inflight.popleft()
+            try:
+                frame, flag, overlay, timings = future.result()
+            except Exception as e:
+                print(f"[ERROR] Inference failed: {e}")
+                if ticket is not None:
+                    self.bus.release(ticket)
+                continue
+
+            for stage, seconds in timings.items():
+                metrics.observe(self.camera_id, stage, seconds)
+            # Smoothed predict() time, the load signal for the LoadController
+            ms = timings["predict"] * 1000
+            self.predict_ms = 0.9 * self.predict_ms + 0.1 * ms if self.predict_ms else ms
+            self.processed += 1
+            now = time.time()
+            if self._last_processed:
+                dt = now - self._last_processed
+                if dt > 0:
+                    self.fps = 0.9 * self.fps + 0.1 * (1.0 / dt) if self.fps else 1.0 / dt
+            self._last_processed = now
+            self._loop.call_soon_threadsafe(self._publish, frame, flag, overlay, ticket)
+
+        # Stopped with frames still in flight: their slots are free once the workers are done
+        for ticket, future in inflight:
+            if ticket is not None:
+                future.add_done_callback(lambda _, ticket=ticket: self.bus.release(ticket))
+
+    # --- Publishing (event loop side) ---
+
+    def _publish(self, frame, flag, overlay=None, ticket=None):
+        if ticket is not None:
+            # Copied out of the shared slot: readers keep it while the slot is reused
+            if frame is None:
+                frame = self.bus.publish(ticket)
+            else:
+                self.bus.release(ticket)
+        self.latest = frame
+        self.latest_flag = flag
+        self.seq += 1
+        if overlay is not None:
+            self.latest_overlay = f'{{"seq": {self.seq}, "overlay": {overlay}}}'
+
+        if self.alerts is not None:
+            for event, payload in self._alerts_for(flag):
+                self.alert_counts[event] += 1
+                payload = dict(payload, timestamp=time.time())
+                self.alerts.emit(event, payload, camera_id=self.camera_id)
+
+        # Wake every waiting track, then arm the next generation
+        waiter, self._next = self._next, self._loop.create_future()
+        if not waiter.done():
+            waiter.set_result(self.seq)
+
+    def _alerts_for(self, flag):
+        if isinstance(flag, dict):
+            return [
+                (self.alert_event[name], self.alert_payload.get(name, {}))
+                for name, hit in flag.items()
+                if hit and name in (self.alert_event or {})
+            ]
+        if flag and self.alert_event:
+            return [(self.alert_event, self.alert_payload)]
+        return []
@@ -0,0 +1,178 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CameraStream:
+    """Everything that belongs to one camera: reader, predictor, broadcaster and its peers."""
+
+    def __init__(self, camera_id, config, camera, predictor, broadcaster, encoders=None):
+        self.camera_id = camera_id
+        self.config = config
+        self.camera = camera
+        self.predictor = predictor
+        self.broadcaster = broadcaster
+        # Shared H.264 encoders by quality level (empty: aiortc encodes per viewer)
+        self.encoders = encoders or {}
+        # HTTP views for dashboards, created on first request (common/http_stream.py)
+        self.mjpeg = None
+        self.hls = None
+        self.peers = set()
+        # Current adaptive quality level, set by the LoadController
+        self.quality = None
+
+    def info(self):
+        info = {
+            "id": self.camera_id,
+            "config": self.config,
+            "viewers": self.broadcaster.subscribers,
+            "camera": self.camera.stats(),
+        }
+        # How much inference the motion gate saved, if this predictor has one
+        gate = getattr(self.predictor, "gate", None)
+        if gate is not None:
+            info["gate"] = gate.stats()
+        # Track IDs, dwell time and unique visitors, if this predictor tracks people
+        tracker = getattr(self.predictor, "tracker", None)
+        if tracker is not None:
+            info["tracking"] = dict(tracker.stats(), detect_every=self.predictor.detect_every)
+        # Polygon zones and their latest counts, if this predictor counts per zone
+        zones = getattr(self.predictor, "zones", None)
+        if zones is not None:
+            info["zones"] = [
+                dict(z, count=self.predictor.zone_counts.get(z["name"], 0)) for z in zones.to_list()
+            ]
+        # Sliced inference: tiles in the layout and how many were served from cache
+        tiler = getattr(self.predictor, "tiler", None)
+        if tiler is not None:
+            info["tiling"] = tiler.stats()
+        # Clip writer state, if this predictor records clips
+        recorder = getattr(self.predictor, "recorder", None)
+        if recorder is not None:
+            info["recording"] = recorder.stats()
+        if self.quality is not None:
+            info["quality"] = dict(self.quality, predict_ms=round(self.broadcaster.predict_ms, 1),
+                                   throttled=self.broadcaster.throttled)
+        if self.encoders:
+            info["encoders"] = {name: enc.stats() for name, enc in self.encoders.items()}
+        if self.mjpeg is not None:
+            info["mjpeg"] = self.mjpeg.stats()
+        if self.hls is not None:
+            info["hls"] = self.hls.stats()
+        return info
+
+    def close(self):
+        encoders = list(self.encoders.values())
+        if self.hls is not None:
+            self.hls.close()
+            encoders.append(self.hls.encoder)
+        # HLS may share an encoder with WebRTC: close each one once
+        for encoder in {id(e): e for e in encoders}.values():
+            encoder.close()
+        self.broadcaster.shutdown()
+        self.camera.release()
+        recorder = getattr(self.predictor, "recorder", None)
+        if recorder is not None:
+            recorder.close()
+
+
+class DuplicateCameraError(ValueError):
+    """A camera with this id is already registered (or being built)."""
+
+
+class CameraRegistry:
+    """
+    Holds every camera served by this process. Streams are created through
+    the app's `build_stream(camera_id, config)` callback, which is where the
+    shared model instances get wired in.
+    """
+
+    def __init__(self, build_stream):
+        self.build_stream = build_stream
+        self.streams = {}
+        self._lock = threading.Lock()
+        # Ids being built; the build runs outside the lock so cameras can load in parallel
+        self._pending = set()
+
+    def add(self, camera_id, config):
+        camera_id = str(camera_id)
+        with self._lock:
+            if camera_id in self.streams or camera_id in self._pending:
+                raise DuplicateCameraError(f"Camera '{camera_id}' already exists")
+            self._pending.add(camera_id)
+        try:
+            stream = self.build_stream(camera_id, config)
+        finally:
+            with self._lock:
+                self._pending.discard(camera_id)
+        with self._lock:
+            self.streams[camera_id] = stream
+        print(f"[INFO] Camera '{camera_id}' registered")
+        return stream
+
+    def remove(self, camera_id):
+        with self._lock:
+            stream = self.streams.pop(str(camera_id), None)
+        if stream is None:
+            raise KeyError(f"Unknown camera '{camera_id}'")
+        print(f"[INFO] Camera '{camera_id}' removed")
+        return stream
+
+    def get(self, camera_id=None):
+        """Looks up a camera; with no id, falls back to the first registered one."""
+        with self._lock:
+            if camera_id is None:
+                if not self.streams:
+                    raise KeyError("No cameras registered")
+                return next(iter(self.streams.values()))
+            if str(camera_id) not in self.streams:
+                raise KeyError(f"Unknown camera '{camera_id}'")
+            return self.streams[str(camera_id)]
+
+    def list(self):
+        with self._lock:
+            return list(self.streams.values())
+
+    def load_file(self, path, workers=1):
+        """
+        Registers cameras from a JSON or YAML file:
+            {"cameras": [{"id": "gate-1", "rtsp_url": "rtsp://...", "webcam_index": 0}]}
+        With workers > 1 the cameras (and the models they load) are built in
+        parallel. A camera that fails to build, or an entry without an id or
+        repeating one, is reported and skipped. Returns {camera_id: error}
+        for those ("cameras[i]" for entries that have no usable id).
+        """
+        with open(path) as f:
+            if path.endswith((".yml", ".yaml")):
+                import yaml
+                data = yaml.safe_load(f)
+            else:
+                data = json.load(f)
+
+        entries, errors = {}, {}
+        for i, entry in enumerate(data.get("cameras", [])):
+            if not isinstance(entry, dict):
+                errors[f"cameras[{i}]"] = "Camera entry must be an object"
+                continue
+            entry = dict(entry)
+            camera_id = entry.pop("id", None)
+            if camera_id is None or str(camera_id) == "":
+                errors[f"cameras[{i}]"] = "Camera entry has no 'id'"
+            elif str(camera_id) in entries:
+                errors[f"cameras[{i}]"] = f"Camera '{camera_id}' already exists (listed more than once)"
+            else:
+                entries[str(camera_id)] = entry
+        for label, error in errors.items():
+            print(f"[ERROR] {path} {label}: {error}")
+
+        with ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="camera-load") as pool:
+            futures = {camera_id: pool.submit(self.add, camera_id, entry) for camera_id, entry in entries.items()}
+        for camera_id, future in futures.items():
+            if future.exception() is not None:
+                errors[camera_id] = str(future.exception())
+                print(f"[ERROR] Camera '{camera_id}' failed to load: {future.exception()}")
+        return errors
+
+    def shutdown(self):
+        for camera_id in list(self.streams):
+            self.remove(camera_id).close()
@@ -0,0 +1,379 @@
+import collections
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from common import metrics
+
+
+class FrameRingBuffer:
+    """
+    Fixed-size ring of the most recent frames, kept as pre-roll for the next
+    clip. Frames are stored JPEG-compressed by default (roughly 20x smaller
+    than raw BGR), or raw when jpeg_quality is None.
+    """
+
+    def __init__(self, seconds=3, fps=20.0, jpeg_quality=80):
+        self.frames = collections.deque(maxlen=max(1, int(seconds * fps)))
+        self.jpeg_quality = jpeg_quality
+
+    def push(self, frame):
+        if self.jpeg_quality is None:
+            self.frames.append(frame)
+            return
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if ok:
+            self.frames.append(buf)
+
+    def drain(self):
+        """Yields the buffered frames oldest first (decoded) and empties the ring."""
+        items = list(self.frames)
+        self.frames.clear()
+        for item in items:
+            yield item if self.jpeg_quality is None else cv2.imdecode(item, cv2.IMREAD_COLOR)
+
+    def nbytes(self):
+        return sum(item.nbytes for item in self.frames)
+
+
+class _MjpgEncoder:
+    extension = ".avi"
+
+    def __init__(self, path, fps, size):
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, size)
+        if not self.writer.isOpened():
+            raise RuntimeError(f"Could not open {path}")
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def close(self):
+        self.writer.release()
+
+
+class _H264Encoder:
+    extension = ".mp4"
+
+    def __init__(self, path, fps, size):
+        import av
+
+        # yuv420p needs even dimensions
+        self.width, self.height = size[0] & ~1, size[1] & ~1
+        self.container = av.open(path, mode="w")
+        self.stream = self.container.add_stream("libx264", rate=int(round(fps)))
+        self.stream.width = self.width
+        self.stream.height = self.height
+        self.stream.pix_fmt = "yuv420p"
+        self.stream.options = {"preset": "veryfast", "crf": "26"}
+        self._av = av
+
+    def write(self, frame):
+        frame = np.ascontiguousarray(frame[:self.height, :self.width])
+        video_frame = self._av.VideoFrame.from_ndarray(frame, format="bgr24")
+        for packet in self.stream.encode(video_frame):
+            self.container.mux(packet)
+
+    def close(self):
+        for packet in self.stream.encode():
+            self.container.mux(packet)
+        self.container.close()
+
+
+ENCODERS = {
+    "mjpg": _MjpgEncoder,
+    "h264": _H264Encoder,
+}
+
+
+class ClipRecorder:
+    """
+    Records event clips without blocking the frame loop. Every processed
+    frame is handed over with add_frame(); a background writer thread keeps
+    them in the pre-roll ring while idle and encodes them while a clip is
+    open. The hand-off queue is bounded: when the writer falls behind, frames
+    are dropped and counted instead of stalling inference.
+    """
+
+    def __init__(self, output_dir, fps=20.0, preroll_seconds=3, codec="h264",
+                 jpeg_quality=80, queue_size=64):
+        if codec not in ENCODERS:
+            raise ValueError(f"Unknown clip codec: {codec}")
+        self.output_dir = output_dir
+        self.fps = fps
+        self.codec = codec
+        self.ring = FrameRingBuffer(preroll_seconds, fps, jpeg_quality)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._encoder = None
+        self.is_recording = False
+        self.current_path = None
+
+        # Counters
+        self.clips = 0
+        self.dropped = 0
+
+        self._thread = threading.Thread(target=self._writer_loop, name="clip-writer", daemon=True)
+        self._thread.start()
+
+    def add_frame(self, frame):
+        # A frame borrowed from the shared-memory frame bus is recycled after predict()
+        if not frame.flags.owndata:
+            frame = frame.copy()
+        try:
+            self._queue.put_nowait(("frame", frame))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self, name):
+        """Opens a new clip (pre-roll first) and returns the path it will be written to."""
+        path = os.path.join(self.output_dir, name + ENCODERS[self.codec].extension)
+        self.is_recording = True
+        self.current_path = path
+        # Control messages must not be dropped, so they block briefly instead
+        self._queue.put(("start", path))
+        return path
+
+    def stop(self):
+        self.is_recording = False
+        self._queue.put(("stop", None))
+
+    def close(self):
+        self._queue.put(("exit", None))
+        self._thread.join(timeout=5)
+
+    def _writer_loop(self):
+        while True:
+            kind, item = self._queue.get()
+            try:
+                if kind == "frame":
+                    if self._encoder is not None:
+                        started = time.perf_counter()
+                        self._encoder.write(item)
+                        metrics.observe(None, "clip_write", time.perf_counter() - started)
+                    else:
+                        self.ring.push(item)
+                elif kind == "start":
+                    self._open(item)
+                elif kind == "stop":
+                    self._close()
+                elif kind == "exit":
+                    self._close()
+                    return
+            except Exception as e:
+                print(f"[ERROR] Clip writer: {e}")
+
+    def _open(self, path):
+        self._close()
+        preroll = list(self.ring.drain())
+        self._encoder = _LazyEncoder(ENCODERS[self.codec], path, self.fps)
+        for frame in preroll:
+            self._encoder.write(frame)
+        self.clips += 1
+        print(f"[ALERT] Starting Record: {path} ({len(preroll)} pre-roll frames)")
+
+    def _close(self):
+        if self._encoder is not None:
+            self._encoder.close()
+            self._encoder = None
+            print(f"File saved in {self.output_dir}")
+
+    def stats(self):
+        return {
+            "codec": self.codec,
+            "recording": self.is_recording,
+            "clips": self.clips,
+            "dropped": self.dropped,
+            "queue": self._queue.qsize(),
+            "preroll_frames": len(self.ring.frames),
+            "preroll_bytes": self.ring.nbytes(),
+        }
+
+
+class NullRecorder:
+    """Same interface as ClipRecorder with recording turned off: nothing is written."""
+
+    def __init__(self):
+        self.is_recording = False
+        self.current_path = None
+
+    def add_frame(self, frame):
+        pass
+
+    def start(self, name):
+        self.is_recording = True
+        return None
+
+    def stop(self):
+        self.is_recording = False
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {"codec": None, "recording": self.is_recording, "clips": 0}
+
+
+class _LazyEncoder:
+    # Opens the real encoder on the first frame, once the frame size is known
+    def __init__(self, encoder_cls, path, fps):
+        self.encoder_cls = encoder_cls
+        self.path = path
+        self.fps = fps
+        self.encoder = None
+
+    def write(self, frame):
+        if self.encoder is None:
+            h, w = frame.shape[:2]
+            self.encoder = self.encoder_cls(self.path, self.fps, (w, h))
+        self.encoder.write(frame)
+
+    def close(self):
+        if self.encoder is not None:
+            self.encoder.close()
+
+
+class RemuxRecorder:
+    """
+    Saves the camera's original compressed packets instead of re-encoding.
+    A demux-only connection (no decoding) keeps the last GOPs as pre-roll;
+    on start() they are written out, followed by live packets until stop().
+    Clips contain the raw camera picture, without annotations.
+    """
+
+    def __init__(self, url, output_dir, preroll_seconds=3, transport="tcp"):
+        self.url = url
+        self.output_dir = output_dir
+        self.preroll_seconds = preroll_seconds
+        self.transport = transport
+
+        self._lock = threading.Lock()
+        self._gops = collections.deque()  # each entry: list of packets starting at a keyframe
+        self._in_stream = None
+        self._out = None
+        self._out_stream = None
+        self._offset = None
+        self.is_recording = False
+        self.current_path = None
+        self.clips = 0
+        self.dropped = 0
+
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._demux_loop, name="clip-remux", daemon=True)
+        self._thread.start()
+
+    def add_frame(self, frame):
+        # Decoded frames aren't needed: packets come straight from the camera
+        pass
+
+    def start(self, name):
+        """Opens a new clip (pre-roll first) and returns its path, or None when the input isn't connected yet."""
+        import av
+
+        path = os.path.join(self.output_dir, name + ".mp4")
+        with self._lock:
+            if self._in_stream is None:
+                print("[WARN] Remux recorder not connected yet, clip skipped")
+                return None
+            self._out = av.open(path, mode="w")
+            self._out_stream = self._out.add_stream_from_template(self._in_stream)
+            self._offset = None
+            for gop in self._gops:
+                for packet in gop:
+                    self._mux(packet)
+            self.is_recording = True
+            self.current_path = path
+            self.clips += 1
+        print(f"[ALERT] Starting Record (remux): {path}")
+        return path
+
+    def stop(self):
+        with self._lock:
+            self.is_recording = False
+            if self._out is not None:
+                self._out.close()
+                self._out = None
+                print(f"File saved in {self.output_dir}")
+
+    def close(self):
+        self._stop_event.set()
+        self.stop()
+
+    def stats(self):
+        return {
+            "codec": "remux",
+            "recording": self.is_recording,
+            "connected": self._in_stream is not None,
+            "clips": self.clips,
+            "dropped": self.dropped,
+            "preroll_gops": len(self._gops),
+        }
+
+    def _mux(self, packet):
+        if packet.dts is None:
+            return
+        # Rebase timestamps so every clip starts at zero. The packet may still
+        # sit in the pre-roll ring, so its original fields are restored after.
+        if self._offset is None:
+            self._offset = packet.dts
+        dts, pts, stream = packet.dts, packet.pts, packet.stream
+        packet.dts = dts - self._offset
+        if pts is not None:
+            packet.pts = pts - self._offset
+        packet.stream = self._out_stream
+        try:
+            self._out.mux(packet)
+        except Exception:
+            self.dropped += 1
+        finally:
+            packet.dts, packet.pts, packet.stream = dts, pts, stream
+
+    def _demux_loop(self):
+        import av
+
+        backoff = 0.5
+        while not self._stop_event.is_set():
+            try:
+                container = av.open(self.url, options={"rtsp_transport": self.transport})
+            except Exception as e:
+                print(f"[WARN] Remux recorder can't open stream ({e}), retrying in {backoff:.1f}s")
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+
+            backoff = 0.5
+            stream = container.streams.video[0]
+            with self._lock:
+                self._in_stream = stream
+                self._gops.clear()
+            try:
+                for packet in container.demux(stream):
+                    if self._stop_event.is_set():
+                        break
+                    if packet.dts is None:
+                        continue
+                    self._store(packet, stream)
+            except Exception as e:
+                print(f"[WARN] Remux recorder lost stream: {e}")
+            finally:
+                self.stop()
+                container.close()
+                with self._lock:
+                    self._in_stream = None
+
+    def _store(self, packet, stream):
+        with self._lock:
+            if packet.is_keyframe or not self._gops:
+                self._gops.append([])
+            self._gops[-1].append(packet)
+
+            # Keep just enough whole GOPs to cover the pre-roll window
+            newest = packet.dts * stream.time_base
+            while len(self._gops) > 1 and newest - self._gops[1][0].dts * stream.time_base >= self.preroll_seconds:
+                self._gops.popleft()
+
+            if self._out is not None:
+                self._mux(packet)
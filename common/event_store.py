@@ -0,0 +1,353 @@
+import contextlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+import cv2
+from datetime import datetime
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    camera_id TEXT,
+    type TEXT NOT NULL,
+    count INTEGER,
+    boxes TEXT,
+    details TEXT,
+    path TEXT,
+    thumb TEXT,
+    bytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE INDEX IF NOT EXISTS events_camera_ts ON events (camera_id, ts);
+CREATE INDEX IF NOT EXISTS events_type_ts ON events (type, ts);
+CREATE INDEX IF NOT EXISTS events_camera_type_ts ON events (camera_id, type, ts);
+"""
+
+COLUMNS = ("id", "ts", "camera_id", "type", "count", "boxes", "details", "path", "thumb", "bytes")
+
+
+def parse_time(value):
+    """Epoch seconds or an ISO 8601 string ("2024-05-14T08:00") -> epoch seconds."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path) if path else 0
+    except OSError:
+        return 0
+
+
+def _remove(path):
+    if path:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class EventStore:
+    """
+    Alerts, snapshots and clips indexed in SQLite (WAL journal), so they can
+    be queried by camera, type and time range instead of listing folders.
+
+    Writes go through a queue to one writer thread that commits in batches;
+    readers open their own connection and never wait on the writer. The same
+    thread writes snapshot thumbnails and enforces retention: rows (and their
+    files) older than max_age_days go first, then the oldest ones until the
+    files fit in max_bytes. Thumbnails made on request are written by the
+    requesting thread, but their row update also goes through the queue.
+    """
+
+    def __init__(self, path, thumb_dir=None, thumb_width=160, max_age_days=None, max_bytes=None,
+                 retention_interval=600, queue_size=1024):
+        self.path = path
+        self.thumb_dir = thumb_dir or os.path.join(os.path.dirname(os.path.abspath(path)), "thumbnails")
+        self.thumb_width = thumb_width
+        self.max_age_days = max_age_days
+        self.max_bytes = max_bytes
+        self.retention_interval = retention_interval
+        os.makedirs(self.thumb_dir, exist_ok=True)
+
+        with contextlib.closing(self._connect()) as db:
+            db.executescript(SCHEMA)
+            # Running total of file bytes, so the quota check never scans the table
+            self.total_bytes = db.execute("SELECT COALESCE(SUM(bytes), 0) FROM events").fetchone()[0]
+
+        self._jobs = queue.Queue(maxsize=queue_size)
+        self._last_retention = time.time()
+        self._readers = threading.local()
+
+        # Counters
+        self.recorded = 0
+        self.dropped = 0
+        self.evicted = 0
+
+        self._thread = threading.Thread(target=self._writer_loop, name="event-store", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _reader(self):
+        # One connection per reading thread, reused across queries
+        db = getattr(self._readers, "db", None)
+        if db is None:
+            db = self._readers.db = self._connect()
+        return db
+
+    # --- Writes (any thread) ---
+
+    def record(self, camera_id, type, ts=None, count=None, boxes=None, details=None, path=None, image=None):
+        """
+        Queues one event. `image` (a frame the caller won't modify) gets a
+        thumbnail; events without one get theirs on first request.
+        """
+        event = {
+            "ts": ts or time.time(),
+            "camera_id": camera_id,
+            "type": type,
+            "count": count,
+            "boxes": json.dumps(boxes) if boxes is not None else None,
+            "details": json.dumps(details) if details is not None else None,
+            "path": os.path.abspath(path) if path else None,
+        }
+        try:
+            self._jobs.put_nowait(("event", event, image))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        self._jobs.put((None, None, None))
+        self._thread.join(timeout=5)
+
+    def _writer_loop(self):
+        db = self._connect()
+        while True:
+            try:
+                job = self._jobs.get(timeout=self.retention_interval)
+            except queue.Empty:
+                job = None
+            batch = [job] if job is not None else []
+            # Everything already queued goes into the same transaction
+            while len(batch) < 256:
+                try:
+                    batch.append(self._jobs.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = any(kind is None for kind, _, _ in batch)
+            try:
+                self._insert(db, [(event, image) for kind, event, image in batch if kind == "event"])
+                for kind, update, _ in batch:
+                    if kind == "thumb":
+                        self._set_thumbnail(db, *update)
+                if time.time() - self._last_retention >= self.retention_interval or self._over_quota():
+                    self.enforce_retention(db)
+            except Exception as e:
+                print(f"[ERROR] Event store: {e}")
+            if stop:
+                db.close()
+                return
+
+    def _insert(self, db, batch):
+        if not batch:
+            return
+        rows = []
+        for event, image in batch:
+            thumb = self._write_thumbnail(image, event) if image is not None else None
+            size = _file_size(event["path"]) + _file_size(thumb)
+            rows.append((event["ts"], event["camera_id"], event["type"], event["count"], event["boxes"],
+                         event["details"], event["path"], thumb, size))
+            self.total_bytes += size
+        with db:
+            db.executemany(
+                "INSERT INTO events (ts, camera_id, type, count, boxes, details, path, thumb, bytes) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.recorded += len(rows)
+
+    def _write_thumbnail(self, image, event):
+        h, w = image.shape[:2]
+        scale = self.thumb_width / w
+        thumb = cv2.resize(image, (self.thumb_width, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        # Unique even for two events of one camera and type in the same millisecond
+        name = f"{event['camera_id'] or 'camera'}_{event['type']}_{int(event['ts'] * 1000)}_{uuid.uuid4().hex[:8]}.jpg"
+        path = os.path.join(self.thumb_dir, name)
+        return path if cv2.imwrite(path, thumb, [cv2.IMWRITE_JPEG_QUALITY, 70]) else None
+
+    # --- Retention (writer thread) ---
+
+    def _over_quota(self):
+        return self.max_bytes is not None and self.total_bytes > self.max_bytes
+
+    def _refresh_sizes(self, db, since):
+        # Clips were still being written when their event was recorded
+        rows = db.execute("SELECT id, path, thumb, bytes FROM events WHERE ts >= ? AND path IS NOT NULL",
+                          (since,)).fetchall()
+        changed = [(_file_size(path) + _file_size(thumb), event_id, size) for event_id, path, thumb, size in rows]
+        changed = [row for row in changed if row[0] != row[2]]
+        if changed:
+            with db:
+                db.executemany("UPDATE events SET bytes = ? WHERE id = ?", [row[:2] for row in changed])
+            self.total_bytes += sum(new - old for new, _, old in changed)
+
+    def enforce_retention(self, db=None, batch_size=500):
+        own = db is None
+        db = db or self._connect()
+        try:
+            self._refresh_sizes(db, self._last_retention - self.retention_interval)
+            # Inference worker processes add rows through their own stores
+            self.total_bytes = db.execute("SELECT COALESCE(SUM(bytes), 0) FROM events").fetchone()[0]
+            if self.max_age_days is not None:
+                cutoff = time.time() - self.max_age_days * 86400
+                while self._evict(db, "WHERE ts < ? ORDER BY ts LIMIT ?", (cutoff, batch_size)) == batch_size:
+                    pass
+            while self._over_quota():
+                if not self._evict(db, "ORDER BY ts LIMIT ?", (batch_size,), self.total_bytes - self.max_bytes):
+                    break
+            self._last_retention = time.time()
+        finally:
+            if own:
+                db.close()
+
+    def _evict(self, db, where, params, needed=None):
+        rows = db.execute(f"SELECT id, path, thumb, bytes FROM events {where}", params).fetchall()
+        if needed is not None:
+            # Oldest first, only as many as it takes to free `needed` bytes
+            freed = 0
+            for i, row in enumerate(rows):
+                freed += row[3]
+                if freed >= needed:
+                    rows = rows[:i + 1]
+                    break
+        if not rows:
+            return 0
+        for _, path, thumb, _ in rows:
+            _remove(path)
+            _remove(thumb)
+        with db:
+            db.executemany("DELETE FROM events WHERE id = ?", [(row[0],) for row in rows])
+        self.total_bytes -= sum(row[3] for row in rows)
+        self.evicted += len(rows)
+        print(f"[INFO] Event store evicted {len(rows)} events")
+        return len(rows)
+
+    # --- Queries (any thread) ---
+
+    @staticmethod
+    def _filters(camera_id=None, type=None, since=None, until=None):
+        clauses, params = [], []
+        if camera_id is not None:
+            clauses.append("camera_id = ?")
+            params.append(camera_id)
+        if type is not None:
+            clauses.append("type = ?")
+            params.append(type)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        return clauses, params
+
+    def query(self, camera_id=None, type=None, since=None, until=None, limit=50, cursor=None):
+        """
+        Newest first. Keyset pagination: pass the returned `next` cursor to
+        get the following page, which stays fast however deep it goes.
+        """
+        limit = max(1, min(int(limit), 1000))
+        clauses, params = self._filters(camera_id, type, since, until)
+        if cursor:
+            ts, event_id = cursor.split(":")
+            clauses.append("(ts < ? OR (ts = ? AND id < ?))")
+            params += [float(ts), float(ts), int(event_id)]
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        rows = self._reader().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM events {where} ORDER BY ts DESC, id DESC LIMIT ?",
+            params + [limit + 1]).fetchall()
+        events = [self._to_dict(row) for row in rows[:limit]]
+        following = f"{events[-1]['ts']!r}:{events[-1]['id']}" if len(rows) > limit else None
+        return {"events": events, "next": following}
+
+    def summary(self, since=None, until=None):
+        """Event counts per camera and type."""
+        clauses, params = self._filters(since=since, until=until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader().execute(
+            f"SELECT camera_id, type, COUNT(*), MAX(ts) FROM events {where} GROUP BY camera_id, type",
+            params).fetchall()
+        return [{"camera_id": c, "type": t, "count": n, "last": last} for c, t, n, last in rows]
+
+    def get(self, event_id):
+        row = self._reader().execute(f"SELECT {', '.join(COLUMNS)} FROM events WHERE id = ?", (event_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def thumbnail(self, event_id):
+        """Path of the event's thumbnail, made from its snapshot or the clip's first frame if missing."""
+        event = self.get(event_id)
+        if event is None:
+            return None
+        if event["thumb"] and os.path.exists(event["thumb"]):
+            return event["thumb"]
+        if not event["path"] or not os.path.exists(event["path"]):
+            return None
+
+        image = cv2.imread(event["path"])
+        if image is None:
+            cap = cv2.VideoCapture(event["path"])
+            ok, image = cap.read()
+            cap.release()
+            if not ok:
+                return None
+        thumb = self._write_thumbnail(image, event)
+        if thumb is not None:
+            # The row (and the byte total) is only ever changed by the writer thread
+            self._jobs.put(("thumb", (event_id, event["thumb"], thumb), None))
+        return thumb
+
+    def _set_thumbnail(self, db, event_id, old, thumb):
+        # Writer thread: attach a thumbnail made by thumbnail(), unless the row changed meanwhile
+        row = db.execute("SELECT thumb, path, bytes FROM events WHERE id = ?", (event_id,)).fetchone()
+        if row is None or row[0] != old:
+            # Evicted, or another request's thumbnail got there first
+            _remove(thumb)
+            return
+        size = _file_size(row[1]) + _file_size(thumb)
+        with db:
+            db.execute("UPDATE events SET thumb = ?, bytes = ? WHERE id = ?", (thumb, size, event_id))
+        self.total_bytes += size - row[2]
+        if old and old != thumb:
+            _remove(old)
+
+    @staticmethod
+    def _to_dict(row):
+        event = dict(zip(COLUMNS, row))
+        for key in ("boxes", "details"):
+            if event[key] is not None:
+                event[key] = json.loads(event[key])
+        return event
+
+    def stats(self):
+        return {
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "evicted": self.evicted,
+            "queue": self._jobs.qsize(),
+            "bytes": self.total_bytes,
+        }
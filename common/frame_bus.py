@@ -0,0 +1,200 @@
+import collections
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Per-slot header: sequence number, height, width, channels (int64 each)
+HEADER_BYTES = 32
+
+
+class FrameRing:
+    """
+    Fixed-size frame slots in one shared memory block. The creating process
+    owns the block; workers attach by name and map the same pages, so a
+    frame written into a slot is read in place by every process.
+
+    Each slot starts with a small header (sequence number + shape). The
+    sequence number lets a reader check that the slot still holds the frame
+    it was told about.
+    """
+
+    def __init__(self, slots, slot_bytes, name=None):
+        self.slots = int(slots)
+        self.slot_bytes = int(slot_bytes)
+        self.stride = HEADER_BYTES + self.slot_bytes
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slots * self.stride)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self._headers = np.ndarray((self.slots, 4), dtype=np.int64, buffer=self.shm.buf, strides=(self.stride, 8))
+
+    @classmethod
+    def attach(cls, spec):
+        name, slots, slot_bytes = spec
+        return cls(slots, slot_bytes, name=name)
+
+    @property
+    def spec(self):
+        # Everything a worker needs to attach (picklable)
+        return self.name, self.slots, self.slot_bytes
+
+    def fits(self, frame):
+        return frame.dtype == np.uint8 and frame.nbytes <= self.slot_bytes
+
+    def write(self, slot, frame, seq):
+        h, w = frame.shape[:2]
+        c = frame.shape[2] if frame.ndim == 3 else 1
+        self._headers[slot, 0] = -1  # being written
+        np.copyto(self._data(slot, (h, w, c) if frame.ndim == 3 else (h, w)), frame, casting="no")
+        self._headers[slot, 1:] = (h, w, c)
+        self._headers[slot, 0] = seq
+
+    def view(self, slot, seq=None):
+        """The frame in `slot` as an ndarray over the shared memory (no copy)."""
+        current, h, w, c = (int(v) for v in self._headers[slot])
+        if seq is not None and current != seq:
+            raise RuntimeError(f"Frame bus slot {slot} holds frame {current}, expected {seq}")
+        return self._data(slot, (h, w, c) if c > 1 else (h, w))
+
+    def _data(self, slot, shape):
+        offset = slot * self.stride + HEADER_BYTES
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=offset)
+
+    def close(self):
+        self._headers = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A viewer still holds a frame; the mapping goes away with its last view
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class FrameBus:
+    """
+    Hands one camera's frames to inference processes without pickling them.
+
+    put() copies a captured frame into a free FrameRing slot and returns a
+    small (ring spec, slot, seq) ticket, which is all that crosses the
+    process boundary. The worker runs the predictor on the slot in place and
+    writes the annotated frame back into the same slot. publish() copies
+    the result out into a private array and frees the slot straight away:
+    encoders and tracks read the published frame asynchronously, for as long
+    as they like, and must never see a slot that is being rewritten.
+
+    The ring is sized for `workers` frames in flight and re-created when the
+    camera resolution grows.
+    """
+
+    def __init__(self, workers=1):
+        self.workers = max(1, int(workers))
+        self.ring = None
+        self._free = []
+        self._seq = 0
+        self._lock = threading.Lock()
+        # Replaced rings, closed once none of their slots are in use
+        self._retired = {}
+        self._in_use = collections.Counter()
+
+        # Counters
+        self.frames = 0
+        self.full = 0
+
+    def _allocate(self, frame):
+        if self.ring is not None:
+            self._retired[self.ring.name] = self.ring
+        slots = self.workers + 1
+        self.ring = FrameRing(slots, frame.nbytes)
+        self._free = list(range(slots))
+        print(f"[INFO] Frame bus: {slots} slots of {frame.shape[1]}x{frame.shape[0]}")
+
+    def put(self, frame):
+        """Copies `frame` into a free slot. Returns a ticket, or None if every slot is busy."""
+        with self._lock:
+            if self.ring is None or not self.ring.fits(frame):
+                self._allocate(frame)
+            if not self._free:
+                self.full += 1
+                return None
+            slot = self._free.pop()
+            self._seq += 1
+            seq = self._seq
+            ring = self.ring
+            self._in_use[ring.name] += 1
+        ring.write(slot, frame, seq)
+        self.frames += 1
+        return ring.spec, slot, seq
+
+    def publish(self, ticket):
+        """Private copy of the processed frame in the ticket's slot; the slot is freed."""
+        spec, slot, seq = ticket
+        with self._lock:
+            try:
+                ring = self._ring(spec[0])
+                frame = ring.view(slot, seq).copy() if ring is not None else None
+            finally:
+                self._release(ticket)
+        return frame
+
+    def release(self, ticket):
+        """Gives back the slot of a frame that won't be published (failed inference)."""
+        with self._lock:
+            self._release(ticket)
+
+    def _ring(self, name):
+        if self.ring is not None and self.ring.name == name:
+            return self.ring
+        return self._retired.get(name)
+
+    def _release(self, ticket):
+        (name, _, _), slot, _ = ticket
+        self._in_use[name] -= 1
+        if self.ring is not None and self.ring.name == name:
+            self._free.append(slot)
+        elif self._in_use[name] <= 0 and name in self._retired:
+            # Last slot of a replaced ring
+            del self._in_use[name]
+            self._retired.pop(name).close()
+
+    def close(self):
+        with self._lock:
+            for ring in list(self._retired.values()) + [self.ring]:
+                if ring is not None:
+                    ring.close()
+            self._retired.clear()
+            self._in_use.clear()
+            self._free = []
+            self.ring = None
+
+    def stats(self):
+        ring = self.ring
+        return {
+            "slots": ring.slots if ring is not None else 0,
+            "free": len(self._free),
+            "frames": self.frames,
+            "full": self.full,
+        }
+
+
+# --- Worker side (inference processes) ---
+
+_attached = {}
+
+
+def attach(spec):
+    """Ring for a ticket's spec, attached once per worker process."""
+    ring = _attached.get(spec[0])
+    if ring is None:
+        # A new ring means the camera's old one was retired; drop our mapping of it
+        for old in _attached.values():
+            old.close()
+        _attached.clear()
+        ring = _attached[spec[0]] = FrameRing.attach(spec)
+    return ring
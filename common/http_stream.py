@@ -0,0 +1,228 @@
+import asyncio
+import math
+import time
+
+import cv2
+
+from common.shared_encoder import SharedEncoder
+
+BOUNDARY = "frame"
+
+
+class MjpegPublisher:
+    """
+    JPEG view of a camera for passive HTTP dashboards. A frame is encoded
+    at most once, on first request, and the same bytes go to every client.
+    Clients are rate-capped individually; a slow client just skips to the
+    newest frame (the generator only resumes once its last chunk was sent).
+    """
+
+    def __init__(self, broadcaster, quality=80):
+        self.broadcaster = broadcaster
+        self.quality = quality
+        self.clients = 0
+
+        self._jpeg = None
+        self._seq = 0
+        self._lock = asyncio.Lock()
+
+        # Counters
+        self.encoded = 0
+        self.sent = 0
+        self.skipped = 0
+
+    async def next_jpeg(self, last_seq):
+        """Returns (jpeg_bytes, seq) for the newest frame newer than last_seq."""
+        frame, seq = await self.broadcaster.wait_frame(last_seq)
+        async with self._lock:
+            if seq > self._seq:
+                # Off the event loop; later callers for the same frame reuse the bytes
+                self._jpeg = await asyncio.get_event_loop().run_in_executor(None, self._encode, frame)
+                self._seq = seq
+                self.encoded += 1
+        return self._jpeg, self._seq
+
+    def _encode(self, frame):
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buf.tobytes() if ok else None
+
+    async def stream(self, fps=5.0):
+        """Async generator of multipart/x-mixed-replace chunks for one client."""
+        interval = 1.0 / fps if fps else 0.0
+        self.clients += 1
+        self.broadcaster.subscribe()
+        try:
+            last_seq = 0
+            next_time = 0.0
+            while True:
+                # Per-client frame rate cap
+                delay = next_time - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                next_time = time.time() + interval
+
+                jpeg, seq = await self.next_jpeg(last_seq)
+                if jpeg is None:
+                    continue
+                if last_seq:
+                    self.skipped += seq - last_seq - 1
+                last_seq = seq
+                self.sent += 1
+                yield (
+                    f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                    f"Content-Length: {len(jpeg)}\r\n\r\n"
+                ).encode() + jpeg + b"\r\n"
+        finally:
+            self.clients -= 1
+            self.broadcaster.unsubscribe()
+
+    def stats(self):
+        return {
+            "clients": self.clients,
+            "encoded": self.encoded,
+            "sent": self.sent,
+            "skipped": self.skipped,
+        }
+
+
+class HlsSegmenter:
+    """
+    Rolling HLS (MPEG-TS segments kept in memory) built from a SharedEncoder's
+    H.264 packets, so it adds no encoding of its own when the camera already
+    uses shared encoding. Segments are cut at keyframes once target_duration
+    has passed. It runs while the playlist is being polled and stops after
+    idle_timeout seconds without requests.
+    """
+
+    def __init__(self, encoder, target_duration=2.0, window=5, idle_timeout=30.0):
+        self.encoder = encoder
+        self.target_duration = target_duration
+        self.window = window
+        self.idle_timeout = idle_timeout
+
+        self.segments = []  # (sequence, duration, bytes)
+        self._next_sequence = 0
+        self._task = None
+        self._last_request = 0.0
+        self._ready = asyncio.Event()
+
+    def touch(self):
+        self._last_request = time.time()
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def playlist(self, timeout=10.0):
+        self.touch()
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+        segments = list(self.segments)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{math.ceil(max(d for _, d, _ in segments))}",
+            f"#EXT-X-MEDIA-SEQUENCE:{segments[0][0]}",
+        ]
+        for sequence, duration, _ in segments:
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(f"segment_{sequence}.ts")
+        return "\n".join(lines) + "\n"
+
+    def segment(self, sequence):
+        self.touch()
+        for seq, _, data in self.segments:
+            if seq == sequence:
+                return data
+        return None
+
+    async def _run(self):
+        sub = self.encoder.subscribe()
+        muxer = None
+        try:
+            while time.time() - self._last_request < self.idle_timeout:
+                try:
+                    packet = await asyncio.wait_for(sub.queue.get(), 1.0)
+                except asyncio.TimeoutError:
+                    continue
+
+                if muxer is not None and packet.is_keyframe and muxer.duration(packet) >= self.target_duration:
+                    self._add_segment(muxer.duration(packet), muxer.close())
+                    muxer = None
+                if muxer is None:
+                    # Segments start on a keyframe (the subscriber waits for one)
+                    muxer = _TsMuxer(self.encoder.fps)
+                muxer.mux(packet)
+        finally:
+            if muxer is not None:
+                muxer.close()
+            self.encoder.unsubscribe(sub)
+            self._task = None
+            self.segments = []
+            self._ready.clear()
+
+    def _add_segment(self, duration, data):
+        self.segments.append((self._next_sequence, duration, data))
+        self._next_sequence += 1
+        del self.segments[:-self.window]
+        self._ready.set()
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    def stats(self):
+        return {
+            "running": self._task is not None,
+            "segments": len(self.segments),
+            "bytes": sum(len(data) for _, _, data in self.segments),
+        }
+
+
+class _TsMuxer:
+    # One in-memory MPEG-TS segment
+    def __init__(self, fps):
+        import io
+        import av
+
+        self.buffer = io.BytesIO()
+        self.container = av.open(self.buffer, mode="w", format="mpegts")
+        self.stream = self.container.add_stream("h264", rate=int(fps))
+        self.first_pts = None
+        self._av = av
+
+    def mux(self, packet):
+        if self.first_pts is None:
+            self.first_pts = packet.pts
+        # Mux a copy: the original packet object is shared with WebRTC viewers
+        copy = self._av.Packet(bytes(packet))
+        copy.pts = copy.dts = packet.pts
+        copy.time_base = packet.time_base
+        copy.is_keyframe = packet.is_keyframe
+        copy.stream = self.stream
+        self.container.mux(copy)
+
+    def duration(self, packet):
+        return float((packet.pts - self.first_pts) * packet.time_base)
+
+    def close(self):
+        self.container.close()
+        return self.buffer.getvalue()
+
+
+def get_mjpeg(stream):
+    if stream.mjpeg is None:
+        stream.mjpeg = MjpegPublisher(stream.broadcaster)
+    return stream.mjpeg
+
+
+def get_hls(stream):
+    if stream.hls is None:
+        # Reuse the camera's lowest shared encoding level, else encode privately for HLS
+        if stream.encoders:
+            encoder = min(stream.encoders.values(), key=lambda e: e.bitrate)
+        else:
+            encoder = SharedEncoder(stream.broadcaster, name="hls", bitrate=800_000)
+        stream.hls = HlsSegmenter(encoder)
+    return stream.hls
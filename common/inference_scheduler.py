@@ -0,0 +1,153 @@
+import collections
+import threading
+import time
+
+from common.model_cache import get_model
+
+
+class _Request:
+    def __init__(self, frame, kwargs):
+        self.frame = frame
+        self.kwargs = kwargs
+        self.submitted = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchScheduler:
+    """
+    Collects frames from several camera streams and runs them through the
+    model as one batch. A batch closes when it reaches `max_batch` frames or
+    when the oldest frame has waited `max_wait_ms`.
+
+    It is a drop-in stand-in for the model: predictors keep calling
+    `self.model(frame, ...)`, which blocks until that frame's result is back.
+    """
+
+    def __init__(self, model, max_batch=8, max_wait_ms=10):
+        self.model = model
+        self.names = model.names
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+
+        self._pending = collections.deque()
+        self._cond = threading.Condition()
+
+        # Metrics
+        self.frames = 0
+        self.batches = 0
+        self._window = collections.deque(maxlen=200)  # (finish_time, batch_size, wait, infer)
+
+        self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def __call__(self, frame, **kwargs):
+        # Results are always returned as a list, so stream=True has no meaning here
+        kwargs.pop("stream", None)
+        # A list of frames (e.g. the tiles of one frame) is queued at once and shares batches
+        frames = frame if isinstance(frame, (list, tuple)) else [frame]
+        reqs = [_Request(f, kwargs) for f in frames]
+        with self._cond:
+            self._pending.extend(reqs)
+            self._cond.notify()
+
+        for req in reqs:
+            req.done.wait()
+            if req.error is not None:
+                raise req.error
+        return [req.result for req in reqs]
+
+    def _collect(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending)
+
+            # Wait for more frames until the batch is full or the oldest one is due
+            deadline = self._pending[0].submitted + self.max_wait
+            while len(self._pending) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = []
+            while self._pending and len(batch) < self.max_batch:
+                batch.append(self._pending.popleft())
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.time()
+
+            # Requests with different call options (conf, classes...) can't share a forward pass.
+            # Values are keyed by repr so lists (classes=[0]) group like any other option.
+            groups = collections.defaultdict(list)
+            for req in batch:
+                try:
+                    groups[tuple(sorted((k, repr(v)) for k, v in req.kwargs.items()))].append(req)
+                except Exception as e:
+                    req.error = e
+                    req.done.set()
+
+            for reqs in groups.values():
+                try:
+                    results = self.model([r.frame for r in reqs], **reqs[0].kwargs)
+                    for req, result in zip(reqs, results):
+                        req.result = result
+                except Exception as e:
+                    # The error goes back to its callers; the scheduler thread keeps running
+                    for req in reqs:
+                        req.error = e
+                for req in reqs:
+                    req.done.set()
+
+            finished = time.time()
+            wait = sum(started - r.submitted for r in batch) / len(batch)
+            self.frames += len(batch)
+            self.batches += 1
+            self._window.append((finished, len(batch), wait, finished - started))
+
+    def stats(self):
+        window = list(self._window)
+        if not window:
+            return {"frames": self.frames, "batches": self.batches}
+
+        span = window[-1][0] - window[0][0]
+        frames_in_window = sum(w[1] for w in window)
+        waits = sorted(w[2] for w in window)
+        return {
+            "frames": self.frames,
+            "batches": self.batches,
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "avg_batch_size": round(frames_in_window / len(window), 2),
+            "fps": round(frames_in_window / span, 2) if span > 0 else None,
+            "avg_wait_ms": round(1000 * sum(waits) / len(waits), 2),
+            "p95_wait_ms": round(1000 * waits[int(0.95 * (len(waits) - 1))], 2),
+            "avg_inference_ms": round(1000 * sum(w[3] for w in window) / len(window), 2),
+        }
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_batched_model(path, task=None, max_batch=8, max_wait_ms=10):
+    """Returns the shared scheduler for `path`, so every camera on that model batches together."""
+    key = (path, task)
+    with _schedulers_lock:
+        if key in _schedulers:
+            return _schedulers[key]
+    # Loaded outside the lock (model_cache locks per weights file), so cameras on
+    # different models start in parallel
+    model = get_model(path, task)
+    with _schedulers_lock:
+        if key not in _schedulers:
+            _schedulers[key] = BatchScheduler(model, max_batch, max_wait_ms)
+        return _schedulers[key]
+
+
+def scheduler_stats():
+    with _schedulers_lock:
+        return {path: s.stats() for (path, _), s in _schedulers.items()}
@@ -0,0 +1,138 @@
+import threading
+
+
+class QualityLadder:
+    """
+    Quality levels for one camera, from full quality (level 0) down to the
+    configured floor. Each step changes one knob by one notch, in turn:
+    detection interval, output fps, then inference imgsz.
+    """
+
+    def __init__(self, imgsz=(320, 640), detect_every=(1, 3), fps=(5, 20)):
+        sizes = list(range(imgsz[1], imgsz[0], -160)) + [imgsz[0]]
+        # YOLO wants multiples of 32
+        sizes = sorted({max(32, s // 32 * 32) for s in sizes}, reverse=True)
+        intervals = list(range(detect_every[0], detect_every[1] + 1))
+        rates = []
+        rate = fps[1]
+        while rate > fps[0]:
+            rates.append(rate)
+            rate = max(fps[0], rate // 2 if rate > 10 else rate - 5)
+        rates.append(fps[0])
+
+        knobs = [intervals, rates, sizes]
+        index = [0, 0, 0]
+        self.levels = [self._level(knobs, index)]
+        while any(i < len(k) - 1 for i, k in zip(index, knobs)):
+            for n, values in enumerate(knobs):
+                if index[n] < len(values) - 1:
+                    index[n] += 1
+                    self.levels.append(self._level(knobs, index))
+
+    @staticmethod
+    def _level(knobs, index):
+        intervals, rates, sizes = knobs
+        return {"detect_every": intervals[index[0]], "fps": rates[index[1]], "imgsz": sizes[index[2]]}
+
+    def __len__(self):
+        return len(self.levels)
+
+
+class _CameraState:
+    def __init__(self, options, priority):
+        options = options if isinstance(options, dict) else {}
+        self.target_ms = float(options.get("target_ms", 100))
+        self.priority = priority
+        self.ladder = QualityLadder(
+            imgsz=options.get("imgsz", (320, 640)),
+            detect_every=options.get("detect_every", (1, 3)),
+            fps=options.get("fps", (5, 20)),
+        )
+        self.level = None
+
+
+class LoadController:
+    """
+    Keeps per-camera processing latency under its target by trading quality
+    for load. Every `interval` seconds it looks at each active adaptive
+    camera's smoothed predict() time:
+    - if any camera is over its target, the lowest-priority camera that can
+      still degrade drops one level (ties: the most loaded one);
+    - if every camera is comfortably under target (recover_ratio), the
+      highest-priority degraded camera gets one level back.
+    One step per tick, so the latency average settles between changes.
+
+    Cameras opt in with "adaptive" (true or {"target_ms", "imgsz",
+    "detect_every", "fps"} bounds) and rank with "priority" (higher keeps
+    quality longer).
+    """
+
+    def __init__(self, streams, interval=3.0, recover_ratio=0.6):
+        self.streams = streams  # callable returning the current CameraStreams
+        self.interval = interval
+        self.recover_ratio = recover_ratio
+        self._states = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="load-controller", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                print(f"[ERROR] Load controller: {e}")
+
+    def tick(self):
+        streams = self.streams()
+        # Forget cameras that were removed
+        for camera_id in set(self._states) - {s.camera_id for s in streams}:
+            del self._states[camera_id]
+
+        cameras = []
+        for stream in streams:
+            options = stream.config.get("adaptive")
+            if not options:
+                continue
+            state = self._states.get(stream.camera_id)
+            if state is None:
+                state = self._states[stream.camera_id] = _CameraState(options, stream.config.get("priority", 0))
+            if state.level is None:
+                self._apply(stream, state, 0)
+            # Idle cameras (no viewers) have no current latency to go by
+            if stream.broadcaster.subscribers and stream.broadcaster.predict_ms:
+                cameras.append((stream, state, stream.broadcaster.predict_ms / state.target_ms))
+
+        if any(load > 1 for _, _, load in cameras):
+            candidates = [c for c in cameras if c[1].level < len(c[1].ladder) - 1]
+            if candidates:
+                stream, state, load = min(candidates, key=lambda c: (c[1].priority, -c[2]))
+                self._apply(stream, state, state.level + 1, load)
+        elif cameras and all(load < self.recover_ratio for _, _, load in cameras):
+            candidates = [c for c in cameras if c[1].level > 0]
+            if candidates:
+                stream, state, load = max(candidates, key=lambda c: (c[1].priority, -c[2]))
+                self._apply(stream, state, state.level - 1, load)
+
+    def _apply(self, stream, state, level, load=None):
+        state.level = level
+        quality = state.ladder.levels[level]
+        stream.broadcaster.max_fps = quality["fps"]
+        # With a process executor the predictors live in the workers; only fps applies there
+        set_quality = getattr(stream.predictor, "set_quality", None)
+        if set_quality is not None:
+            set_quality(imgsz=quality["imgsz"], detect_every=quality["detect_every"])
+
+        stream.quality = dict(quality, level=level, levels=len(state.ladder),
+                              priority=state.priority, target_ms=state.target_ms)
+        if load is not None:
+            print(f"[INFO] Camera '{stream.camera_id}' quality level {level}/{len(state.ladder) - 1}: "
+                  f"imgsz {quality['imgsz']}, detect every {quality['detect_every']}, {quality['fps']} fps "
+                  f"(latency at {load:.0%} of target)")
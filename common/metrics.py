@@ -0,0 +1,192 @@
+import bisect
+import os
+import threading
+
+# METRICS=0 turns the latency hooks into a single flag check
+ENABLED = os.environ.get("METRICS", "1") != "0"
+
+# Seconds: from a sub-millisecond gate check up to a stalled RTSP read
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+# (camera_id, stage) -> Histogram; camera "all" is for process-wide work (disk writes)
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def observe(camera_id, stage, seconds):
+    """Records one stage duration. Cheap enough to call per frame."""
+    if not ENABLED:
+        return
+    key = (camera_id or "all", stage)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = _histograms.setdefault(key, Histogram())
+    histogram.observe(seconds)
+
+
+def forget_camera(camera_id):
+    """Drops a removed camera's histograms so they stop being exported."""
+    with _histograms_lock:
+        for key in [k for k in _histograms if k[0] == camera_id]:
+            del _histograms[key]
+
+
+# --- Exposition ---
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+class _Family:
+    # One metric name with its HELP/TYPE header and samples
+    def __init__(self, name, kind, help_text):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.samples = []
+
+    def add(self, value, **labels):
+        if value is not None:
+            self.samples.append((labels, float(value)))
+
+    def render(self, lines):
+        if not self.samples:
+            return
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} {self.kind}")
+        for labels, value in self.samples:
+            lines.append(f"{self.name}{_labels(labels)} {value:g}")
+
+
+def _render_histograms(lines):
+    with _histograms_lock:
+        items = sorted(_histograms.items())
+    if not items:
+        return
+    name = "stage_latency_seconds"
+    lines.append(f"# HELP {name} Time spent per pipeline stage (read, predict, recv, encode, disk writes).")
+    lines.append(f"# TYPE {name} histogram")
+    for (camera_id, stage), histogram in items:
+        counts, total, count = histogram.snapshot()
+        cumulative = 0
+        for bound, n in zip(histogram.buckets + (float("inf"),), counts):
+            cumulative += n
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            lines.append(f"{name}_bucket{_labels({'camera': camera_id, 'stage': stage, 'le': le})} {cumulative}")
+        lines.append(f"{name}_sum{_labels({'camera': camera_id, 'stage': stage})} {total:g}")
+        lines.append(f"{name}_count{_labels({'camera': camera_id, 'stage': stage})} {count}")
+
+
+def render_metrics(streams, pcs=None, alerts=None):
+    """
+    Prometheus text exposition for every camera. Gauges and counters are read
+    from the components' existing counters at scrape time, so they cost
+    nothing between scrapes.
+    """
+    families = {}
+
+    def family(name, kind, help_text):
+        if name not in families:
+            families[name] = _Family(name, kind, help_text)
+        return families[name]
+
+    if pcs is not None:
+        family("webrtc_peers", "gauge", "Active WebRTC peer connections.").add(len(pcs))
+
+    for stream in streams:
+        cam = stream.camera_id
+        camera = stream.camera.stats()
+        family("camera_connected", "gauge", "1 if the camera stream is open.").add(camera["connected"], camera=cam)
+        family("camera_fps", "gauge", "Frames per second read from the camera.").add(camera["fps"], camera=cam)
+        family("camera_frame_age_seconds", "gauge", "Age of the newest camera frame.").add(
+            camera["frame_age"], camera=cam)
+        family("camera_frames_total", "counter", "Frames read from the camera.").add(camera["frames"], camera=cam)
+        family("camera_dropped_frames_total", "counter", "Camera frames replaced before being read.").add(
+            camera["dropped"], camera=cam)
+        family("camera_reconnects_total", "counter", "Camera reconnects.").add(camera["reconnects"], camera=cam)
+
+        broadcaster = stream.broadcaster
+        family("camera_peers", "gauge", "WebRTC peers watching this camera.").add(len(stream.peers), camera=cam)
+        family("broadcaster_subscribers", "gauge", "Tracks and encoders subscribed to the camera.").add(
+            broadcaster.subscribers, camera=cam)
+        family("inference_queue_depth", "gauge", "Frames waiting for inference.").add(len(broadcaster.frames), camera=cam)
+        family("inference_dropped_frames_total", "counter", "Frames dropped from the full inference queue.").add(
+            broadcaster.frames.dropped, camera=cam)
+        family("inference_frames_total", "counter", "Frames processed by the predictor.").add(
+            broadcaster.processed, camera=cam)
+        family("inference_fps", "gauge", "Frames per second processed by the predictor.").add(
+            round(broadcaster.fps, 2), camera=cam)
+        family("inference_throttled_frames_total", "counter", "Frames skipped by the adaptive fps cap.").add(
+            broadcaster.throttled, camera=cam)
+        if stream.quality is not None:
+            family("quality_level", "gauge", "Adaptive quality level (0 is full quality).").add(
+                stream.quality["level"], camera=cam)
+        if broadcaster.bus is not None:
+            stats = broadcaster.bus.stats()
+            family("frame_bus_free_slots", "gauge", "Free shared-memory frame slots.").add(stats["free"], camera=cam)
+            family("frame_bus_full_total", "counter", "Frames sent pickled because every shared slot was busy.").add(
+                stats["full"], camera=cam)
+        for event, count in broadcaster.alert_counts.items():
+            family("alerts_total", "counter", "Alerts raised, by event.").add(count, camera=cam, event=event)
+
+        gate = getattr(stream.predictor, "gate", None)
+        if gate is not None:
+            family("gate_skipped_frames_total", "counter", "Frames the motion gate kept from the detector.").add(
+                gate.skipped, camera=cam)
+
+        recorder = getattr(stream.predictor, "recorder", None)
+        if recorder is not None:
+            stats = recorder.stats()
+            family("clip_recording", "gauge", "1 while a clip is being recorded.").add(stats["recording"], camera=cam)
+            family("clip_queue_depth", "gauge", "Frames waiting for the clip writer.").add(stats.get("queue"), camera=cam)
+
+        for level, encoder in stream.encoders.items():
+            stats = encoder.stats()
+            family("encoder_viewers", "gauge", "Viewers of a shared encoder.").add(
+                stats["viewers"], camera=cam, level=level)
+            family("encoder_dropped_total", "counter", "Viewer queues flushed because they fell behind.").add(
+                stats["dropped"], camera=cam, level=level)
+
+        if stream.mjpeg is not None:
+            family("mjpeg_clients", "gauge", "Connected MJPEG clients.").add(stream.mjpeg.clients, camera=cam)
+
+    if alerts is not None:
+        stats = alerts.stats()
+        family("alert_queue_depth", "gauge", "Alert side-effect jobs waiting.").add(stats["queue"])
+        for key in ("snapshots", "sounds", "dropped", "failed", "emitted", "coalesced"):
+            family(f"alert_{key}_total", "counter", f"Alert dispatcher {key} count.").add(stats[key])
+
+    lines = []
+    for f in families.values():
+        f.render(lines)
+    _render_histograms(lines)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+
+
+class SharedModel:
+    """
+    One loaded YOLO model shared by every camera that uses the same weights.
+    Calls are serialized with a lock because the ultralytics predictor keeps
+    per-call state and isn't safe to run concurrently from several threads.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.names = model.names
+        self.lock = threading.Lock()
+        self.warm = False
+
+    def __call__(self, *args, **kwargs):
+        with self.lock:
+            results = self.model(*args, **kwargs)
+            # stream=True returns a generator; consume it while we hold the lock
+            if kwargs.get("stream"):
+                results = list(results)
+            return results
+
+
+# "ultralytics" (YOLO, torch/ORT via ultralytics) or "onnxruntime" (direct ORT session,
+# no torch import; .pt paths map to the exported .onnx next to them)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "ultralytics")
+BACKENDS = ("ultralytics", "onnxruntime")
+
+_models = {}
+_models_lock = threading.Lock()
+# One lock per weights file: different models load in parallel, the same one only once
+_loading = {}
+
+
+def get_model(path, task=None, backend=None):
+    """Returns the shared model for `path`, loading the weights only once per process."""
+    backend = backend or INFERENCE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    key = (os.path.abspath(path), task, backend)
+    with _models_lock:
+        if key in _models:
+            return _models[key]
+        lock = _loading.setdefault(key, threading.Lock())
+
+    with lock:
+        with _models_lock:
+            if key in _models:
+                return _models[key]
+        print(f"[INFO] Loading model {path} ({backend})")
+        started = time.perf_counter()
+        if backend == "onnxruntime":
+            from common.onnx_engine import load_onnx_model
+
+            model = load_onnx_model(path, task)
+        else:
+            from ultralytics import YOLO
+
+            model = YOLO(path, task=task) if task else YOLO(path)
+        print(f"[INFO] Loaded {path} in {time.perf_counter() - started:.2f}s")
+        with _models_lock:
+            _models[key] = SharedModel(model)
+            return _models[key]
+
+
+def loaded_models():
+    with _models_lock:
+        return [f"{path} ({backend})" for path, _, backend in _models]
+
+
+def warm_up(size=640):
+    """
+    One inference on a blank frame per loaded model, so lazy initialisation
+    (CUDA context, ORT arena, ultralytics predictor setup) happens now and
+    not on the first viewer's frame. Returns seconds per model.
+    """
+    import numpy as np
+
+    frame = np.zeros((size, size, 3), dtype=np.uint8)
+    with _models_lock:
+        models = [(key, m) for key, m in _models.items() if not m.warm]
+    timings = {}
+    for (path, _, backend), model in models:
+        started = time.perf_counter()
+        try:
+            model(frame, verbose=False)
+        except Exception as e:
+            print(f"[WARN] Warm-up failed for {path}: {e}")
+            continue
+        model.warm = True
+        timings[f"{path} ({backend})"] = round(time.perf_counter() - started, 3)
+    return timings
+
+
+def with_models(factory, models, *args, **kwargs):
+    """
+    Predictor factory for process workers: loads `models` ({kwarg: (path, task)})
+    through get_model in the worker itself, then returns factory(*args, **kwargs)
+    with them. Wrap it in functools.partial to get a picklable predictor_factory
+    that uses the camera's configured weights.
+    """
+    loaded = {name: get_model(path, task) for name, (path, task) in models.items() if path}
+    return factory(*args, **loaded, **kwargs)
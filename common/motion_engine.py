@@ -0,0 +1,167 @@
+import cv2
+import numpy as np
+
+# Background models: consecutive-frame difference, running average, OpenCV MOG2 / KNN
+METHODS = ("diff", "average", "mog2", "knn")
+
+
+class MotionEngine:
+    """
+    Foreground detection on a small copy of the frame (`width` px wide), so
+    the cost and the thresholds don't depend on the camera resolution:
+
+    1. Downscale + grayscale (and blur for diff/average).
+    2. Foreground mask from the chosen background model.
+    3. Include/exclude polygons (full-frame coordinates) applied to the mask.
+    4. Morphological open/close: drops speckle noise, joins broken blobs.
+    5. Connected components: blobs smaller than `min_blob_area` are noise.
+
+    Motion means the blobs cover at least `min_area` of the watched area
+    (both are fractions, not pixel counts). A mask covering more than
+    `max_area` is treated as a lighting change, not motion, and the
+    background is re-learned.
+    """
+
+    def __init__(self, method="mog2", width=320, min_area=0.005, min_blob_area=0.0005, max_area=0.6,
+                 diff_threshold=25, morph=3, history=300, learning_rate=-1, average_alpha=0.05,
+                 include=None, exclude=None):
+        if method not in METHODS:
+            raise ValueError(f"Unknown motion method: {method}")
+        self.method = method
+        self.width = int(width)
+        self.min_area = min_area
+        self.min_blob_area = min_blob_area
+        self.max_area = max_area
+        self.diff_threshold = diff_threshold
+        self.history = history
+        self.learning_rate = learning_rate  # MOG2/KNN; -1 lets OpenCV pick from history
+        self.average_alpha = average_alpha
+        self.include = [np.asarray(p, dtype=np.float32).reshape(-1, 2) for p in include or []]
+        self.exclude = [np.asarray(p, dtype=np.float32).reshape(-1, 2) for p in exclude or []]
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (morph, morph)) if morph else None
+
+        # Created on the first frame (keeps the engine picklable for process workers)
+        self._subtractor = None
+        self._background = None
+        self._mask = None
+        self._watched = 0
+        self._shape = None
+        self._settle = 0
+
+        # Last frame's result
+        self.area = 0.0
+        self.blobs = []  # (x1, y1, x2, y2) in full-frame coordinates
+        self.motion_count = 0  # foreground pixels at the analysis resolution
+        self.lighting_changes = 0
+
+    def _setup(self, shape):
+        h, w = shape[:2]
+        scale = min(1.0, self.width / w)
+        self._size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        self._scale = scale
+        self._shape = shape[:2]
+        self._relearn()
+
+        # Watched area: include polygons (or everything) minus exclude polygons
+        self._mask = None
+        if self.include or self.exclude:
+            mask = np.zeros(self._size[::-1], dtype=np.uint8) if self.include else \
+                np.full(self._size[::-1], 255, dtype=np.uint8)
+            for polygon in self.include:
+                cv2.fillPoly(mask, [np.round(polygon * scale).astype(np.int32)], 255)
+            for polygon in self.exclude:
+                cv2.fillPoly(mask, [np.round(polygon * scale).astype(np.int32)], 0)
+            self._mask = mask
+        self._watched = cv2.countNonZero(self._mask) if self._mask is not None else self._size[0] * self._size[1]
+
+    def _foreground(self, small):
+        if self.method in ("mog2", "knn"):
+            if self._subtractor is None:
+                if self.method == "mog2":
+                    self._subtractor = cv2.createBackgroundSubtractorMOG2(self.history, 16, detectShadows=True)
+                else:
+                    self._subtractor = cv2.createBackgroundSubtractorKNN(self.history, 400.0, detectShadows=True)
+            mask = self._subtractor.apply(small, learningRate=self.learning_rate)
+            # Shadows are marked 127; only solid foreground (255) counts
+            return cv2.threshold(mask, 200, 255, cv2.THRESH_BINARY)[1]
+
+        gray = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        if self._background is None:
+            self._background = gray.astype(np.float32) if self.method == "average" else gray
+            return None
+        if self.method == "average":
+            diff = cv2.absdiff(gray, cv2.convertScaleAbs(self._background))
+            cv2.accumulateWeighted(gray, self._background, self.average_alpha)
+        else:
+            diff = cv2.absdiff(gray, self._background)
+            self._background = gray
+        return cv2.threshold(diff, self.diff_threshold, 255, cv2.THRESH_BINARY)[1]
+
+    def _relearn(self):
+        # Fresh background model; MOG2/KNN need a few frames before their mask means anything
+        self._background = None
+        self._subtractor = None
+        self._settle = 5 if self.method in ("mog2", "knn") else 0
+
+    def update(self, frame):
+        """Returns True if this frame shows motion in the watched area."""
+        if self._shape != frame.shape[:2]:
+            self._setup(frame.shape)
+
+        small = cv2.resize(frame, self._size, interpolation=cv2.INTER_AREA)
+        mask = self._foreground(small)
+        self.blobs = []
+        if self._settle:
+            self._settle -= 1
+            mask = None
+        if mask is None:
+            self.area, self.motion_count = 0.0, 0
+            return False
+
+        if self._mask is not None:
+            mask = cv2.bitwise_and(mask, self._mask)
+        if self.kernel is not None:
+            mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
+            mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, self.kernel, iterations=2)
+
+        self.motion_count = cv2.countNonZero(mask)
+        if not self._watched:
+            self.area = 0.0
+            return False
+        if self.motion_count > self.max_area * self._watched:
+            # Lights switched / auto-exposure: start over instead of chasing the whole frame
+            self.lighting_changes += 1
+            self.area = 0.0
+            self._relearn()
+            return False
+
+        n, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        min_blob = self.min_blob_area * self._size[0] * self._size[1]
+        moving = 0
+        for x, y, w, h, area in stats[1:n]:
+            if area < min_blob:
+                continue
+            moving += area
+            self.blobs.append(tuple(int(round(v / self._scale)) for v in (x, y, x + w, y + h)))
+
+        self.area = moving / self._watched
+        return self.area >= self.min_area
+
+    def stats(self):
+        return {
+            "method": self.method,
+            "area": round(float(self.area), 4),
+            "blobs": len(self.blobs),
+            "lighting_changes": self.lighting_changes,
+        }
+
+
+def build_engine(options):
+    """
+    MotionEngine from a camera's "motion" setting, e.g.
+    {"method": "mog2", "width": 320, "min_area": 0.005, "exclude": [[[x, y], ...]]}.
+    None/false keeps the gates' classic full-size frame difference.
+    """
+    if not options:
+        return None
+    return MotionEngine(**(options if isinstance(options, dict) else {}))
@@ -0,0 +1,109 @@
+import time
+
+import cv2
+
+
+class MotionGate:
+    """
+    Cheap absdiff/countNonZero check that decides whether a frame is worth
+    running the detector on. When the scene is static, predictors reuse their
+    last detections instead. A forced re-inference interval keeps cached
+    detections from going stale (e.g. someone standing perfectly still).
+
+    Motion and the decision are computed once per frame object, so several
+    stages can share one gate for the same camera and agree on the decision
+    (a forced refresh reaches all of them, and the frame is counted once).
+
+    An optional MotionEngine (background model, masks, area-fraction
+    thresholds) replaces the built-in frame difference.
+    """
+
+    def __init__(self, threshold=40, min_motion_count=5500, force_interval=2.0, engine=None):
+        self.THRESHOLD = threshold
+        self.MIN_MOTION_COUNT = min_motion_count
+        self.force_interval = force_interval  # seconds, None disables
+        self.engine = engine
+
+        self.prev_gray = None
+        self.motion_detected = False
+        self.motion_count = 0
+        self._frame = None
+        self._decided = None  # frame the cached decision belongs to
+        self._decision = False
+        self.last_inference_time = 0
+
+        # Counters
+        self.frames = 0
+        self.inferences = 0
+        self.skipped = 0
+        self.forced = 0
+
+    def update(self, frame):
+        """Returns True if this frame differs enough from the previous one."""
+        if frame is self._frame:
+            return self.motion_detected
+        self._frame = frame
+
+        if self.engine is not None:
+            self.motion_detected = self.engine.update(frame)
+            self.motion_count = self.engine.motion_count
+            return self.motion_detected
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.prev_gray is None or self.prev_gray.shape != gray.shape:
+            self.prev_gray = gray
+            self.motion_detected = False
+            self.motion_count = 0
+            return False
+
+        diff = cv2.absdiff(self.prev_gray, gray)
+        _, thresh = cv2.threshold(diff, self.THRESHOLD, 255, cv2.THRESH_BINARY)
+        self.motion_count = cv2.countNonZero(thresh)
+        self.prev_gray = gray
+
+        self.motion_detected = self.motion_count > self.MIN_MOTION_COUNT
+        return self.motion_detected
+
+    def should_infer(self, frame, keep_alive=False):
+        """
+        True if the detector should run on this frame: motion was seen, the
+        caller asked to keep inferring (keep_alive), or the forced interval
+        has elapsed. Later calls for the same frame return the first call's
+        decision (or keep_alive) without counting the frame again.
+        """
+        if frame is self._decided:
+            return self._decision or keep_alive
+        self._decided = frame
+
+        now = time.time()
+        motion = self.update(frame)
+        forced = (
+            self.force_interval is not None
+            and now - self.last_inference_time >= self.force_interval
+        )
+
+        self.frames += 1
+        if motion or keep_alive or forced:
+            if forced and not (motion or keep_alive):
+                self.forced += 1
+            self.inferences += 1
+            self.last_inference_time = now
+            self._decision = True
+            return True
+
+        self.skipped += 1
+        self._decision = False
+        return False
+
+    def stats(self):
+        stats = {
+            "frames": self.frames,
+            "inferences": self.inferences,
+            "skipped": self.skipped,
+            "forced": self.forced,
+            "skip_ratio": round(self.skipped / self.frames, 3) if self.frames else 0.0,
+            "motion_count": self.motion_count,
+        }
+        if self.engine is not None:
+            stats["engine"] = self.engine.stats()
+        return stats
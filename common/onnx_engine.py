@@ -0,0 +1,266 @@
+import ast
+import os
+
+import cv2
+import numpy as np
+
+# Session option names accepted in ORT_GRAPH_OPT / graph_optimization
+GRAPH_OPTIMIZATION_LEVELS = ("disable", "basic", "extended", "all")
+
+
+class _Array(np.ndarray):
+    # numpy array that also answers the .cpu().numpy() calls predictors make on torch tensors
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.view(np.ndarray)
+
+
+class Boxes:
+    """Detections of one frame as an (N, 6) [x1, y1, x2, y2, conf, cls] array."""
+
+    def __init__(self, data):
+        self.data = data
+
+    @property
+    def xyxy(self):
+        return self.data[:, :4].view(_Array)
+
+    @property
+    def conf(self):
+        return self.data[:, 4].view(_Array)
+
+    @property
+    def cls(self):
+        return self.data[:, 5].view(_Array)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        return Boxes(self.data[index:index + 1] if isinstance(index, int) else self.data[index])
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+class Results:
+    """The parts of ultralytics' Results the predictors use: boxes, names and plot()."""
+
+    def __init__(self, orig_shape, names, boxes):
+        self.orig_shape = orig_shape
+        self.names = names
+        self.boxes = Boxes(boxes)
+
+    def plot(self, img=None, line_width=2, labels=True, conf=True):
+        for x1, y1, x2, y2, score, cls in self.boxes.data:
+            color = _color(int(cls))
+            p1, p2 = (int(x1), int(y1)), (int(x2), int(y2))
+            cv2.rectangle(img, p1, p2, color, line_width, cv2.LINE_AA)
+            if labels:
+                text = f"{self.names.get(int(cls), int(cls))} {score:.2f}" if conf else self.names.get(int(cls))
+                (w, h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+                top = max(p1[1], h + 4)
+                cv2.rectangle(img, (p1[0], top - h - 4), (p1[0] + w, top), color, -1)
+                cv2.putText(img, text, (p1[0], top - 2), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+        return img
+
+
+def _color(index):
+    # Stable per-class colors
+    palette = ((56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+               (10, 249, 72), (23, 204, 146), (134, 219, 61), (52, 147, 26), (187, 212, 0))
+    return palette[index % len(palette)]
+
+
+def _stride_size(size, stride=32):
+    # imgsz rounded up to the model stride, as ultralytics does
+    return max(stride, -(-int(size) // stride) * stride)
+
+
+class OnnxYolo:
+    """
+    YOLOv8 detector running directly on ONNX Runtime (no torch), callable
+    like ultralytics.YOLO: model(frame, conf=..., imgsz=..., stream=...)
+    returns a list of Results. Works with FP32 and INT8 (QDQ) exports alike.
+
+    A list of frames (e.g. from the batch scheduler) is letterboxed into one
+    stacked tensor and run in a single session call when the export has a
+    dynamic batch axis (quantize_models.py --dynamic). Static batch-1
+    exports run the list frame by frame instead. imgsz is honoured when the
+    input size is dynamic; a fixed-size export rejects any other imgsz.
+
+    The letterbox canvas, the normalized input tensor and (for static output
+    shapes) the output tensor are allocated once and reused every call.
+    Not thread-safe on its own: get_model() serializes calls with a lock.
+    """
+
+    def __init__(self, path, imgsz=640, conf=0.25, iou=0.7, max_det=300,
+                 intra_threads=None, inter_threads=None, graph_optimization="all"):
+        import onnxruntime as ort
+
+        if graph_optimization not in GRAPH_OPTIMIZATION_LEVELS:
+            raise ValueError(f"Unknown graph optimization level: {graph_optimization}")
+        levels = {
+            "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+        }
+        options = ort.SessionOptions()
+        options.graph_optimization_level = levels[graph_optimization]
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        # 0 lets ORT pick (one thread per physical core)
+        options.intra_op_num_threads = int(intra_threads or 0)
+        options.inter_op_num_threads = int(inter_threads or 0)
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.path = path
+
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+
+        # Class names are stored in the export's metadata by ultralytics
+        meta = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(meta["names"]) if "names" in meta else {}
+
+        # Dynamic axes show up as names instead of ints
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch, _, height, width = model_input.shape
+        self.batch_size = batch if isinstance(batch, int) else None
+        self.dynamic_size = not (isinstance(height, int) and isinstance(width, int))
+        if self.dynamic_size:
+            height = width = _stride_size(imgsz)
+        self.input_size = (height, width)
+
+        # Reused buffers: letterbox canvas and the NCHW float tensor fed to ORT
+        self._canvas = np.full((height, width, 3), 114, dtype=np.uint8)
+        self._input = np.empty((self.batch_size or 1, 3, height, width), dtype=np.float32)
+
+        # Static output shape: bind a preallocated output buffer so ORT writes in place
+        model_output = self.session.get_outputs()[0]
+        self.output_name = model_output.name
+        self._binding = None
+        if all(isinstance(d, int) for d in model_output.shape):
+            self._output = np.empty(model_output.shape, dtype=np.float32)
+            self._binding = self.session.io_binding()
+            self._binding.bind_cpu_input(self.input_name, self._input)
+            self._binding.bind_output(self.output_name, "cpu", 0, np.float32, list(self._output.shape),
+                                      self._output.ctypes.data)
+
+    def __call__(self, source, conf=None, iou=None, classes=None, imgsz=None, stream=False, verbose=False,
+                 **kwargs):
+        frames = list(source) if isinstance(source, (list, tuple)) else [source]
+        conf = self.conf if conf is None else conf
+        iou = self.iou if iou is None else iou
+        size = self._size(imgsz)
+        # One session call per batch: the whole list with a dynamic batch axis, else batch_size frames
+        step = self.batch_size or max(1, len(frames))
+        results = []
+        for start in range(0, len(frames), step):
+            results += self._predict(frames[start:start + step], size, conf, iou, classes)
+        return iter(results) if stream else results
+
+    def _size(self, imgsz):
+        if imgsz is None:
+            return self.input_size
+        size = imgsz if isinstance(imgsz, (list, tuple)) else (imgsz, imgsz)
+        size = tuple(_stride_size(s) for s in size)
+        if size != self.input_size and not self.dynamic_size:
+            height, width = self.input_size
+            raise ValueError(f"{self.path} has a fixed {width}x{height} input and can't run at imgsz={imgsz}; "
+                             f"export it with a dynamic input (quantize_models.py --dynamic)")
+        return size
+
+    def _predict(self, frames, size, conf, iou, classes):
+        batch = self.batch_size or len(frames)
+        if self._input.shape != (batch, 3, *size):
+            # Only dynamic exports get here: a new batch size or imgsz
+            self._input = np.empty((batch, 3, *size), dtype=np.float32)
+        letterboxes = [self._letterbox(frame, self._input[i]) for i, frame in enumerate(frames)]
+        if self._binding is not None:
+            self.session.run_with_iobinding(self._binding)
+            output = self._output
+        else:
+            output = self.session.run([self.output_name], {self.input_name: self._input})[0]
+
+        results = []
+        for frame, (gain, pad), prediction in zip(frames, letterboxes, output):
+            boxes = self._postprocess(prediction, conf, iou, classes)
+            # Back from letterbox to frame coordinates
+            boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad[0]) / gain).clip(0, frame.shape[1])
+            boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad[1]) / gain).clip(0, frame.shape[0])
+            results.append(Results(frame.shape[:2], self.names, boxes))
+        return results
+
+    def _letterbox(self, frame, out=None):
+        """Letterboxes `frame` into `out` (one CHW slice of the input tensor). Returns (gain, pad)."""
+        out = self._input[0] if out is None else out
+        height, width = out.shape[1:]
+        h, w = frame.shape[:2]
+        gain = min(height / h, width / w)
+        new_w, new_h = round(w * gain), round(h * gain)
+        left, top = (width - new_w) // 2, (height - new_h) // 2
+
+        if self._canvas.shape[:2] != (height, width):
+            self._canvas = np.empty((height, width, 3), dtype=np.uint8)
+        canvas = self._canvas
+        canvas[:] = 114
+        canvas[top:top + new_h, left:left + new_w] = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        # BGR HWC uint8 -> RGB CHW float in [0, 1], written into the reused input tensor
+        np.multiply(canvas[..., ::-1].transpose(2, 0, 1), 1 / 255.0, out=out, casting="unsafe")
+        return gain, (left, top)
+
+    def _postprocess(self, output, conf, iou, classes):
+        if output.shape[-1] == 6 and output.shape[0] <= self.max_det:
+            # End-to-end export (NMS inside the model): rows are [x1, y1, x2, y2, score, cls]
+            boxes = output[output[:, 4] > conf].astype(np.float32)
+            if classes is not None:
+                boxes = boxes[np.isin(boxes[:, 5], classes)]
+            return boxes
+
+        # Raw YOLOv8 head: (4 + num_classes, anchors) with cx, cy, w, h first
+        preds = output.T
+        scores = preds[:, 4:]
+        cls = scores.argmax(axis=1)
+        best = scores[np.arange(len(cls)), cls]
+        keep = best > conf
+        if classes is not None:
+            keep &= np.isin(cls, classes)
+        if not keep.any():
+            return np.zeros((0, 6), dtype=np.float32)
+
+        xywh, best, cls = preds[keep, :4], best[keep], cls[keep]
+        xyxy = np.empty_like(xywh)
+        xyxy[:, :2] = xywh[:, :2] - xywh[:, 2:] / 2
+        xyxy[:, 2:] = xywh[:, :2] + xywh[:, 2:] / 2
+
+        # Class-aware NMS: offset each class so boxes of different classes never overlap
+        offset = cls[:, None] * 4096.0
+        rects = np.concatenate([xyxy[:, :2] + offset, xywh[:, 2:]], axis=1)
+        index = cv2.dnn.NMSBoxes(rects.tolist(), best.tolist(), conf, iou, top_k=self.max_det)
+        index = np.asarray(index, dtype=np.int64).reshape(-1)
+        return np.concatenate([xyxy[index], best[index, None], cls[index, None]], axis=1).astype(np.float32)
+
+
+def onnx_path(path):
+    """yolov8n.pt -> yolov8n.onnx; paths already ending in .onnx are kept."""
+    root, ext = os.path.splitext(path)
+    return path if ext == ".onnx" else root + ".onnx"
+
+
+def load_onnx_model(path, task=None):
+    """OnnxYolo with session options from ORT_INTRA_THREADS, ORT_INTER_THREADS and ORT_GRAPH_OPT."""
+    if task not in (None, "detect"):
+        raise ValueError(f"The onnxruntime backend only runs detection models, not '{task}'")
+    path = onnx_path(path)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"{path} not found; export it first (Unified_Analytics/quantize_models.py)")
+    return OnnxYolo(
+        path,
+        intra_threads=os.environ.get("ORT_INTRA_THREADS"),
+        inter_threads=os.environ.get("ORT_INTER_THREADS"),
+        graph_optimization=os.environ.get("ORT_GRAPH_OPT", "all"),
+    )
@@ -0,0 +1,266 @@
+import asyncio
+import fractions
+import threading
+import time
+
+import cv2
+from aiortc import MediaStreamTrack, RTCRtpSender
+
+from common import metrics
+from common.broadcaster import LatestFrameQueue
+
+# RTP video clock
+VIDEO_TIME_BASE = fractions.Fraction(1, 90000)
+
+
+class _Subscriber:
+    def __init__(self, queue_size):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        # A new or lagging viewer can only start decoding at a keyframe
+        self.waiting_key = True
+
+
+class SharedEncoder:
+    """
+    Encodes one camera's processed frames to H.264 once and hands the same
+    packets to every viewer, instead of aiortc running one encoder per peer.
+    A camera can have a few of these at different bitrates/sizes (quality
+    levels). Frames come from the FrameBroadcaster like any other viewer;
+    encoding runs on its own thread and only while someone is watching.
+
+    Bitrate is fixed per level (no per-peer congestion control). Keyframes
+    are sent when a viewer joins or falls behind, and every gop_seconds so
+    packet loss recovers without per-peer PLI handling.
+    """
+
+    def __init__(self, broadcaster, name="default", bitrate=1_500_000, width=None,
+                 fps=20, gop_seconds=2.0, queue_size=30):
+        self.broadcaster = broadcaster
+        self.name = name
+        self.bitrate = int(bitrate)
+        self.width = width
+        self.fps = fps
+        self.gop_seconds = gop_seconds
+        self.queue_size = queue_size
+
+        self._subscribers = set()
+        self._frames = LatestFrameQueue(1)
+        self._codec = None
+        self._keyframe_requested = True
+        self._last_keyframe = 0.0
+        self._t0 = None
+        self._loop = None
+        self._feed_task = None
+        self._stop_event = None
+        self._thread = None
+
+        # Counters
+        self.frames = 0
+        self.keyframes = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.encode_ms = 0.0
+
+    # --- Subscription (event loop side) ---
+
+    def subscribe(self):
+        sub = _Subscriber(self.queue_size)
+        self._subscribers.add(sub)
+        self.request_keyframe()
+        if self._feed_task is None:
+            self._start()
+        return sub
+
+    def unsubscribe(self, sub):
+        self._subscribers.discard(sub)
+        if not self._subscribers:
+            self._stop()
+
+    def request_keyframe(self):
+        self._keyframe_requested = True
+
+    def _start(self):
+        self._loop = asyncio.get_event_loop()
+        self.broadcaster.subscribe()
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._encode_loop, args=(self._stop_event,), name=f"encoder-{self.name}", daemon=True
+        )
+        self._thread.start()
+        self._feed_task = asyncio.ensure_future(self._feed())
+
+    def _stop(self):
+        if self._feed_task is None:
+            return
+        self._feed_task.cancel()
+        self._feed_task = None
+        self._stop_event.set()
+        self._stop_event = None
+        self.broadcaster.unsubscribe()
+
+    def close(self):
+        thread = self._thread
+        self._subscribers.clear()
+        self._stop()
+        if thread is not None:
+            thread.join(timeout=2)
+
+    async def _feed(self):
+        # Same fan-out as a WebRTC track: newest processed frame, skip the rest
+        last_seq = 0
+        while True:
+            frame, last_seq = await self.broadcaster.wait_frame(last_seq)
+            self._frames.put(frame)
+
+    def _publish(self, packets):
+        for packet in packets:
+            for sub in self._subscribers:
+                if sub.waiting_key and not packet.is_keyframe:
+                    continue
+                if sub.queue.full():
+                    # Viewer fell behind: flush it and restart from the next keyframe
+                    while not sub.queue.empty():
+                        sub.queue.get_nowait()
+                    sub.waiting_key = True
+                    self.dropped += 1
+                    self.request_keyframe()
+                    continue
+                sub.waiting_key = False
+                sub.queue.put_nowait(packet)
+
+    # --- Encoder thread ---
+
+    def _encode_loop(self, stop_event):
+        import av
+
+        while not stop_event.is_set():
+            frame = self._frames.get(timeout=0.5)
+            if frame is None:
+                continue
+
+            started = time.time()
+            if self.width and frame.shape[1] != self.width:
+                height = int(frame.shape[0] * self.width / frame.shape[1])
+                frame = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+            # yuv420p needs even dimensions
+            frame = frame[:frame.shape[0] & ~1, :frame.shape[1] & ~1]
+
+            video_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+            if self._t0 is None:
+                self._t0 = started
+            video_frame.pts = int((started - self._t0) * 90000)
+            video_frame.time_base = VIDEO_TIME_BASE
+
+            if started - self._last_keyframe >= self.gop_seconds:
+                self._keyframe_requested = True
+            if self._keyframe_requested:
+                self._keyframe_requested = False
+                self._last_keyframe = started
+                video_frame.pict_type = av.video.frame.PictureType.I
+                self.keyframes += 1
+
+            try:
+                packets = self._encode(av, video_frame)
+            except Exception as e:
+                print(f"[ERROR] Shared encoder '{self.name}': {e}")
+                self._codec = None
+                continue
+
+            for packet in packets:
+                # Keep the frame's clock: aiortc turns it into the RTP timestamp
+                packet.pts = video_frame.pts
+                packet.time_base = VIDEO_TIME_BASE
+                self.bytes += packet.size
+            self.frames += 1
+            metrics.observe(self.broadcaster.camera_id, f"encode_{self.name}", time.time() - started)
+            elapsed_ms = (time.time() - started) * 1000
+            self.encode_ms = 0.9 * self.encode_ms + 0.1 * elapsed_ms if self.encode_ms else elapsed_ms
+
+            if packets:
+                self._loop.call_soon_threadsafe(self._publish, packets)
+
+    def _encode(self, av, video_frame):
+        codec = self._codec
+        if codec is None or codec.width != video_frame.width or codec.height != video_frame.height:
+            # Same settings aiortc's own H.264 encoder uses, so every browser can decode it
+            codec = av.CodecContext.create("libx264", "w")
+            codec.width = video_frame.width
+            codec.height = video_frame.height
+            codec.bit_rate = self.bitrate
+            codec.pix_fmt = "yuv420p"
+            codec.framerate = fractions.Fraction(self.fps, 1)
+            codec.time_base = VIDEO_TIME_BASE
+            codec.options = {"level": "31", "tune": "zerolatency", "preset": "veryfast"}
+            codec.profile = "Baseline"
+            self._codec = codec
+            video_frame.pict_type = av.video.frame.PictureType.I
+        return list(codec.encode(video_frame))
+
+    def stats(self):
+        return {
+            "level": self.name,
+            "viewers": len(self._subscribers),
+            "bitrate": self.bitrate,
+            "width": self.width,
+            "frames": self.frames,
+            "keyframes": self.keyframes,
+            "bytes": self.bytes,
+            "dropped": self.dropped,
+            "avg_encode_ms": round(self.encode_ms, 2),
+        }
+
+
+class EncodedVideoTrack(MediaStreamTrack):
+    """
+    Video track that returns already-encoded H.264 packets; aiortc only
+    packetizes them, so adding a viewer costs no extra encoding.
+    """
+
+    kind = "video"
+
+    def __init__(self, encoder):
+        super().__init__()
+        self.encoder = encoder
+        self._sub = encoder.subscribe()
+
+        # Optional RTCDataChannel carrying the detections for client-side overlays
+        self.channel = None
+
+    async def recv(self):
+        started = time.perf_counter()
+        packet = await self._sub.queue.get()
+        # Grows when capture, inference or encoding stalls
+        metrics.observe(self.encoder.broadcaster.camera_id, "recv_wait", time.perf_counter() - started)
+
+        overlay = self.encoder.broadcaster.latest_overlay
+        if self.channel is not None and self.channel.readyState == "open" and overlay is not None:
+            self.channel.send(overlay)
+        return packet
+
+    def stop(self):
+        if self.readyState != "ended":
+            self.encoder.unsubscribe(self._sub)
+        super().stop()
+
+
+def make_encoders(broadcaster, options):
+    """
+    Per-camera "shared_encoding": true for one default level, or
+    {"levels": {"high": {"bitrate": 2000000}, "low": {"bitrate": 400000, "width": 640}}}.
+    Returns {level_name: SharedEncoder}, empty when disabled.
+    """
+    if not options:
+        return {}
+    levels = options.get("levels") if isinstance(options, dict) else None
+    if not levels:
+        levels = {"default": {}}
+    return {name: SharedEncoder(broadcaster, name, **level) for name, level in levels.items()}
+
+
+def prefer_h264(pc, track):
+    # Shared packets are H.264, so that's the only codec this sender may negotiate.
+    # Must run before setRemoteDescription(), which is where aiortc picks the codec.
+    codecs = [c for c in RTCRtpSender.getCapabilities("video").codecs if c.mimeType == "video/H264"]
+    for transceiver in pc.getTransceivers():
+        if transceiver.sender.track is track:
+            transceiver.setCodecPreferences(codecs)
@@ -0,0 +1,89 @@
+import threading
+import time
+
+from common.model_cache import warm_up
+
+
+def _process_started():
+    # Cold start counts from process creation (interpreter and imports included) when psutil is there
+    try:
+        import psutil
+
+        return psutil.Process().create_time()
+    except Exception:
+        return time.time()
+
+
+PROCESS_STARTED = _process_started()
+
+
+class Startup:
+    """
+    Brings the app up after the server is listening instead of at import
+    time, so /healthz answers at once and restarts don't wait on weights:
+
+    1. load(): the app's camera loading (cameras build in parallel, each
+       weights file is loaded once).
+    2. Warm-up: one inference per loaded model on a blank frame, so the
+       first viewer doesn't pay for lazy backend initialisation.
+
+    /readyz turns ready when both are done. Phase durations and the time
+    from process start to ready (the cold start) are kept for /readyz.
+    """
+
+    def __init__(self, load, warmup=True):
+        self.load = load
+        self.warmup = warmup
+        self.state = "pending"
+        self.error = None
+        self.camera_errors = {}
+        self.phases = {}
+        self.warmup_models = {}
+        self.cold_start = None
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def start(self):
+        if self._thread is None:
+            self.state = "starting"
+            self.phases["imports"] = round(time.time() - PROCESS_STARTED, 3)
+            self._thread = threading.Thread(target=self._run, name="startup", daemon=True)
+            self._thread.start()
+
+    def _phase(self, name, fn):
+        started = time.perf_counter()
+        result = fn()
+        self.phases[name] = round(time.perf_counter() - started, 3)
+        return result
+
+    def _run(self):
+        try:
+            # A camera that fails to build is skipped (and listed), not fatal
+            self.camera_errors = self._phase("cameras", self.load) or {}
+            if self.warmup:
+                self.warmup_models = self._phase("warmup", warm_up)
+        except Exception as e:
+            self.state = "failed"
+            self.error = str(e)
+            print(f"[ERROR] Startup failed: {e}")
+            return
+        self.cold_start = round(time.time() - PROCESS_STARTED, 3)
+        self.state = "ready"
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        print(f"[INFO] Ready in {self.cold_start:.2f}s ({phases})")
+
+    def stats(self):
+        stats = {
+            "state": self.state,
+            "cold_start": self.cold_start,
+            "phases": self.phases,
+            "warmup": self.warmup_models,
+        }
+        if self.camera_errors:
+            stats["camera_errors"] = self.camera_errors
+        if self.error:
+            stats["error"] = self.error
+        return stats
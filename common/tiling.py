@@ -0,0 +1,190 @@
+import math
+import time
+
+import cv2
+import numpy as np
+
+from common.onnx_engine import Results
+
+
+def tile_grid(region, tile_size, overlap):
+    """
+    (x1, y1, x2, y2) tiles of at most tile_size px covering region, each
+    overlapping its neighbours by about `overlap` of a tile so a person cut
+    by one tile edge is whole in the next tile.
+    """
+    x1, y1, x2, y2 = region
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(lo, hi):
+        length = hi - lo
+        if length <= tile_size:
+            return [lo]
+        n = math.ceil((length - tile_size) / step) + 1
+        return [int(round(s)) for s in np.linspace(lo, hi - tile_size, n)]
+
+    return [(x, y, min(x + tile_size, x2), min(y + tile_size, y2))
+            for y in starts(y1, y2) for x in starts(x1, x2)]
+
+
+def merge_detections(detections, threshold=0.6):
+    """
+    Cross-tile NMS over (N, 6) [x1, y1, x2, y2, conf, cls] rows. Overlap is
+    measured against the smaller box (intersection over smaller), so the
+    half-person a tile edge cut off is dropped in favour of the whole one.
+    """
+    if len(detections) < 2:
+        return detections
+    detections = detections[np.argsort(-detections[:, 4])]
+    a = detections[:, None, :4]
+    b = detections[None, :, :4]
+    inter = (np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+             * np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None))
+    area = (detections[:, 2] - detections[:, 0]) * (detections[:, 3] - detections[:, 1])
+    ios = inter / np.maximum(np.minimum(area[:, None], area[None, :]), 1e-6)
+    overlaps = (ios > threshold) & (detections[:, 5][:, None] == detections[:, 5][None, :])
+
+    suppressed = np.zeros(len(detections), dtype=bool)
+    keep = []
+    for i in range(len(detections)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        suppressed |= overlaps[i]
+    return detections[keep]
+
+
+class _CachedTile:
+    def __init__(self, thumb, detections, now):
+        self.thumb = thumb
+        self.detections = detections
+        self.time = now
+
+
+class TiledDetector:
+    """
+    Sliced inference for wide shots where distant people are only a few
+    pixels tall. The region (the ROI / zones bounding box, or the whole
+    frame) is cut into overlapping tiles at the detector's native size, so
+    nothing is downscaled, plus one coarse full-frame pass for people too
+    large for a tile. Changed tiles go to the detector as one batch and all
+    detections are merged with cross-tile NMS.
+
+    Each tile keeps its last detections. A tile is only re-detected when a
+    small grayscale thumbnail of it differs from the one taken at its last
+    detection, or after `max_age` seconds, so static parts of the scene
+    cost nothing. Called like the model and returns a one-item list of
+    Results.
+    """
+
+    def __init__(self, model, tile_size=640, overlap=0.2, full_frame=True, merge_threshold=0.6,
+                 cache=True, max_age=2.0, diff_threshold=25, min_changed_pixels=4, classes=None):
+        self.model = model
+        self.names = model.names
+        self.tile_size = int(tile_size)
+        self.overlap = float(overlap)
+        self.full_frame = full_frame
+        self.merge_threshold = merge_threshold
+        self.classes = tuple(classes) if classes is not None else None
+
+        # Tile cache: thumbnails are 1/4 scale, so a distant person still moves a few pixels
+        self.cache = cache
+        self.max_age = max_age
+        self.diff_threshold = diff_threshold
+        self.min_changed_pixels = min_changed_pixels
+        self._tiles = {}
+        self._shape = None
+
+        # Counters
+        self.frames = 0
+        self.tiles_run = 0
+        self.tiles_cached = 0
+
+    def _thumb(self, frame, rect):
+        x1, y1, x2, y2 = rect
+        crop = frame[y1:y2, x1:x2]
+        thumb = cv2.resize(crop, (max(1, (x2 - x1) // 4), max(1, (y2 - y1) // 4)), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(thumb, cv2.COLOR_BGR2GRAY)
+
+    def _changed(self, entry, thumb, now):
+        if entry is None or not self.cache or now - entry.time >= self.max_age:
+            return True
+        diff = cv2.absdiff(entry.thumb, thumb)
+        return cv2.countNonZero(cv2.threshold(diff, self.diff_threshold, 255, cv2.THRESH_BINARY)[1]) \
+            >= self.min_changed_pixels
+
+    def tiles(self, shape, region=None):
+        h, w = shape[:2]
+        if region is None:
+            region = (0, 0, w, h)
+        x1, y1, x2, y2 = (int(v) for v in region)
+        region = (max(0, x1), max(0, y1), min(w, x2), min(h, y2))
+        if region[2] <= region[0] or region[3] <= region[1]:
+            return []
+        rects = tile_grid(region, self.tile_size, self.overlap)
+        # A single tile that already is the whole frame makes the full-frame pass redundant
+        if self.full_frame and rects != [(0, 0, w, h)]:
+            rects.append((0, 0, w, h))
+        return rects
+
+    def __call__(self, frame, region=None, **kwargs):
+        kwargs.pop("stream", None)
+        kwargs.pop("verbose", None)
+        if self.classes is not None:
+            kwargs.setdefault("classes", self.classes)
+
+        # New frame size (or camera swap): nothing cached applies
+        if self._shape != frame.shape[:2]:
+            self._tiles = {}
+            self._shape = frame.shape[:2]
+
+        now = time.time()
+        rects = self.tiles(frame.shape, region)
+        stale, thumbs = [], {}
+        for rect in rects:
+            thumbs[rect] = self._thumb(frame, rect)
+            if self._changed(self._tiles.get(rect), thumbs[rect], now):
+                stale.append(rect)
+
+        # 1. Changed tiles through the detector in one call (a batch with ultralytics/BatchScheduler)
+        if stale:
+            crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in stale]
+            results = self.model(crops, verbose=False, **kwargs)
+            for rect, r in zip(stale, results):
+                self._tiles[rect] = _CachedTile(thumbs[rect], self._to_frame(r, rect), now)
+
+        # 2. Tiles no longer in the layout (zones edited) are forgotten
+        for rect in set(self._tiles) - set(rects):
+            del self._tiles[rect]
+
+        self.frames += 1
+        self.tiles_run += len(stale)
+        self.tiles_cached += len(rects) - len(stale)
+
+        # 3. Cross-tile NMS over everything, cached tiles included
+        detections = [self._tiles[rect].detections for rect in rects]
+        detections = np.concatenate(detections) if detections else np.zeros((0, 6), dtype=np.float32)
+        return [Results(frame.shape[:2], self.names, merge_detections(detections, self.merge_threshold))]
+
+    @staticmethod
+    def _to_frame(result, rect):
+        # Tile-local boxes shifted back into frame coordinates
+        if result.boxes is None or len(result.boxes) == 0:
+            return np.zeros((0, 6), dtype=np.float32)
+        detections = np.concatenate([
+            result.boxes.xyxy.cpu().numpy(),
+            result.boxes.conf.cpu().numpy()[:, None],
+            result.boxes.cls.cpu().numpy()[:, None],
+        ], axis=1).astype(np.float32)
+        detections[:, [0, 2]] += rect[0]
+        detections[:, [1, 3]] += rect[1]
+        return detections
+
+    def stats(self):
+        total = self.tiles_run + self.tiles_cached
+        return {
+            "frames": self.frames,
+            "tiles": len(self._tiles),
+            "tiles_run": self.tiles_run,
+            "cache_hit_rate": round(self.tiles_cached / total, 3) if total else 0.0,
+        }
@@ -0,0 +1,125 @@
+import time
+
+import numpy as np
+
+
+def iou_matrix(a, b):
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes, computed in one shot."""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+
+    a = a[:, None, :]
+    b = b[None, :, :]
+    ix1 = np.maximum(a[..., 0], b[..., 0])
+    iy1 = np.maximum(a[..., 1], b[..., 1])
+    ix2 = np.minimum(a[..., 2], b[..., 2])
+    iy2 = np.minimum(a[..., 3], b[..., 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+class Track:
+    def __init__(self, track_id, box, now):
+        self.id = track_id
+        self.box = np.asarray(box, dtype=np.float32)
+        self.velocity = np.zeros(4, dtype=np.float32)  # px per frame
+        self.hits = 1
+        self.first_seen = now
+        self.last_seen = now
+
+        self._last_det_box = self.box.copy()
+        self._frames_since_det = 0
+
+    def predict(self):
+        # Constant-velocity step for frames where the detector didn't run
+        self.box = self.box + self.velocity
+        self._frames_since_det += 1
+
+    def correct(self, box, now):
+        box = np.asarray(box, dtype=np.float32)
+        steps = max(1, self._frames_since_det)
+        measured = (box - self._last_det_box) / steps
+        self.velocity = 0.5 * self.velocity + 0.5 * measured
+
+        self.box = box
+        self._last_det_box = box.copy()
+        self._frames_since_det = 0
+        self.hits += 1
+        self.last_seen = now
+
+    def dwell(self, now):
+        return now - self.first_seen
+
+
+class IoUTracker:
+    """
+    Lightweight IoU tracker with constant-velocity prediction. Call update()
+    on frames where the detector ran and predict() on the frames in between;
+    both return the confirmed tracks with stable IDs.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_age=1.5, min_hits=2):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age  # seconds a track survives without a detection
+        self.min_hits = min_hits
+
+        self.tracks = []
+        self._next_id = 1
+        self.unique_visitors = 0
+
+    def predict(self):
+        for t in self.tracks:
+            t.predict()
+        return self.confirmed()
+
+    def update(self, boxes):
+        now = time.time()
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+
+        for t in self.tracks:
+            t.predict()
+
+        # Greedy matching on IoU, best pairs first
+        matched_tracks, matched_boxes = set(), set()
+        if self.tracks and len(boxes):
+            ious = iou_matrix(np.stack([t.box for t in self.tracks]), boxes)
+            for flat in np.argsort(ious, axis=None)[::-1]:
+                ti, bi = np.unravel_index(flat, ious.shape)
+                if ious[ti, bi] < self.iou_threshold:
+                    break
+                if ti in matched_tracks or bi in matched_boxes:
+                    continue
+                track = self.tracks[ti]
+                was_confirmed = track.hits >= self.min_hits
+                track.correct(boxes[bi], now)
+                if not was_confirmed and track.hits >= self.min_hits:
+                    self.unique_visitors += 1
+                matched_tracks.add(ti)
+                matched_boxes.add(bi)
+
+        # Drop tracks that haven't been seen for too long, start new ones
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_age]
+        for bi in range(len(boxes)):
+            if bi not in matched_boxes:
+                self.tracks.append(Track(self._next_id, boxes[bi], now))
+                self._next_id += 1
+                if self.min_hits <= 1:
+                    self.unique_visitors += 1
+
+        return self.confirmed()
+
+    def confirmed(self):
+        return [t for t in self.tracks if t.hits >= self.min_hits]
+
+    def stats(self):
+        now = time.time()
+        dwell = [t.dwell(now) for t in self.confirmed()]
+        return {
+            "active": len(dwell),
+            "unique_visitors": self.unique_visitors,
+            "avg_dwell_s": round(sum(dwell) / len(dwell), 1) if dwell else 0.0,
+            "max_dwell_s": round(max(dwell), 1) if dwell else 0.0,
+        }
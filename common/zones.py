@@ -0,0 +1,130 @@
+import threading
+
+import cv2
+import numpy as np
+
+
+class Zone:
+    def __init__(self, name, points, threshold=None):
+        self.name = str(name)
+        self.points = np.asarray(points, dtype=np.int32).reshape(-1, 2)
+        if len(self.points) < 3:
+            raise ValueError(f"Zone '{self.name}' needs at least 3 points")
+        self.threshold = threshold  # None: use the manager's default
+
+    @classmethod
+    def rectangle(cls, name, x1, y1, x2, y2, threshold=None):
+        return cls(name, [(x1, y1), (x2, y1), (x2, y2), (x1, y2)], threshold)
+
+    def to_dict(self):
+        return {"name": self.name, "points": self.points.tolist(), "threshold": self.threshold}
+
+
+class ZoneSnapshot:
+    """
+    One published set of zones plus their bitmask for one frame size.
+    Never modified after it is built: readers take one snapshot and use it
+    for the whole frame, while set() swaps in a new one.
+    """
+
+    def __init__(self, zones, shape=None):
+        self.zones = tuple(zones)
+        self.shape = None
+        self.mask = None
+        if shape is not None and self.zones:
+            self._build(shape)
+
+    def _build(self, shape):
+        h, w = shape[:2]
+        n = len(self.zones)
+        dtype = np.uint8 if n <= 8 else np.uint16 if n <= 16 else np.uint32 if n <= 32 else np.uint64
+        mask = np.zeros((h, w), dtype=dtype)
+        layer = np.zeros((h, w), dtype=np.uint8)
+        for i, zone in enumerate(self.zones):
+            layer[:] = 0
+            cv2.fillPoly(layer, [zone.points], 1)
+            mask |= layer.astype(dtype) << dtype(i)
+        self.mask = mask
+        self.shape = (h, w)
+
+
+class ZoneMap:
+    """
+    Named polygon zones rasterized into one bitmask image (bit i set where
+    zone i covers the pixel). Counting is then a single fancy-index lookup
+    of all box centroids, with no per-box Python work. The mask is rebuilt
+    only when the zones or the frame size change. Zones may overlap.
+
+    Zones and mask live in an immutable ZoneSnapshot that is replaced with a
+    single assignment, so /set_zones on the event loop never changes them
+    under a frame the inference thread is counting.
+    """
+
+    MAX_ZONES = 64
+
+    def __init__(self, zones=None):
+        self._lock = threading.Lock()
+        self._snapshot = ZoneSnapshot([])
+        self.set(zones or [])
+
+    @property
+    def zones(self):
+        return self._snapshot.zones
+
+    def snapshot(self):
+        return self._snapshot
+
+    def set(self, zones):
+        zones = [z if isinstance(z, Zone) else Zone(z["name"], z["points"], z.get("threshold"))
+                 for z in zones]
+        if len(zones) > self.MAX_ZONES:
+            raise ValueError(f"At most {self.MAX_ZONES} zones per camera")
+        if len({z.name for z in zones}) != len(zones):
+            raise ValueError("Zone names must be unique")
+        # Mask built off to the side for the current frame size, then published at once
+        snapshot = ZoneSnapshot(zones, self._snapshot.shape)
+        with self._lock:
+            self._snapshot = snapshot
+
+    def _resized(self, snapshot, shape):
+        resized = ZoneSnapshot(snapshot.zones, shape)
+        with self._lock:
+            # Only replaces the snapshot it was built from, never newer zones
+            if self._snapshot is snapshot:
+                self._snapshot = resized
+        return resized
+
+    def membership(self, points, shape, snapshot=None):
+        """
+        (Z, N) boolean matrix: entry [z, n] is True when point n lies in zone z.
+        points is an (N, 2) array of x, y pixel coordinates. Pass the snapshot
+        whose .zones the caller pairs the rows with.
+        """
+        snapshot = snapshot or self._snapshot
+        points = np.asarray(points).reshape(-1, 2)
+        if not snapshot.zones or len(points) == 0:
+            return np.zeros((len(snapshot.zones), len(points)), dtype=bool)
+        if snapshot.shape != tuple(shape[:2]):
+            snapshot = self._resized(snapshot, shape)
+
+        mask = snapshot.mask
+        h, w = snapshot.shape
+        xs = points[:, 0].astype(np.intp)
+        ys = points[:, 1].astype(np.intp)
+        valid = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+        bits = np.where(valid, mask[np.clip(ys, 0, h - 1), np.clip(xs, 0, w - 1)], 0).astype(mask.dtype)
+        shifts = np.arange(len(snapshot.zones), dtype=mask.dtype)[:, None]
+        return ((bits[None, :] >> shifts) & 1).astype(bool)
+
+    def bounds(self):
+        """(x1, y1, x2, y2) box around every zone, or None without zones."""
+        zones = self._snapshot.zones
+        if not zones:
+            return None
+        points = np.concatenate([z.points for z in zones])
+        x1, y1 = points.min(axis=0)
+        x2, y2 = points.max(axis=0)
+        return int(x1), int(y1), int(x2) + 1, int(y2) + 1
+
+    def to_list(self):
+        return [z.to_dict() for z in self._snapshot.zones]
@@ -0,0 +1,66 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+
+# The repo root (shared common/ package)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.clip_recorder import ClipRecorder, FrameRingBuffer, NullRecorder, RemuxRecorder  # noqa: E402
+
+
+def _frame(value):
+    return np.full((48, 64, 3), value, dtype=np.uint8)
+
+
+def _frame_count(path):
+    cap = cv2.VideoCapture(path)
+    count = 0
+    while cap.read()[0]:
+        count += 1
+    cap.release()
+    return count
+
+
+def test_ring_buffer_keeps_the_newest_frames():
+    ring = FrameRingBuffer(seconds=1, fps=3, jpeg_quality=None)
+    for value in range(5):
+        ring.push(_frame(value))
+    assert [int(f[0, 0, 0]) for f in ring.drain()] == [2, 3, 4]
+    assert list(ring.drain()) == []
+
+
+def test_clip_starts_with_the_preroll(tmp_path):
+    recorder = ClipRecorder(str(tmp_path), fps=10, preroll_seconds=0.5, codec="mjpg")
+    for value in range(8):
+        recorder.add_frame(_frame(value))
+    path = recorder.start("event")
+    for value in range(3):
+        recorder.add_frame(_frame(100 + value))
+    recorder.stop()
+    recorder.close()
+
+    assert path == os.path.join(str(tmp_path), "event.avi")
+    assert _frame_count(path) == 5 + 3
+    assert recorder.stats()["clips"] == 1
+    assert not recorder.stats()["recording"]
+
+
+def test_null_recorder_writes_nothing(tmp_path):
+    recorder = NullRecorder()
+    recorder.add_frame(_frame(0))
+    assert recorder.start("event") is None
+    recorder.stop()
+    assert not recorder.is_recording
+
+
+def test_remux_start_without_input_is_skipped(tmp_path):
+    recorder = RemuxRecorder(str(tmp_path / "missing.mp4"), str(tmp_path))
+    try:
+        assert recorder.start("event") is None
+        assert not recorder.is_recording
+        assert recorder.stats()["clips"] == 0
+        assert os.listdir(str(tmp_path)) == []
+    finally:
+        recorder.close()
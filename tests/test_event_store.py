@@ -0,0 +1,60 @@
+import os
+import sys
+import time
+
+# The repo root (shared common/ package)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.event_store import EventStore  # noqa: E402
+
+
+def _clip(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b"\0" * size)
+    return str(path)
+
+
+def test_keyset_cursor_pages_newest_first(tmp_path):
+    store = EventStore(str(tmp_path / "events.db"))
+    for ts in (100.0, 101.0, 101.0, 102.0, 103.0):
+        store.record("cam1", "crowd", ts=ts)
+    store.record("cam2", "crowd", ts=104.0)
+    store.close()
+
+    pages, cursor = [], None
+    while True:
+        page = store.query(camera_id="cam1", limit=2, cursor=cursor)
+        pages.append([(e["ts"], e["id"]) for e in page["events"]])
+        cursor = page["next"]
+        if cursor is None:
+            break
+
+    # Events with the same timestamp are ordered by id and never repeated or skipped
+    assert pages == [[(103.0, 5), (102.0, 4)], [(101.0, 3), (101.0, 2)], [(100.0, 1)]]
+    assert store.query(since=102.0, until=104.0)["events"][0]["id"] == 5
+
+
+def test_quota_evicts_oldest_events_and_their_files(tmp_path):
+    store = EventStore(str(tmp_path / "events.db"), max_bytes=250)
+    clips = [_clip(tmp_path, f"clip{i}.avi", 100) for i in range(4)]
+    for i, path in enumerate(clips):
+        store.record("cam1", "motion", ts=100.0 + i, path=path)
+    store.close()
+
+    events = store.query()["events"]
+    assert [e["path"] for e in events] == clips[:1:-1]
+    assert [os.path.exists(p) for p in clips] == [False, False, True, True]
+    assert store.total_bytes == 200
+    assert store.stats()["evicted"] == 2
+
+
+def test_age_retention_removes_old_events(tmp_path):
+    store = EventStore(str(tmp_path / "events.db"), max_age_days=1)
+    old = _clip(tmp_path, "old.avi", 10)
+    store.record("cam1", "motion", ts=time.time() - 2 * 86400, path=old)
+    store.record("cam1", "motion", ts=time.time())
+    store.close()
+
+    store.enforce_retention()
+    assert len(store.query()["events"]) == 1
+    assert not os.path.exists(old)
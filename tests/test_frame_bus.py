@@ -0,0 +1,86 @@
+import os
+import sys
+
+import numpy as np
+
+# The repo root (shared common/ package)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import frame_bus  # noqa: E402
+from common.frame_bus import FrameBus  # noqa: E402
+
+
+def _frame(value, shape=(6, 8, 3)):
+    return np.full(shape, value, dtype=np.uint8)
+
+
+def test_slots_are_reused_once_published():
+    bus = FrameBus(workers=2)
+    try:
+        tickets = [bus.put(_frame(i)) for i in range(3)]
+        assert all(t is not None for t in tickets)
+        # Every slot is in flight: the next frame has to go without the bus
+        assert bus.put(_frame(9)) is None
+        assert bus.stats()["full"] == 1
+
+        frame = bus.publish(tickets[0])
+        assert bus.stats()["free"] == 1
+        reused = bus.put(_frame(7))
+        assert reused[1] == tickets[0][1]
+        bus.release(tickets[1])
+        assert bus.stats()["free"] == 1
+        assert frame[0, 0, 0] == 0
+    finally:
+        bus.close()
+
+
+def test_published_frame_survives_slot_rewrite():
+    bus = FrameBus(workers=1)
+    try:
+        ticket = bus.put(_frame(1))
+        # The worker writes the annotated frame back into the slot
+        spec, slot, seq = ticket
+        frame_bus.attach(spec).write(slot, _frame(5), seq)
+        published = bus.publish(ticket)
+
+        # Later frames land in the same slot while viewers still encode the published one
+        for value in range(10, 20):
+            bus.publish(bus.put(_frame(value)))
+        assert bus.ring.view(slot)[0, 0, 0] != 5
+        assert np.array_equal(published, _frame(5))
+    finally:
+        bus.close()
+
+
+def test_stale_ticket_is_rejected():
+    bus = FrameBus(workers=1)
+    try:
+        ticket = bus.put(_frame(1))
+        spec, slot, seq = ticket
+        bus.ring.write(slot, _frame(2), seq + 100)
+        try:
+            bus.publish(ticket)
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("stale slot published")
+        # The slot is given back either way
+        assert bus.stats()["free"] == bus.stats()["slots"]
+    finally:
+        bus.close()
+
+
+def test_larger_frames_get_a_new_ring():
+    bus = FrameBus(workers=1)
+    try:
+        small = bus.put(_frame(1))
+        old_ring = bus.ring
+        large = bus.put(_frame(2, (12, 16, 3)))
+        assert bus.ring is not old_ring
+        assert small[0][0] != large[0][0]
+        # The old ring stays readable until its last slot is published
+        assert bus.publish(small)[0, 0, 0] == 1
+        assert old_ring.name not in bus._retired
+        assert bus.publish(large).shape == (12, 16, 3)
+    finally:
+        bus.close()
@@ -0,0 +1,83 @@
+import os
+import sys
+import threading
+
+import numpy as np
+
+# The repo root (shared common/ package)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.inference_scheduler import BatchScheduler  # noqa: E402
+
+
+class _Model:
+    names = {0: "person"}
+
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, frames, **kwargs):
+        if kwargs.get("conf") == -1:
+            raise ValueError("bad conf")
+        self.batches.append((len(frames), kwargs))
+        # Each frame's "result" is its own marker value, so callers can check they got theirs
+        return [int(f[0, 0]) for f in frames]
+
+
+def _frame(value):
+    return np.full((4, 4), value, dtype=np.uint8)
+
+
+def _call_from_threads(scheduler, calls):
+    results = [None] * len(calls)
+
+    def run(i, frame, kwargs):
+        results[i] = scheduler(frame, **kwargs)
+
+    threads = [threading.Thread(target=run, args=(i, frame, kwargs)) for i, (frame, kwargs) in enumerate(calls)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+    return results
+
+
+def test_frames_from_several_cameras_share_one_batch():
+    model = _Model()
+    scheduler = BatchScheduler(model, max_batch=4, max_wait_ms=2000)
+    results = _call_from_threads(scheduler, [(_frame(i), {"conf": 0.5}) for i in range(4)])
+
+    assert results == [[0], [1], [2], [3]]
+    assert model.batches == [(4, {"conf": 0.5})]
+    assert scheduler.stats()["avg_batch_size"] == 4
+
+
+def test_list_of_frames_is_one_request_per_frame():
+    model = _Model()
+    scheduler = BatchScheduler(model, max_batch=8, max_wait_ms=0)
+    assert scheduler([_frame(1), _frame(2), _frame(3)], stream=True) == [1, 2, 3]
+    assert model.batches == [(3, {})]
+
+
+def test_different_options_run_separately_and_errors_reach_their_caller():
+    model = _Model()
+    scheduler = BatchScheduler(model, max_batch=3, max_wait_ms=2000)
+    results = [None] * 3
+
+    def run(i, value, kwargs):
+        try:
+            results[i] = scheduler(_frame(value), **kwargs)
+        except ValueError as e:
+            results[i] = str(e)
+
+    threads = [threading.Thread(target=run, args=args) for args in
+               [(0, 7, {"classes": [0]}), (1, 8, {"classes": [0]}), (2, 9, {"conf": -1})]]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+
+    assert results == [[7], [8], "bad conf"]
+    assert model.batches == [(2, {"classes": [0]})]
+    # The scheduler thread survived the failure
+    assert scheduler(_frame(5)) == [5]
@@ -0,0 +1,41 @@
+import os
+import sys
+
+# The repo root (shared common/ package)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common import metrics  # noqa: E402
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram(buckets=(0.01, 0.1))
+    for seconds in (0.005, 0.01, 0.05, 3.0):
+        histogram.observe(seconds)
+    counts, total, count = histogram.snapshot()
+    assert counts == [2, 1, 1]
+    assert count == 4
+    assert abs(total - 3.065) < 1e-9
+
+
+def test_render_exports_stage_latency():
+    try:
+        metrics.observe('lobby "A"', "predict", 0.02)
+        metrics.observe('lobby "A"', "predict", 0.2)
+        text = metrics.render_metrics([])
+    finally:
+        metrics.forget_camera('lobby "A"')
+
+    labels = 'camera="lobby \\"A\\"",stage="predict"'
+    assert "# TYPE stage_latency_seconds histogram" in text
+    assert f'stage_latency_seconds_bucket{{{labels},le="0.01"}} 0' in text
+    assert f'stage_latency_seconds_bucket{{{labels},le="0.025"}} 1' in text
+    assert f'stage_latency_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f"stage_latency_seconds_count{{{labels}}} 2" in text
+    assert 'lobby \\"A\\"' not in metrics.render_metrics([])
+
+
+def test_gauges_have_one_header_per_family():
+    text = metrics.render_metrics([], pcs={"a", "b"})
+    assert text.startswith("# HELP webrtc_peers Active WebRTC peer connections.\n"
+                           "# TYPE webrtc_peers gauge\nwebrtc_peers 2\n")
+    assert text.endswith("\n")
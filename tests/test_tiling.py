@@ -0,0 +1,78 @@
+import os
+import sys
+
+import numpy as np
+
+# The repo root (shared common/ package)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.onnx_engine import Results  # noqa: E402
+from common.tiling import TiledDetector, merge_detections, tile_grid  # noqa: E402
+
+
+class _BlobModel:
+    """Detects the bright pixels of each crop as one person; confidence grows with the visible width."""
+
+    names = {0: "person"}
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, crops, verbose=False, **kwargs):
+        self.calls.append(len(crops))
+        results = []
+        for crop in crops:
+            ys, xs = np.nonzero(crop[..., 0])
+            data = np.zeros((0, 6), dtype=np.float32)
+            if len(xs):
+                x1, y1, x2, y2 = xs.min(), ys.min(), xs.max() + 1, ys.max() + 1
+                data = np.array([[x1, y1, x2, y2, min(1.0, (x2 - x1) / 100), 0]], dtype=np.float32)
+            results.append(Results(crop.shape[:2], self.names, data))
+        return results
+
+
+def test_tile_grid_covers_the_region_with_overlap():
+    tiles = tile_grid((0, 0, 400, 200), 200, 0.25)
+    assert tiles == [(0, 0, 200, 200), (100, 0, 300, 200), (200, 0, 400, 200)]
+    assert tile_grid((10, 20, 110, 120), 200, 0.25) == [(10, 20, 110, 120)]
+
+
+def test_merge_keeps_the_whole_box_over_cut_parts():
+    detections = np.array([
+        [180, 50, 200, 150, 0.2, 0],  # cut by a tile edge
+        [180, 50, 260, 150, 0.8, 0],  # whole
+        [200, 50, 260, 150, 0.6, 0],  # cut by the next tile's edge
+        [190, 60, 250, 140, 0.7, 1],  # other class, same place
+        [10, 10, 40, 40, 0.5, 0],  # somewhere else
+    ], dtype=np.float32)
+    merged = merge_detections(detections)
+    assert merged.tolist() == detections[[1, 3, 4]].tolist()
+
+
+def test_person_across_tiles_is_detected_once():
+    frame = np.zeros((200, 400, 3), dtype=np.uint8)
+    frame[50:150, 180:260] = 255
+    model = _BlobModel()
+    detector = TiledDetector(model, tile_size=200, overlap=0.25, full_frame=False)
+
+    boxes = detector(frame)[0].boxes
+    assert model.calls == [3]  # every tile in one batch
+    assert len(boxes) == 1
+    assert boxes.xyxy.cpu().numpy().tolist() == [[180, 50, 260, 150]]
+
+
+def test_unchanged_tiles_come_from_the_cache():
+    frame = np.zeros((200, 400, 3), dtype=np.uint8)
+    frame[50:150, 20:60] = 255
+    model = _BlobModel()
+    detector = TiledDetector(model, tile_size=200, overlap=0.25, full_frame=False, max_age=60)
+
+    first = detector(frame)[0].boxes.xyxy.cpu().numpy().tolist()
+    assert detector(frame)[0].boxes.xyxy.cpu().numpy().tolist() == first
+    assert model.calls == [3]
+
+    # Only the tile where something moved is run again
+    frame[50:150, 320:360] = 255
+    boxes = detector(frame)[0].boxes.xyxy.cpu().numpy().tolist()
+    assert model.calls == [3, 1]
+    assert sorted(boxes) == [[20, 50, 60, 150], [320, 50, 360, 150]]
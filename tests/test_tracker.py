@@ -0,0 +1,56 @@
+import os
+import sys
+
+import numpy as np
+
+# The repo root (shared common/ package)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.tracker import IoUTracker, iou_matrix  # noqa: E402
+
+
+def _ids(tracks):
+    return {t.id: t.box.tolist() for t in tracks}
+
+
+def test_iou_matrix():
+    a = np.array([[0, 0, 10, 10], [100, 100, 110, 110]], dtype=np.float32)
+    b = np.array([[0, 0, 10, 10], [5, 0, 15, 10]], dtype=np.float32)
+    ious = iou_matrix(a, b)
+    assert np.allclose(ious, [[1.0, 50 / 150], [0.0, 0.0]])
+    assert iou_matrix(a, np.zeros((0, 4), dtype=np.float32)).shape == (2, 0)
+
+
+def test_ids_persist_while_people_move():
+    tracker = IoUTracker(min_hits=2)
+    assert tracker.update([(10, 10, 50, 90), (200, 10, 240, 90)]) == []  # not confirmed yet
+
+    ids = None
+    for step in range(1, 6):
+        # Person A walks right, person B walks down; the detector lists them in either order
+        a = (10 + 5 * step, 10, 50 + 5 * step, 90)
+        b = (200, 10 + 5 * step, 240, 90 + 5 * step)
+        tracks = tracker.update([b, a] if step % 2 else [a, b])
+        by_x = sorted(tracks, key=lambda t: t.box[0])
+        assert len(tracks) == 2
+        if ids is None:
+            ids = [t.id for t in by_x]
+        assert [t.id for t in by_x] == ids
+        assert by_x[0].box.tolist() == list(map(float, a))
+
+    assert tracker.stats()["unique_visitors"] == 2
+
+
+def test_new_person_gets_a_new_id_and_predict_keeps_ids():
+    tracker = IoUTracker(min_hits=1)
+    first = tracker.update([(10, 10, 50, 90)])
+    tracker.update([(14, 10, 54, 90)])
+    tracks = tracker.update([(18, 10, 58, 90), (200, 10, 240, 90)])
+    assert len(tracks) == 2
+    assert tracks[0].id == first[0].id
+    assert tracks[1].id != first[0].id
+
+    # Frames between detections: boxes move on with the measured velocity, ids unchanged
+    predicted = _ids(tracker.predict())
+    assert set(predicted) == {t.id for t in tracks}
+    assert predicted[first[0].id][0] > 18
@@ -0,0 +1,64 @@
+import os
+import sys
+
+import numpy as np
+
+# The repo root (shared common/ package)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.zones import Zone, ZoneMap  # noqa: E402
+
+SHAPE = (240, 320)
+
+
+def test_membership_is_point_in_polygon():
+    zones = ZoneMap([
+        Zone.rectangle("left", 0, 0, 100, 100),
+        {"name": "triangle", "points": [[200, 0], [300, 0], [200, 100]]},
+        Zone.rectangle("overlap", 50, 50, 250, 150),
+    ])
+    points = [(10, 10), (75, 75), (210, 10), (290, 90), (400, 10), (-5, 20)]
+    inside = zones.membership(points, SHAPE)
+
+    assert inside.shape == (3, len(points))
+    assert inside[:, 0].tolist() == [True, False, False]
+    assert inside[:, 1].tolist() == [True, False, True]  # overlapping zones both count
+    assert inside[:, 2].tolist() == [False, True, False]
+    assert not inside[:, 3].any()  # inside the triangle's bounding box, outside the triangle
+    assert not inside[:, 4:].any()  # off-frame points are in no zone
+
+
+def test_snapshot_is_not_changed_by_set():
+    zones = ZoneMap([Zone.rectangle("door", 0, 0, 100, 100)])
+    zones.membership([(10, 10)], SHAPE)
+    snapshot = zones.snapshot()
+    mask = snapshot.mask.copy()
+
+    zones.set([Zone.rectangle("till", 200, 0, 300, 100), Zone.rectangle("exit", 0, 150, 50, 200)])
+
+    assert [z.name for z in snapshot.zones] == ["door"]
+    assert np.array_equal(snapshot.mask, mask)
+    assert zones.membership([(10, 10)], SHAPE, snapshot=snapshot).tolist() == [[True]]
+    assert [z.name for z in zones.zones] == ["till", "exit"]
+    assert zones.membership([(10, 10)], SHAPE).tolist() == [[False], [False]]
+
+
+def test_resizing_an_old_snapshot_keeps_newer_zones():
+    zones = ZoneMap([Zone.rectangle("door", 0, 0, 100, 100)])
+    old = zones.snapshot()
+    zones.set([Zone.rectangle("till", 200, 0, 300, 100)])
+
+    # A frame still counting with the old zones, at a new frame size
+    assert zones.membership([(10, 10)], (480, 640), snapshot=old).tolist() == [[True]]
+    assert [z.name for z in zones.zones] == ["till"]
+
+
+def test_duplicate_names_are_rejected():
+    zones = ZoneMap()
+    try:
+        zones.set([Zone.rectangle("a", 0, 0, 10, 10), Zone.rectangle("a", 20, 20, 30, 30)])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("duplicate zone names accepted")
+    assert zones.zones == ()